@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Parser and merge benchmarks, fully offline.
+
+Benchmarks:
+  parse       parse_fragrantica over the fixture corpus (.com, .ru, real pages)
+  notes       clean_note_list over every pyramid tier in the corpus
+  load        iter_scraped_records over a JSONL batch file
+  merge       CatalogIndex + merge_updates + diff + dump on scaled perfumes.json
+  reconcile   Reconciler lookups of misspelled, id-less scraped names
+  snapshot    parse_perfumes_array + re-rendering the changed records of a scaled
+              index_bag (fixtures.render_perfumes_array)
+  fetch       scrape() + parse per page against the local stand-in API
+              (standin_api.py): full pages vs the lean extract_rules profile
+
+merge/reconcile/snapshot/load run at every catalog size (the scaling curve). Each
+result has a throughput (items/s, best of --repeat runs) and a peak memory
+(tracemalloc, measured in a separate run so it does not skew the timing).
+
+Baselines live in baselines.json. --check exits with status 1 when any
+throughput drops, or peak memory grows, by more than --threshold.
+
+Usage:
+  bench.py [--only NAME ...] [--sizes 54,1000,10000] [--repeat 3]
+           [--save-baseline] [--check] [--threshold 0.25] [--json FILE]
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import tempfile
+import argparse
+import platform
+import tracemalloc
+from datetime import datetime, timezone
+
+import fixtures
+from fragrantica_scraper import (parse_fragrantica, parse_lean, clean_note_list, missing_fields, rung_request,
+                                 ALL_FIELDS, LADDER)
+from merge_fragrantica_data import (CatalogIndex, merge_updates, diff_catalogs, dump_catalog,
+                                    iter_scraped_records, parse_perfumes_array)
+from reconcile import Reconciler
+
+BASELINE_FILE = os.path.join(fixtures.HERE, 'baselines.json')
+DEFAULT_SIZES = (54, 500, 1000, 5000, 10000)
+DEFAULT_THRESHOLD = 0.25
+# Share of catalog entries that receive a scraped update in merge runs
+UPDATE_SHARE = 0.2
+
+
+def measure(fn, repeat):
+    """Best wall time over repeat runs, and peak traced memory of one more run."""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def result(name, items, unit, seconds, peak, **extra):
+    return {'name': name, 'items': items, 'unit': unit, 'seconds': round(seconds, 6),
+            'throughput': round(items / seconds, 1) if seconds else None,
+            'peak_mb': round(peak / 1e6, 2), **extra}
+
+
+def scraped_updates(catalog, share=UPDATE_SHARE):
+    """Scraper-shaped records for every 1/share-th catalog entry."""
+    step = max(1, round(1 / share))
+    updates = []
+    for i in range(0, len(catalog), step):
+        record = catalog[i]
+        pyramid = record.get('pyramid') or {}
+        updates.append({
+            'url': f"https://www.fragrantica.com/perfume/x/y-{100000 + i}.html",
+            'brand': record['brand'], 'name': record['name'],
+            'pyramid': {t: [n.strip() for n in (pyramid.get(t) or '').split(',') if n.strip()]
+                        for t in ('top', 'mid', 'base')},
+            'accords': record.get('accords') or [],
+            'rating': round((record.get('rating') or 4.0) + 0.01, 2),
+            'votes': (record.get('votes') or 0) + 7,
+            'fragrantica_id': 100000 + i,
+        })
+    return updates
+
+
+def bench_parse(pages, repeat):
+    results = []
+    by_variant = {}
+    for variant, _, html in pages:
+        by_variant.setdefault(variant, []).append(html)
+    for variant, htmls in sorted(by_variant.items()):
+        megabytes = sum(len(h.encode('utf-8')) for h in htmls) / 1e6
+        parsed = []
+
+        def run():
+            parsed[:] = [parse_fragrantica(h) for h in htmls]
+
+        seconds, peak = measure(run, repeat)
+        coverage = {field: round(sum(1 for d in parsed if d.get(field)) / len(parsed), 3)
+                    for field in ALL_FIELDS}
+        complete = sum(1 for d in parsed if not missing_fields(d)) / len(parsed)
+        results.append(result(f"parse[{variant}]", len(htmls), 'pages', seconds, peak,
+                              mb_per_s=round(megabytes / seconds, 1), complete=round(complete, 3),
+                              coverage=coverage))
+    return results
+
+
+def bench_notes(pages, repeat):
+    tiers = []
+    for _, _, html in pages:
+        for notes in parse_fragrantica(html, fields=('pyramid',))['pyramid'].values():
+            tiers.append(', '.join(notes))
+    # Re-join with the separators the splitter has to handle
+    tiers = [t.replace(', ', ' and ', 1) for t in tiers] * 20
+
+    def run():
+        for text in tiers:
+            clean_note_list(text)
+
+    seconds, peak = measure(run, repeat)
+    return [result('notes', len(tiers), 'calls', seconds, peak)]
+
+
+def bench_load(sizes, repeat):
+    results = []
+    for size in sizes:
+        updates = scraped_updates(fixtures.scaled_catalog(size), share=1.0)
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as f:
+            for record in updates:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            path = f.name
+        try:
+            seconds, peak = measure(lambda: sum(1 for _ in iter_scraped_records(path)), repeat)
+        finally:
+            os.remove(path)
+        results.append(result(f"load[{size}]", len(updates), 'records', seconds, peak, size=size))
+    return results
+
+
+def bench_merge(sizes, repeat):
+    results = []
+    for size in sizes:
+        catalog = fixtures.scaled_catalog(size)
+        text = dump_catalog(catalog)
+        updates = scraped_updates(catalog)
+
+        def run():
+            original = json.loads(text)
+            records = json.loads(text)
+            index = CatalogIndex(records)
+            merge_updates(index, updates)
+            changes = diff_catalogs(original, records)
+            dump_catalog(records)
+            return changes
+
+        seconds, peak = measure(run, repeat)
+        results.append(result(f"merge[{size}]", size, 'records', seconds, peak,
+                              size=size, updates=len(updates)))
+    return results
+
+
+def misspelled(name):
+    """Drop one letter from the first word long enough to survive it."""
+    words = name.split(' ')
+    for k, word in enumerate(words):
+        if len(word) > 4:
+            words[k] = word[:2] + word[3:]
+            break
+    return ' '.join(words)
+
+
+def bench_reconcile(sizes, repeat):
+    results = []
+    for size in sizes:
+        catalog = fixtures.scaled_catalog(size)
+        queries = [(i, record['brand'].upper(), misspelled(record['name']))
+                   for i, record in enumerate(catalog) if i % round(1 / UPDATE_SHARE) == 0]
+        found = []
+
+        def run():
+            reconciler = Reconciler()
+            for i, record in enumerate(catalog):
+                reconciler.add(i, record['brand'], record['name'], record.get('fragrantica_id'))
+            found[:] = [(i, reconciler.match(brand, name)) for i, brand, name in queries]
+
+        seconds, peak = measure(run, repeat)
+        correct = sum(1 for i, m in found if m and m.index == i) / len(found)
+        wrong = sum(1 for i, m in found if m and m.index != i) / len(found)
+        results.append(result(f"reconcile[{size}]", len(queries), 'lookups', seconds, peak, size=size,
+                              correct=round(correct, 3), wrong=round(wrong, 3)))
+    return results
+
+
+def bench_snapshot(sizes, repeat):
+    results = []
+    for size in sizes:
+        html = fixtures.scaled_snapshot(size)
+
+        def run():
+            records, spans, start, end = parse_perfumes_array(html)
+            changed = set(range(0, len(records), round(1 / UPDATE_SHARE)))
+            for i in changed:
+                records[i]['rating'] = 4.2
+            return fixtures.render_perfumes_array(html, records, spans, start, end, changed)
+
+        seconds, peak = measure(run, repeat)
+        results.append(result(f"snapshot[{size}]", size, 'records', seconds, peak, size=size))
+    return results
+
+
+def bench_fetch(pages, repeat):
+    """Transfer size and client time per page, full HTML vs LEAN_PROFILE, over the stand-in API."""
+    import scrape
+    import page_archive
+    import standin_api
+
+    server = standin_api.start(pages=pages)
+    saved = scrape.API_URL, page_archive.ENABLED
+    os.environ.setdefault('SCRAPINGBEE_API_KEY', 'bench')
+    scrape.set_api_url(standin_api.api_url(server))
+    page_archive.ENABLED = False
+    urls = server.standin.urls()
+    results = []
+    try:
+        for mode, lean in (('full', False), ('lean', True)):
+            request = rung_request(LADDER[1], lean)
+            request['wait_ms'] = 0
+            parsed = []
+            sizes = []
+
+            def run():
+                parsed.clear()
+                sizes.clear()
+                for url in urls:
+                    body = scrape.scrape(url, use_cache=False, **request)
+                    sizes.append(len(body.encode('utf-8')))
+                    parsed.append(parse_lean(url, body) if lean else parse_fragrantica(body))
+
+            seconds, peak = measure(run, repeat)
+            complete = sum(1 for d in parsed if not missing_fields(d)) / len(parsed)
+            results.append(result(f"fetch[{mode}]", len(urls), 'pages', seconds, peak,
+                                  kb_per_page=round(sum(sizes) / len(sizes) / 1e3, 1),
+                                  complete=round(complete, 3)))
+    finally:
+        scrape.set_api_url(saved[0])
+        page_archive.ENABLED = saved[1]
+        server.shutdown()
+    return results
+
+
+BENCHMARKS = ('parse', 'notes', 'load', 'merge', 'reconcile', 'snapshot', 'fetch')
+
+
+def run_all(only, sizes, repeat):
+    results = []
+    pages = fixtures.load_pages() if {'parse', 'notes', 'fetch'} & set(only) else []
+    for name in only:
+        print(f"⏱  {name}...", file=sys.stderr)
+        if name == 'parse':
+            results += bench_parse(pages, repeat)
+        elif name == 'notes':
+            results += bench_notes(pages, repeat)
+        elif name == 'load':
+            results += bench_load(sizes, repeat)
+        elif name == 'merge':
+            results += bench_merge(sizes, repeat)
+        elif name == 'reconcile':
+            results += bench_reconcile(sizes, repeat)
+        elif name == 'snapshot':
+            results += bench_snapshot(sizes, repeat)
+        elif name == 'fetch':
+            results += bench_fetch(pages, repeat)
+    return results
+
+
+def print_table(results, baseline=None):
+    baseline = baseline or {}
+    print(f"{'benchmark':<18} {'items':>7} {'seconds':>9} {'throughput':>16} {'peak MB':>9}  vs baseline")
+    for r in results:
+        base = baseline.get(r['name'])
+        delta = ''
+        if base and base.get('throughput'):
+            delta = f"{(r['throughput'] / base['throughput'] - 1) * 100:+.1f}%"
+        print(f"{r['name']:<18} {r['items']:>7} {r['seconds']:>9.4f} "
+              f"{r['throughput']:>10,.0f} {r['unit'] + '/s':<6}{r['peak_mb']:>8.2f}  {delta}")
+
+
+def regressions(results, baseline, threshold):
+    """Benchmarks slower, or hungrier, than the baseline by more than threshold."""
+    found = []
+    for r in results:
+        base = baseline.get(r['name'])
+        if not base:
+            continue
+        if base.get('throughput') and r['throughput'] < base['throughput'] * (1 - threshold):
+            found.append(f"{r['name']}: throughput {r['throughput']:,.0f} < baseline {base['throughput']:,.0f}")
+        # Ignore sub-megabyte noise in peak memory
+        if base.get('peak_mb') is not None and r['peak_mb'] > max(base['peak_mb'] * (1 + threshold),
+                                                                  base['peak_mb'] + 1):
+            found.append(f"{r['name']}: peak {r['peak_mb']} MB > baseline {base['peak_mb']} MB")
+    return found
+
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    data = load_baseline(path)
+    data['_meta'] = {'saved_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                     'python': platform.python_version(), 'machine': platform.machine()}
+    for r in results:
+        data[r['name']] = {'throughput': r['throughput'], 'peak_mb': r['peak_mb']}
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline parser/merge benchmarks.')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='catalog sizes for the scaling runs (comma-separated)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save-baseline', action='store_true', help=f'store results in {BASELINE_FILE}')
+    parser.add_argument('--check', action='store_true', help='exit 1 on regressions past the threshold')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--json', help='also write the full results to this file')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    results = run_all(args.only, sizes, args.repeat)
+    baseline = load_baseline()
+    print_table(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'results': results, 'sizes': sizes, 'repeat': args.repeat}, f,
+                      ensure_ascii=False, indent=1)
+    if args.save_baseline:
+        save_baseline(results)
+        print(f"💾 Baseline saved to {BASELINE_FILE}", file=sys.stderr)
+    if args.check:
+        if not baseline:
+            print("ERROR: no baseline to check against (run with --save-baseline first)", file=sys.stderr)
+            sys.exit(1)
+        found = regressions(results, baseline, args.threshold)
+        for line in found:
+            print(f"❌ {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+        print(f"✅ No regressions past {args.threshold:.0%}", file=sys.stderr)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Offline fixture corpus for the parser/merge benchmarks.
+
+Pages: Fragrantica-shaped HTML in both the .com (English labels) and .ru
+(Russian labels) variants, built deterministically from the catalog in
+perfumes.json — meta-description pyramid on most pages, pyramid-note-label
+markup only on the rest (the fallback path), accord bars, rating microdata,
+and enough surrounding markup/script to match real page sizes. Real pages
+can be added with `import-cache` (copies pages from the ScrapingBee response
+cache) or by dropping *.html / *.html.gz files into fixtures/pages/.
+
+Catalogs: perfumes.json and the perfumes array of an index_bag_*.html
+snapshot, scaled to any size by cloning records under new names.
+
+Usage:
+  fixtures.py build [--pages N]
+  fixtures.py import-cache [--limit N]
+  fixtures.py list
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import random
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKSPACE = os.path.dirname(HERE)
+sys.path.insert(0, WORKSPACE)
+sys.path.insert(0, os.path.join(WORKSPACE, 'skills', 'scrapingbee'))
+
+from merge_fragrantica_data import parse_perfumes_array
+
+FIXTURES_DIR = os.path.join(HERE, 'fixtures')
+GENERATED_DIR = os.path.join(FIXTURES_DIR, 'generated')
+PAGES_DIR = os.path.join(FIXTURES_DIR, 'pages')
+CATALOG_FILE = os.path.join(WORKSPACE, 'pages', 'perfume', 'perfumes.json')
+SNAPSHOT_GLOB_DIR = os.path.join(WORKSPACE, 'pages', 'perfume')
+
+SEED = 20260214
+# Real product pages are 250–450 KB, most of it markup and inline script
+PAGE_BYTES = (250_000, 450_000)
+# One page in FALLBACK_EVERY has no meta-description pyramid
+FALLBACK_EVERY = 4
+
+VARIANTS = {
+    'com': {
+        'host': 'www.fragrantica.com', 'lang': 'en',
+        'top': 'Top notes are', 'mid': 'middle notes are', 'base': 'base notes are',
+        'labels': ('Top Notes', 'Middle Notes', 'Base Notes'),
+        'gender': {'Ж': 'for women', 'М': 'for men', 'Унисекс': 'for women and men'},
+        'launched': 'was launched in', 'perfumer': 'Perfumer',
+        'and': ' and ',
+    },
+    'ru': {
+        'host': 'www.fragrantica.ru', 'lang': 'ru',
+        'top': 'Верхние ноты:', 'mid': 'средние ноты:', 'base': 'базовые ноты:',
+        'labels': ('Верхние ноты', 'Средние ноты', 'Базовые ноты'),
+        'gender': {'Ж': 'для женщин', 'М': 'для мужчин', 'Унисекс': 'для женщин и мужчин'},
+        'launched': 'выпущен в', 'perfumer': 'Парфюмер',
+        'and': ' и ',
+    },
+}
+JS_IDENT = re.compile(r'[A-Za-z_$][\w$]*')
+CONCENTRATIONS = {'EDP': 'Eau de Parfum', 'EDT': 'Eau de Toilette', 'Extrait': 'Extrait de Parfum'}
+
+
+def load_catalog(path=CATALOG_FILE):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def snapshot_files(directory=SNAPSHOT_GLOB_DIR):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith('index_bag_') and name.endswith('.html'))
+
+
+def scale_records(records, size):
+    """Clone records (renamed '<name> #k') until there are size of them."""
+    out = []
+    k = 0
+    while len(out) < size:
+        for record in records:
+            if len(out) == size:
+                break
+            clone = json.loads(json.dumps(record, ensure_ascii=False)) if k else record
+            if k:
+                clone['name'] = f"{record['name']} #{k}"
+                clone.pop('fragrantica_id', None)
+            out.append(clone)
+        k += 1
+    return out
+
+
+def scaled_catalog(size, path=CATALOG_FILE):
+    return scale_records(load_catalog(path), size)
+
+
+def to_js_literal(value, top_level=False):
+    """Serialize a value in the snapshots' literal style: { key:"value", ... }."""
+    if isinstance(value, dict):
+        parts = []
+        for key, item in value.items():
+            key_str = key if JS_IDENT.fullmatch(key) else json.dumps(key, ensure_ascii=False)
+            parts.append(f'{key_str}:{to_js_literal(item)}')
+        return '{ ' + ', '.join(parts) + ' }' if top_level else '{' + ','.join(parts) + '}'
+    if isinstance(value, list):
+        return '[' + ','.join(to_js_literal(item) for item in value) + ']'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if value is None:
+        return 'null'
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    return json.dumps(value)
+
+
+def render_perfumes_array(html, records, spans, array_start, array_end, changed):
+    """Rebuild a snapshot page once, re-serializing only the changed records."""
+    objects = [to_js_literal(record, top_level=True) if i in changed else html[start:end]
+               for i, (record, (start, end)) in enumerate(zip(records, spans))]
+    return html[:array_start] + '\n  ' + ',\n\n  '.join(objects) + '\n' + html[array_end:]
+
+
+def scaled_snapshot(size, path=None):
+    """An index_bag-style page whose perfumes array holds size records."""
+    path = path or snapshot_files()[-1]
+    with open(path, encoding='utf-8') as f:
+        html = f.read()
+    records, _, array_start, array_end = parse_perfumes_array(html)
+    objects = [to_js_literal(r, top_level=True) for r in scale_records(records, size)]
+    return html[:array_start] + '\n  ' + ',\n\n  '.join(objects) + '\n' + html[array_end:]
+
+
+def _notes(value, variant):
+    if isinstance(value, list):
+        value = ', '.join(value)
+    parts = [p.strip() for p in (value or '').replace('are ', '', 1).split(',') if p.strip()]
+    if len(parts) > 1:
+        return ', '.join(parts[:-1]) + variant['and'] + parts[-1]
+    return ''.join(parts)
+
+
+def _filler(rng, size):
+    """Markup and script noise shaped like the rest of a product page."""
+    words = ('perfume', 'fragrance', 'review', 'community', 'notes', 'longevity', 'sillage',
+             'аромат', 'отзыв', 'ноты', 'стойкость', 'шлейф', 'similar', 'reminds', 'me', 'of')
+    chunks = []
+    total = 0
+    while total < size:
+        kind = rng.random()
+        if kind < 0.5:
+            text = ' '.join(rng.choice(words) for _ in range(rng.randint(20, 80)))
+            chunk = (f'<div class="cell small-12 review-box"><div class="flex-container">'
+                     f'<span class="vote-button-legend">{rng.randint(0, 999)}</span></div>'
+                     f'<p itemprop="reviewBody">{text}</p></div>\n')
+        elif kind < 0.8:
+            chunk = (f'<a href="/perfume/Brand/Perfume-{rng.randint(1000, 99999)}.html">'
+                     f'<img src="https://fimgs.net/mdimg/perfume/s.{rng.randint(1000, 99999)}.jpg" '
+                     f'alt="" width="50" height="50"></a>\n')
+        else:
+            payload = ','.join(str(rng.randint(0, 10 ** 6)) for _ in range(rng.randint(50, 200)))
+            chunk = f'<script>window.__data_{rng.randint(0, 9999)}=[{payload}];</script>\n'
+        chunks.append(chunk)
+        total += len(chunk.encode('utf-8'))
+    return ''.join(chunks)
+
+
+def render_page(record, variant_name, fid, rng, fallback=False):
+    """One Fragrantica-shaped product page for a catalog record."""
+    v = VARIANTS[variant_name]
+    pyramid = record.get('pyramid') or {}
+    top, mid, base = (_notes(pyramid.get(t), v) for t in ('top', 'mid', 'base'))
+    slug = f"{record['brand']}/{record['name']}".replace(' ', '-')
+    gender = v['gender'].get(record.get('gender'), v['gender']['Унисекс'])
+    description = f"{record['name']} by {record['brand']} is a fragrance {gender}."
+    if not fallback and top:
+        description += f" {v['top']} {top}; {v['mid']} {mid}; {v['base']} {base}."
+    head = (f'<!DOCTYPE html>\n<html lang="{v["lang"]}">\n<head>\n<meta charset="utf-8">\n'
+            f'<title>{record["name"]} {record["brand"]} {gender}</title>\n'
+            f'<meta name="description" content="{description}">\n'
+            f'<link rel="canonical" href="https://{v["host"]}/perfume/{slug}-{fid}.html">\n'
+            f'<script type="application/ld+json">{{"@type":"Product","name":"{record["name"]}"}}</script>\n'
+            f'</head>\n')
+    body = [f'<body>\n<div id="main-content">{_filler(rng, rng.randint(*PAGE_BYTES) // 3)}']
+    body.append(f'<h1 itemprop="name">{record["name"]} {record["brand"]} {gender}</h1>\n')
+    conc = CONCENTRATIONS.get(record.get('concentration'))
+    if conc:
+        body.append(f'<p class="concentration">{conc}</p>\n')
+    body.append('<div class="cell accord-box">\n')
+    for accord in record.get('accords') or []:
+        color = accord['color'].lstrip('#')
+        r, g, b = (int(color[i:i + 2], 16) for i in (0, 2, 4)) if len(color) == 6 else (0, 0, 0)
+        body.append(f'<div class="accord-bar" style="color: rgb(0, 0, 0); background: rgb({r}, {g}, {b}); '
+                    f'width: {accord["w"]}%;"><span class="accord-name">{accord["name"]}</span></div>\n')
+    body.append('</div>\n')
+    if record.get('rating'):
+        body.append(f'<p class="info-note">Rating <span itemprop="ratingValue">{record["rating"]}</span> '
+                    f'out of 5 with <span itemprop="ratingCount" content="{record.get("votes") or 0}">'
+                    f'{record.get("votes") or 0}</span> votes</p>\n')
+    if record.get('year'):
+        body.append(f'<p>{record["name"]} {v["launched"]} {record["year"]}.</p>\n')
+    if record.get('perfumer'):
+        body.append(f'<div class="perfumer-box">{v["perfumer"]}: <a href="/noses/x.html">'
+                    f'<span>{record["perfumer"]}</span></a></div>\n')
+    body.append(_filler(rng, rng.randint(*PAGE_BYTES) // 3))
+    body.append('<div id="pyramid">\n')
+    for label, notes in zip(v['labels'], (top, mid, base)):
+        body.append(f'<h4><span>{label} </span></h4><div class="notes">')
+        for note in notes.replace(v['and'], ', ').split(', '):
+            if note:
+                body.append(f'<div><span class="pyramid-note-label">{note}</span></div>')
+        body.append('</div>\n')
+    body.append('</div>\n')
+    body.append(_filler(rng, rng.randint(*PAGE_BYTES) // 3))
+    body.append('</div>\n</body>\n</html>\n')
+    return head + ''.join(body)
+
+
+def build(pages_per_variant=None, directory=GENERATED_DIR):
+    """Write the generated corpus (idempotent: same seed, same bytes)."""
+    catalog = [r for r in load_catalog() if r.get('pyramid')]
+    count = pages_per_variant or len(catalog)
+    written = []
+    for variant_name in VARIANTS:
+        rng = random.Random(f"{SEED}-{variant_name}")
+        out_dir = os.path.join(directory, variant_name)
+        os.makedirs(out_dir, exist_ok=True)
+        for i in range(count):
+            record = catalog[i % len(catalog)]
+            html = render_page(record, variant_name, 10000 + i, rng, fallback=i % FALLBACK_EVERY == 0)
+            path = os.path.join(out_dir, f"{i:04d}.html.gz")
+            with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as f:
+                f.write(html)
+            written.append(path)
+    with open(os.path.join(directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump({'seed': SEED, 'pages_per_variant': count, 'files': len(written)}, f, indent=1)
+    return written
+
+
+def _page_files(directory):
+    files = []
+    for root, _, names in os.walk(directory):
+        files += [os.path.join(root, n) for n in names if n.endswith(('.html', '.html.gz'))]
+    return sorted(files)
+
+
+def read_page(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def load_pages(build_missing=True):
+    """All fixture pages as (variant, path, html); variant is 'com', 'ru' or 'real'."""
+    if build_missing and not os.path.exists(os.path.join(GENERATED_DIR, 'manifest.json')):
+        build()
+    pages = []
+    for variant_name in VARIANTS:
+        for path in _page_files(os.path.join(GENERATED_DIR, variant_name)):
+            pages.append((variant_name, path, read_page(path)))
+    for path in _page_files(PAGES_DIR):
+        pages.append(('real', path, read_page(path)))
+    return pages
+
+
+def import_cache(limit=None):
+    """Copy pages from the ScrapingBee response cache into fixtures/pages/."""
+    from response_cache import ResponseCache
+    cache = ResponseCache()
+    os.makedirs(PAGES_DIR, exist_ok=True)
+    copied = 0
+    for _, _, _, path in sorted(cache._entries()):
+        if limit is not None and copied >= limit:
+            break
+        html = read_page(path)
+        if 'fragrantica' not in html[:20000].lower():
+            continue
+        dest = os.path.join(PAGES_DIR, os.path.basename(path))
+        with gzip.open(dest, 'wt', encoding='utf-8') as f:
+            f.write(html)
+        copied += 1
+    return copied
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark fixture corpus.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('build', help='(re)generate the synthetic .com/.ru pages')
+    p.add_argument('--pages', type=int, help='pages per variant (default: one per catalog entry)')
+    p = sub.add_parser('import-cache', help='copy real Fragrantica pages from the response cache')
+    p.add_argument('--limit', type=int)
+    sub.add_parser('list', help='show the corpus')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        print(f"Wrote {len(build(args.pages))} pages to {GENERATED_DIR}")
+    elif args.command == 'import-cache':
+        print(f"Copied {import_cache(args.limit)} pages to {PAGES_DIR}")
+    elif args.command == 'list':
+        counts = {}
+        size = 0
+        for variant_name, _, html in load_pages():
+            counts[variant_name] = counts.get(variant_name, 0) + 1
+            size += len(html.encode('utf-8'))
+        print(json.dumps({'pages': counts, 'megabytes': round(size / 1e6, 1)}, indent=2))
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Load test of the scraping pipeline against the local stand-in API.
+
+Runs fetch (the Fragrantica ladder through scrape.py, with its retries
+and circuit breaker) + parse + JSONL + merge over the fixture URLs at
+each --concurrency level (the fixture pages that parse complete, --rounds
+times under distinct URLs so in-flight coalescing does not fold them), against standin_api.py with a Behaviour that
+injects latency, unrendered pages, Cloudflare challenges, 429/500
+answers and hanging requests. Nothing is cached, archived or written
+to the catalog; the ladder memory starts empty at every level.
+
+Simulated time runs --time-scale times real time (0.02: a 2 s render
+wait takes 40 ms), and the client's backoff, breaker cooldown and
+timeout are scaled with it so retries keep their proportions.
+Latencies are reported in simulated ms, throughput in real records/s.
+
+Per level: records merged and complete, throughput, request latency
+p50/p95/p99/max (one scrape() call, retries included; the last
+metrics.MAX_REQUESTS calls), answers by status, error rate (failed
+attempts / attempts), retries, circuit rejections, credits and credits
+per record.
+
+Usage:
+  loadtest.py [--concurrency 1,4,16] [--rounds 4] [--all-pages] [--lean] [--adaptive] [--no-escalate]
+              [--api-url URL] [--json FILE] [--verbose] [stand-in behaviour options]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+
+import fixtures
+import standin_api
+import scrape
+import page_archive
+import fragrantica_scraper
+from fragrantica_scraper import (LadderMemory, JsonlWriter, scrape_fragrantica_many, parse_fragrantica, make_record,
+                                 missing_fields, percentile)
+from merge_fragrantica_data import CatalogIndex, merge_updates, diff_catalogs, dump_catalog, iter_scraped_records
+from metrics import METRICS
+
+DEFAULT_CONCURRENCY = '1,4,16'
+DEFAULT_ROUNDS = 4
+# A plausible day for the real API, 50x faster
+BEHAVIOUR_DEFAULTS = dict(latency_ms=800, js_latency_ms=2000, premium_latency_ms=3000, render_ms=1500,
+                          challenge_rate=0.7, rate_429=0.03, rate_500=0.02, rate_timeout=0.01,
+                          time_scale=0.02, seed=1)
+
+
+def counter_total(snapshot, name):
+    return sum(c['value'] for c in snapshot['counters'] if c['name'] == name)
+
+
+def complete_pages(standin):
+    """Fixture URLs whose full page parses with every required field; the rest would always
+    escalate to premium and turn the test into one of the fixtures."""
+    return [url for url in standin.urls() if not missing_fields(parse_fragrantica(standin.page(url)))]
+
+
+def run_level(urls, concurrency, catalog_text, time_scale, options, workdir):
+    """One pipeline run at one concurrency. Returns its report."""
+    METRICS.reset()
+    scrape.BREAKER = scrape.CircuitBreaker(cooldown=scrape.BREAKER_COOLDOWN * time_scale)
+    fragrantica_scraper._memory = LadderMemory(os.path.join(workdir, f"ladder-{concurrency}.json"))
+    out_path = os.path.join(workdir, f"batch-{concurrency}.jsonl")
+
+    started = time.perf_counter()
+    failed = complete = 0
+    with open(out_path, 'w', encoding='utf-8') as f:
+        out = JsonlWriter(f)
+        for url, data in scrape_fragrantica_many(urls, concurrency=concurrency, per_host=concurrency,
+                                                 use_cache=False, **options):
+            if data is None:
+                failed += 1
+                continue
+            complete += not missing_fields(data)
+            out.write(make_record(url, data))
+    fetched = time.perf_counter()
+    records = json.loads(catalog_text)
+    result = merge_updates(CatalogIndex(records), iter_scraped_records(out_path))
+    changes = diff_catalogs(json.loads(catalog_text), records)
+    dump_catalog(records)
+    finished = time.perf_counter()
+
+    snap = METRICS.snapshot()
+    statuses = {}
+    for c in snap['counters']:
+        if c['name'] == 'scrapingbee_requests_total':
+            statuses[str(c['labels']['status'])] = statuses.get(str(c['labels']['status']), 0) + c['value']
+    retries = counter_total(snap, 'scrapingbee_retries_total')
+    calls = sum(statuses.values())
+    failed_calls = calls - statuses.get('200', 0)
+    latencies = [r['seconds'] * 1000 / time_scale for r in snap['requests']]
+    credits = counter_total(snap, 'scrapingbee_credits_total')
+    merged = result['processed']
+    return {
+        'concurrency': concurrency, 'urls': len(urls), 'records': merged, 'failed': failed,
+        'complete': round(complete / merged, 3) if merged else None,
+        'matched': len(result['matched']), 'changed': len(changes),
+        'seconds': round(finished - started, 3), 'fetch_seconds': round(fetched - started, 3),
+        'merge_seconds': round(finished - fetched, 3),
+        'records_per_s': round(merged / (finished - started), 1) if merged else 0.0,
+        'latency_ms': {q: round(percentile(latencies, v)) for q, v in
+                       (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))} if latencies else {},
+        'calls': calls, 'statuses': statuses, 'retries': retries,
+        'error_rate': round((failed_calls + retries) / (calls + retries), 4) if calls else None,
+        'circuit_rejected': counter_total(snap, 'scrapingbee_circuit_rejected_total'),
+        'credits': credits, 'credits_per_record': round(credits / merged, 2) if merged else None,
+    }
+
+
+def print_report(reports):
+    print(f"{'conc':>4} {'records':>8} {'compl':>6} {'rec/s':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+          f"{'max ms':>7} {'err %':>6} {'retries':>7} {'credits':>8} {'cr/rec':>6}")
+    for r in reports:
+        lat = r['latency_ms']
+        print(f"{r['concurrency']:>4} {r['records']:>4}/{r['urls']:<3} {r['complete'] or 0:>6.1%} "
+              f"{r['records_per_s']:>7.1f} {lat.get('p50', 0):>7} {lat.get('p95', 0):>7} {lat.get('p99', 0):>7} "
+              f"{lat.get('max', 0):>7} {(r['error_rate'] or 0) * 100:>6.1f} {r['retries']:>7} "
+              f"{r['credits']:>8} {r['credits_per_record'] or 0:>6.2f}")
+        print(f"     statuses {r['statuses']}, circuit rejections {r['circuit_rejected']}, "
+              f"fetch {r['fetch_seconds']}s + merge {r['merge_seconds']}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of fetch + parse + merge against the stand-in API.')
+    parser.add_argument('--concurrency', default=DEFAULT_CONCURRENCY, help='levels to run (comma-separated)')
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS,
+                        help='fetch every page this many times per level (under distinct URLs)')
+    parser.add_argument('--lean', action='store_true', help='fetch with the lean extract_rules profile')
+    parser.add_argument('--adaptive', action='store_true', help='adaptive render waits')
+    parser.add_argument('--no-escalate', action='store_true', help='one JS request per page, no ladder')
+    parser.add_argument('--all-pages', action='store_true',
+                        help='also fetch fixture pages that lack required fields (they climb the whole ladder)')
+    parser.add_argument('--api-url', help='use an already running stand-in instead of starting one')
+    parser.add_argument('--json', help='also write the reports to this file')
+    parser.add_argument('--verbose', action='store_true', help="show the scraper's stderr")
+    standin_api.add_behaviour_arguments(parser)
+    parser.set_defaults(**BEHAVIOUR_DEFAULTS)
+    args = parser.parse_args()
+
+    server = None
+    if args.api_url:
+        url = args.api_url
+    else:
+        server = standin_api.start(behaviour=standin_api.behaviour_from_args(args))
+        url = standin_api.api_url(server)
+    os.environ.setdefault('SCRAPINGBEE_API_KEY', 'loadtest')
+    scrape.set_api_url(url, timeout=scrape.DEFAULT_TIMEOUT * args.time_scale)
+    scrape.BACKOFF_BASE *= args.time_scale
+    scrape.BACKOFF_MAX *= args.time_scale
+    page_archive.ENABLED = False
+    METRICS.enabled = True
+
+    standin = server.standin if server else standin_api.StandIn()
+    pages = standin.urls() if args.all_pages else complete_pages(standin)
+    urls = [page if r == 0 else f"{page}?round={r}" for r in range(args.rounds) for page in pages]
+    catalog_text = dump_catalog(fixtures.load_catalog())
+    options = dict(lean=args.lean, adaptive=args.adaptive, escalate=not args.no_escalate)
+    print(f"🚦 {len(urls)} fetches per level against {url} (time scale {args.time_scale:g})", file=sys.stderr)
+
+    reports = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for concurrency in (int(c) for c in args.concurrency.split(',') if c):
+            print(f"⏱  concurrency {concurrency}...", file=sys.stderr)
+            if server:
+                server.standin.reset()
+            with open(os.devnull, 'w') as devnull, \
+                    (contextlib.nullcontext() if args.verbose else contextlib.redirect_stderr(devnull)):
+                report = run_level(urls, concurrency, catalog_text, args.time_scale, options, workdir)
+            if server:
+                report['server'] = server.standin.stats()
+            reports.append(report)
+    print_report(reports)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'reports': reports, 'options': vars(args)}, f, ensure_ascii=False, indent=1)
+    if server:
+        server.shutdown()
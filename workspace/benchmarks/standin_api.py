@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the ScrapingBee API, serving the fixture corpus.
+
+Answers GET <anything>/api/v1?api_key=...&url=... with the fixture page
+whose canonical URL is url (404 for unknown URLs; a query string on url
+is ignored), so scrape.py can be
+pointed at it (scrape.set_api_url / SCRAPINGBEE_API_URL) and exercised
+without credits or network:
+
+  render_js, premium_proxy  the Spb-Cost header carries the credits the
+                  real API would charge; only 200 answers are billed
+  extract_rules   JSON rules run here, the response is their JSON result.
+                  A rule is a selector string or {"selector", "output",
+                  "type"}; output is "text", "html" (outer HTML),
+                  "@attribute" or a nested rules object; type is "item"
+                  or "list". Selectors: tag, #id, .class, [attr],
+                  [attr=value], compounds of those and the descendant
+                  combinator (a space) — what the lean profile uses.
+  wait_for        with render_js: 500 if the selector matches nothing
+                  (the real API times out)
+  wait            slept (see Behaviour)
+  block_resources accepted (fixture pages have no resources to block)
+
+By default every answer is instant and succeeds. A Behaviour makes it
+act like the real service under load (all times in simulated ms, slept
+for ms * time_scale, so a load test can run 100x faster than real time):
+
+  latency         lognormal around latency_ms (+ js_latency_ms with
+                  render_js, + premium_latency_ms with premium_proxy)
+  rendering       each page needs a render time (lognormal around
+                  render_ms, fixed per URL); a JS request that neither
+                  waits for the accord block nor sets a long enough wait
+                  gets the page without it, as a too-short wait would
+  Cloudflare      challenge_rate of plain requests without premium proxy
+                  get a (billed) challenge page instead of the perfume
+  faults          rate_429 / rate_500 answer with that status, and
+                  rate_timeout hangs for hang_ms and drops the connection
+
+StandIn.stats() counts requests per status, bytes and billed credits.
+Extraction results are memoised per (url, variant, rules), so repeated
+benchmark runs measure the client, not this server.
+
+Usage: standin_api.py [--port 8790] [--latency-ms 800] [--js-latency-ms 2000]
+                      [--render-ms 1500] [--challenge-rate 0.7]
+                      [--rate-429 0.05] [--rate-500 0.02] [--rate-timeout 0.01] [--time-scale 1]
+"""
+
+import os
+import re
+import sys
+import math
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import functools
+import statistics
+import urllib.parse
+from collections import Counter
+from bisect import bisect_right
+from html.parser import HTMLParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'skills', 'scrapingbee'))
+
+import fixtures
+from scrape import credit_cost
+from fragrantica_scraper import READY_SELECTOR
+
+DEFAULT_PORT = 8790
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+_CANONICAL = re.compile(r'<link rel="canonical" href="([^"]+)"')
+CHALLENGE_PAGE = ('<!DOCTYPE html><html><head><title>Just a moment...</title></head>'
+                  '<body><div id="challenge-running">Checking your browser before accessing the site.</div>'
+                  '</body></html>')
+_COMPOUND = re.compile(r'([a-zA-Z][\w-]*)|#([\w-]+)|\.([\w-]+)|\[([\w-]+)(?:=["\']?([^\]"\']*)["\']?)?\]')
+
+
+class Element:
+    __slots__ = ('tag', 'attrs', 'parent', 'start', 'end', 'first_text', 'last_text')
+
+    def __init__(self, tag, attrs, parent, start, first_text):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.start = start
+        self.end = None
+        self.first_text = first_text
+        self.last_text = None
+
+
+class Document(HTMLParser):
+    """Flat element list with source offsets, for selector matching."""
+
+    def __init__(self, html):
+        super().__init__(convert_charrefs=True)
+        self.html = html
+        self.line_starts = [0] + [m.end() for m in re.finditer('\n', html)]
+        self.elements = []
+        self.texts = []
+        self.open = []
+        self.feed(html)
+        self.close()
+        for element in self.open:
+            self._finish(element, len(html))
+
+    def _offset(self):
+        line, col = self.getpos()
+        return self.line_starts[line - 1] + col
+
+    def _finish(self, element, end):
+        element.end = end
+        element.last_text = len(self.texts)
+
+    def handle_starttag(self, tag, attrs):
+        start = self._offset()
+        parent = self.open[-1] if self.open else None
+        element = Element(tag, {k: v or '' for k, v in attrs}, parent, start, len(self.texts))
+        self.elements.append(element)
+        if tag in VOID_TAGS:
+            self._finish(element, start + len(self.get_starttag_text() or ''))
+        else:
+            self.open.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            element = self.open.pop()
+            self._finish(element, element.start + len(self.get_starttag_text() or ''))
+
+    def handle_endtag(self, tag):
+        for i in range(len(self.open) - 1, -1, -1):
+            if self.open[i].tag == tag:
+                end = self.html.find('>', self._offset()) + 1
+                for element in reversed(self.open[i:]):
+                    self._finish(element, end)
+                del self.open[i:]
+                return
+
+    def handle_data(self, data):
+        self.texts.append(data)
+
+    # --- extraction ---------------------------------------------------------
+
+    def text(self, element):
+        return ' '.join(''.join(self.texts[element.first_text:element.last_text]).split())
+
+    def outer_html(self, element):
+        return self.html[element.start:element.end]
+
+    def select(self, selector, within=None):
+        compounds = [parse_compound(part) for part in selector.split()]
+        elements = self.elements
+        if within is not None:
+            lo = bisect_right([e.start for e in elements], within.start)
+            elements = [e for e in elements[lo:] if e.start < within.end]
+        return [e for e in elements if matches(e, compounds, within)]
+
+    def extract(self, rules, within=None):
+        result = {}
+        for name, rule in rules.items():
+            if isinstance(rule, str):
+                rule = {'selector': rule}
+            found = self.select(rule['selector'], within)
+            output = rule.get('output', 'text')
+            values = [self.output(e, output) for e in found]
+            if rule.get('type') == 'list':
+                result[name] = values
+            else:
+                result[name] = values[0] if values else None
+        return result
+
+    def output(self, element, output):
+        if isinstance(output, dict):
+            return self.extract(output, element)
+        if output == 'html':
+            return self.outer_html(element)
+        if output.startswith('@'):
+            return element.attrs.get(output[1:])
+        return self.text(element)
+
+
+@functools.lru_cache(maxsize=None)
+def parse_compound(part):
+    """'div.accord-bar[style]' -> [('tag', 'div'), ('class', 'accord-bar'), ('attr', 'style', None)]."""
+    tests = []
+    pos = 0
+    for m in _COMPOUND.finditer(part):
+        if m.start() != pos:
+            raise ValueError(f"unsupported selector: {part!r}")
+        pos = m.end()
+        tag, id_, cls, attr, value = m.groups()
+        if tag:
+            tests.append(('tag', tag.lower()))
+        elif id_:
+            tests.append(('attr', 'id', id_))
+        elif cls:
+            tests.append(('class', cls))
+        else:
+            tests.append(('attr', attr.lower(), value))
+    if pos != len(part):
+        raise ValueError(f"unsupported selector: {part!r}")
+    return tests
+
+
+def matches_compound(element, tests):
+    for test in tests:
+        if test[0] == 'tag':
+            if element.tag != test[1]:
+                return False
+        elif test[0] == 'class':
+            if test[1] not in element.attrs.get('class', '').split():
+                return False
+        else:
+            value = element.attrs.get(test[1])
+            if value is None or (test[2] is not None and value != test[2]):
+                return False
+    return True
+
+
+def matches(element, compounds, within=None):
+    """Descendant-combinator match: the last compound on element, the rest on its ancestors in order."""
+    if not matches_compound(element, compounds[-1]):
+        return False
+    ancestor = element.parent
+    for tests in reversed(compounds[:-1]):
+        while ancestor is not None and ancestor is not within and not matches_compound(ancestor, tests):
+            ancestor = ancestor.parent
+        if ancestor is None or ancestor is within:
+            return False
+        ancestor = ancestor.parent
+    return True
+
+
+class Behaviour:
+    """How the stand-in answers: latency, page rendering, challenges and faults (see the module docstring)."""
+
+    def __init__(self, latency_ms=0, latency_sigma=0.5, js_latency_ms=0, premium_latency_ms=0,
+                 render_ms=0, challenge_rate=0.0, rate_429=0.0, rate_500=0.0, rate_timeout=0.0,
+                 hang_ms=120000, time_scale=1.0, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.js_latency_ms = js_latency_ms
+        self.premium_latency_ms = premium_latency_ms
+        self.render_ms = render_ms
+        self.challenge_rate = challenge_rate
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.rate_timeout = rate_timeout
+        self.hang_ms = hang_ms
+        self.time_scale = time_scale
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def _uniform(self):
+        with self.lock:
+            return self.random.random()
+
+    def _lognormal(self, median_ms, u):
+        if not median_ms:
+            return 0.0
+        z = statistics.NormalDist().inv_cdf(min(max(u, 1e-9), 1 - 1e-9))
+        return median_ms * math.exp(z * self.latency_sigma)
+
+    def latency(self, render_js, premium_proxy):
+        """Simulated ms of network and proxy time for one request."""
+        ms = self._lognormal(self.latency_ms, self._uniform())
+        if render_js:
+            ms += self._lognormal(self.js_latency_ms, self._uniform())
+        if premium_proxy:
+            ms += self._lognormal(self.premium_latency_ms, self._uniform())
+        return ms
+
+    def render_time(self, url):
+        """Simulated ms until the page's accord block has rendered; the same on every request for url."""
+        digest = int(hashlib.sha1(url.encode('utf-8')).hexdigest()[:8], 16)
+        return self._lognormal(self.render_ms, (digest + 0.5) / 2 ** 32)
+
+    def fault(self):
+        """'timeout', 429, 500 or None for one request."""
+        u = self._uniform()
+        for fault, rate in (('timeout', self.rate_timeout), (429, self.rate_429), (500, self.rate_500)):
+            if u < rate:
+                return fault
+            u -= rate
+        return None
+
+    def challenged(self, render_js, premium_proxy):
+        return not (render_js or premium_proxy) and self.challenge_rate > 0 and self._uniform() < self.challenge_rate
+
+    def sleep(self, ms):
+        if ms > 0 and self.time_scale > 0:
+            time.sleep(ms * self.time_scale / 1000)
+
+
+class StandIn:
+    """The fixture pages by canonical URL, plus memoised extraction and request accounting."""
+
+    def __init__(self, pages=None):
+        self.pages = {}
+        for _, _, html in pages if pages is not None else fixtures.load_pages():
+            m = _CANONICAL.search(html, 0, 20000)
+            if m:
+                self.pages[m.group(1)] = html
+        self.lock = threading.Lock()
+        self.extracted = {}
+        self.reset()
+
+    def reset(self):
+        """Zero the request accounting."""
+        with self.lock:
+            self.requests = 0
+            self.bytes_out = 0
+            self.credits = 0
+            self.statuses = Counter()
+
+    def count(self, status, size=0, cost=0):
+        with self.lock:
+            self.requests += 1
+            self.bytes_out += size
+            self.statuses[status] += 1
+            if status == 200:
+                self.credits += cost
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'bytes': self.bytes_out, 'credits': self.credits,
+                    'statuses': {str(k): v for k, v in sorted(self.statuses.items(), key=lambda kv: str(kv[0]))}}
+
+    def urls(self):
+        return list(self.pages)
+
+    def resolve(self, url):
+        """The fixture URL for a requested one; a query string is ignored, so one page can be
+        fetched under many distinct URLs (and cache keys)."""
+        if url in self.pages:
+            return url
+        url = (url or '').split('?', 1)[0]
+        return url if url in self.pages else None
+
+    def _memo(self, key, compute):
+        with self.lock:
+            if key in self.extracted:
+                return self.extracted[key]
+        value = compute()
+        with self.lock:
+            self.extracted[key] = value
+        return value
+
+    def page(self, url, variant='full'):
+        """The HTML served for url: 'full', 'unrendered' (no accord block yet) or 'challenge'."""
+        if variant == 'challenge':
+            return CHALLENGE_PAGE
+        if variant == 'unrendered':
+            return self._memo((url, variant), lambda: strip_elements(self.pages[url], READY_SELECTOR))
+        return self.pages[url]
+
+    def extract(self, url, rules_text, variant='full'):
+        def run():
+            rules = json.loads(rules_text)
+            return json.dumps(Document(self.page(url, variant)).extract(rules), ensure_ascii=False)
+        return self._memo((url, variant, rules_text), run)
+
+    def wait_for_found(self, url, selector):
+        return self._memo((url, 'wait_for', selector), lambda: bool(Document(self.pages[url]).select(selector)))
+
+
+def strip_elements(html, selector):
+    """html without the elements matching selector (outermost ones, with their content)."""
+    kept = []
+    pos = 0
+    for element in Document(html).select(selector):
+        if element.start >= pos:
+            kept.append(html[pos:element.start])
+            pos = element.end
+    kept.append(html[pos:])
+    return ''.join(kept)
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = 'scrapingbee-standin'
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status, body, content_type, cost=0):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Spb-Cost', str(cost if status == 200 else 0))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.standin.count(status, len(body), cost)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({'error': message}), 'application/json')
+
+    def do_GET(self):
+        standin = self.server.standin
+        behaviour = self.server.behaviour
+        parts = urllib.parse.urlsplit(self.path)
+        if not parts.path.rstrip('/').endswith('/api/v1'):
+            self._error(404, 'not found')
+            return
+        query = dict(urllib.parse.parse_qsl(parts.query))
+        url = query.get('url')
+        if not query.get('api_key'):
+            self._error(401, 'api_key is required')
+            return
+        url = standin.resolve(url)
+        if url is None:
+            self._error(404, f"no fixture page for {query.get('url')}")
+            return
+        render_js = query.get('render_js', 'true') == 'true'
+        premium_proxy = query.get('premium_proxy') == 'true'
+        cost = credit_cost(render_js, premium_proxy)
+        fault = behaviour.fault()
+        if fault == 'timeout':
+            behaviour.sleep(behaviour.hang_ms)
+            standin.count('timeout')
+            self.close_connection = True
+            return
+        behaviour.sleep(behaviour.latency(render_js, premium_proxy))
+        if fault:
+            self._error(fault, 'simulated ' + ('rate limit' if fault == 429 else 'server error'))
+            return
+        try:
+            wait_ms = int(query.get('wait') or 0)
+            variant = 'full'
+            if behaviour.challenged(render_js, premium_proxy):
+                variant = 'challenge'
+            elif render_js:
+                render_ms = behaviour.render_time(url)
+                if query.get('wait_for'):
+                    if not standin.wait_for_found(url, query['wait_for']):
+                        self._error(500, f"wait_for selector {query['wait_for']!r} never appeared")
+                        return
+                    behaviour.sleep(render_ms)
+                elif wait_ms < render_ms:
+                    variant = 'unrendered'
+            behaviour.sleep(wait_ms)
+            if query.get('extract_rules'):
+                self._send(200, standin.extract(url, query['extract_rules'], variant), 'application/json', cost)
+            else:
+                self._send(200, standin.page(url, variant), 'text/html; charset=utf-8', cost)
+        except ValueError as e:
+            self._error(400, str(e))
+
+
+def start(port=0, pages=None, behaviour=None):
+    """Serve on 127.0.0.1:port in a background thread. Returns the server (.standin, .behaviour, .server_address)."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    server.standin = StandIn(pages)
+    server.behaviour = behaviour or Behaviour()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def api_url(server):
+    host, port = server.server_address
+    return f"http://{host}:{port}/api/v1"
+
+
+def add_behaviour_arguments(parser):
+    """The Behaviour options (shared with loadtest.py); behaviour_from_args() builds it."""
+    group = parser.add_argument_group('stand-in behaviour (simulated ms)')
+    group.add_argument('--latency-ms', type=float, default=0, help='median base latency')
+    group.add_argument('--latency-sigma', type=float, default=0.5, help='lognormal spread of latencies')
+    group.add_argument('--js-latency-ms', type=float, default=0, help='median extra latency with render_js')
+    group.add_argument('--premium-latency-ms', type=float, default=0, help='median extra latency with premium_proxy')
+    group.add_argument('--render-ms', type=float, default=0, help='median time until a page has rendered')
+    group.add_argument('--challenge-rate', type=float, default=0, help='share of plain requests challenged')
+    group.add_argument('--rate-429', type=float, default=0, help='share of requests answered 429')
+    group.add_argument('--rate-500', type=float, default=0, help='share of requests answered 500')
+    group.add_argument('--rate-timeout', type=float, default=0, help='share of requests that hang')
+    group.add_argument('--hang-ms', type=float, default=120000, help='how long a hanging request hangs')
+    group.add_argument('--time-scale', type=float, default=1.0, help='real seconds per simulated second')
+    group.add_argument('--seed', type=int, help='random seed for latencies and faults')
+    return group
+
+
+def behaviour_from_args(args):
+    return Behaviour(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                     js_latency_ms=args.js_latency_ms, premium_latency_ms=args.premium_latency_ms,
+                     render_ms=args.render_ms, challenge_rate=args.challenge_rate, rate_429=args.rate_429,
+                     rate_500=args.rate_500, rate_timeout=args.rate_timeout, hang_ms=args.hang_ms,
+                     time_scale=args.time_scale, seed=args.seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the ScrapingBee API.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+    server = start(args.port, behaviour=behaviour_from_args(args))
+    print(f"stand-in API on {api_url(server)} ({len(server.standin.pages)} pages)", file=sys.stderr)
+    for url in server.standin.urls()[:3]:
+        print(f"  e.g. {url}", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(json.dumps(server.standin.stats()), file=sys.stderr)
+        server.shutdown()
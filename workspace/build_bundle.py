@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Build the compact catalog bundle the perfume page loads instead of perfumes.json.
+
+The bundle is minified JSON with the keys factored out of the records:
+  {"v": 1,
+   "keys": ["brand", "name", ...],          # column order of every row
+   "rows": [[...], ...],                    # one array per perfume, trailing nulls cut
+   "index": {"text": {token: [ids]},        # search: brand, name, notes, desc, price,
+                                            #         family, perfumer, pyramid notes
+             "notes": {...}, "accords": {...}, "tags": {...},
+             "family": {...}, "perfumer": {...}}}
+accords are stored as [name, w, color] and pyramid as [top, mid, base];
+the page expands them back. Posting lists are sorted record indexes.
+
+The file is named after its content hash (data/catalog.<hash>.json) and
+gets precompressed .gz and, when the brotli module is installed, .br
+siblings for gzip_static/brotli_static serving. index.html is pointed at
+the new bundle (the CATALOG_BUNDLE line) and older bundles are removed.
+
+Once a page loads a bundle it no longer reads perfumes.json, so every
+script that rewrites the catalog rebuilds it (rebuild_bundle(), through
+build_page.refresh_page()); a page still on CATALOG_BUNDLE = null is
+left alone.
+
+Usage: build_bundle.py [--keep N]
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import hashlib
+from typing import Dict, Any, List, Iterable, Optional
+
+from merge_fragrantica_data import write_text_atomic
+
+CATALOG_FILE = '/data/workspace/pages/perfume/perfumes.json'
+PAGE_FILE = '/data/workspace/pages/perfume/index.html'
+BUNDLE_DIR = '/data/workspace/pages/perfume/data'
+BUNDLE_VERSION = 1
+# Bundles kept besides the current one, for pages still cached in browsers
+KEEP_OLD = 2
+
+TOKEN_RE = re.compile(r'\w+')
+BUNDLE_LINE_RE = re.compile(r"^const CATALOG_BUNDLE = .*?;$", re.M)
+BUNDLE_NAME_RE = re.compile(r'^catalog\.[0-9a-f]{12}\.json$')
+
+
+def tokens(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower().replace('ё', 'е')) if len(t) > 1 or t.isdigit()]
+
+
+def split_list(value) -> List[str]:
+    """Comma-separated notes (or a list of them) as lower-cased terms."""
+    if isinstance(value, list):
+        value = ', '.join(value)
+    return [v.strip().lower() for v in (value or '').split(',') if v.strip() and v.strip() != '—']
+
+
+def column_order(records: List[Dict]) -> List[str]:
+    """Keys in first-seen order; rarely used keys end up last, so rows can drop them."""
+    counts: Dict[str, int] = {}
+    first: Dict[str, int] = {}
+    for record in records:
+        for key in record:
+            counts[key] = counts.get(key, 0) + 1
+            first.setdefault(key, len(first))
+    return sorted(counts, key=lambda k: (-counts[k], first[k]))
+
+
+def compact_value(key: str, value: Any) -> Any:
+    if key == 'accords' and isinstance(value, list):
+        return [[a.get('name'), a.get('w'), a.get('color')] for a in value]
+    if key == 'pyramid' and isinstance(value, dict):
+        return [value.get('top'), value.get('mid'), value.get('base')]
+    return value
+
+
+def build_index(records: List[Dict]) -> Dict[str, Dict[str, List[int]]]:
+    facets: Dict[str, Dict[str, set]] = {name: {} for name in
+                                         ('text', 'notes', 'accords', 'tags', 'family', 'perfumer')}
+
+    def add(facet: str, terms: Iterable[str], i: int):
+        for term in terms:
+            if term:
+                facets[facet].setdefault(term, set()).add(i)
+
+    for i, p in enumerate(records):
+        pyramid = p.get('pyramid') or {}
+        notes = split_list(p.get('notes')) + [n for tier in ('top', 'mid', 'base')
+                                               for n in split_list(pyramid.get(tier))]
+        add('notes', notes, i)
+        add('accords', [(a.get('name') or '').lower() for a in p.get('accords') or []], i)
+        add('tags', p.get('tags') or [], i)
+        add('family', [(p.get('family') or '').lower()], i)
+        add('perfumer', split_list(p.get('perfumer')), i)
+        text = ' '.join(str(p.get(k) or '') for k in ('brand', 'name', 'notes', 'desc', 'price',
+                                                       'family', 'perfumer'))
+        add('text', tokens(text + ' ' + ' '.join(notes)), i)
+
+    return {facet: {term: sorted(ids) for term, ids in sorted(terms.items())}
+            for facet, terms in facets.items()}
+
+
+def build_bundle(records: List[Dict]) -> Dict[str, Any]:
+    keys = column_order(records)
+    rows = []
+    for record in records:
+        row = [compact_value(k, record.get(k)) for k in keys]
+        while row and row[-1] is None:
+            row.pop()
+        rows.append(row)
+    return {'v': BUNDLE_VERSION, 'keys': keys, 'rows': rows, 'index': build_index(records)}
+
+
+def write_bundle(bundle: Dict[str, Any], out_dir: str = BUNDLE_DIR) -> str:
+    """Write catalog.<hash>.json plus .gz/.br siblings; returns the file name."""
+    data = json.dumps(bundle, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    name = f"catalog.{hashlib.sha256(data).hexdigest()[:12]}.json"
+    path = os.path.join(out_dir, name)
+    os.makedirs(out_dir, exist_ok=True)
+    if os.path.exists(path):
+        return name
+
+    siblings = [(path, data), (path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+        siblings.append((path + '.br', brotli.compress(data, quality=11)))
+    except ImportError:
+        print("⚠️  brotli module not installed, skipping .br (pip install brotli)")
+    # The plain file goes last: once it exists the bundle counts as complete
+    for target, payload in reversed(siblings):
+        tmp = target + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, target)
+    for target, payload in siblings:
+        print(f"   {os.path.basename(target)}: {len(payload):,} bytes")
+    return name
+
+
+def prune_bundles(current: str, out_dir: str = BUNDLE_DIR, keep: int = KEEP_OLD) -> int:
+    bundles = [n for n in os.listdir(out_dir) if BUNDLE_NAME_RE.match(n) and n != current]
+    bundles.sort(key=lambda n: os.path.getmtime(os.path.join(out_dir, n)), reverse=True)
+    removed = 0
+    for name in bundles[keep:]:
+        for suffix in ('', '.gz', '.br'):
+            try:
+                os.remove(os.path.join(out_dir, name + suffix))
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def point_page_at(name: str, page_file: str = PAGE_FILE, out_dir: str = BUNDLE_DIR) -> bool:
+    """Rewrite the CATALOG_BUNDLE line of index.html. Returns True if it changed."""
+    with open(page_file, encoding='utf-8') as f:
+        html = f.read()
+    rel = os.path.relpath(os.path.join(out_dir, name), os.path.dirname(page_file))
+    line = f"const CATALOG_BUNDLE = '{rel}';"
+    if not BUNDLE_LINE_RE.search(html):
+        print(f"❌ No CATALOG_BUNDLE line in {page_file}")
+        return False
+    new_html = BUNDLE_LINE_RE.sub(line, html, count=1)
+    if new_html == html:
+        return False
+    write_text_atomic(page_file, new_html)
+    return True
+
+
+def uses_bundle(page_file: str = PAGE_FILE) -> bool:
+    """True if the page's CATALOG_BUNDLE line names a bundle (not null)."""
+    with open(page_file, encoding='utf-8') as f:
+        found = BUNDLE_LINE_RE.search(f.read())
+    return bool(found) and found.group(0) != 'const CATALOG_BUNDLE = null;'
+
+
+def rebuild_bundle(records: List[Dict], page_file: str = PAGE_FILE, out_dir: Optional[str] = None,
+                   keep: int = KEEP_OLD) -> Optional[str]:
+    """Rebuild the bundle of a page that already loads one, from records.
+
+    out_dir defaults to data/ next to the page. Returns the bundle name,
+    or None when the page reads perfumes.json directly.
+    """
+    if not uses_bundle(page_file):
+        return None
+    out_dir = out_dir or os.path.join(os.path.dirname(page_file), 'data')
+    name = write_bundle(build_bundle(records), out_dir)
+    point_page_at(name, page_file, out_dir)
+    prune_bundles(name, out_dir, keep)
+    return name
+
+
+def main():
+    args = sys.argv[1:]
+    keep = int(args[args.index('--keep') + 1]) if '--keep' in args else KEEP_OLD
+
+    with open(CATALOG_FILE, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    print(f"📦 Building bundle for {len(records)} perfumes...")
+    name = write_bundle(build_bundle(records), BUNDLE_DIR)
+    changed = point_page_at(name, PAGE_FILE, BUNDLE_DIR)
+    removed = prune_bundles(name, BUNDLE_DIR, keep)
+    print(f"✅ {name} ({'page updated' if changed else 'page already current'}"
+          f"{f', {removed} old files removed' if removed else ''})")
+
+
+if __name__ == '__main__':
+    main()
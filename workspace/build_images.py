@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Build resized, metadata-free image variants for the perfume page.
+
+Every source image in pages/perfume/img/ is decoded once (on a process
+pool) and written as WebP — and AVIF when this Pillow build can encode
+it — at each width in WIDTHS that does not upscale the source. Variants
+are named after the source's content hash, so identical images share one
+set of files; a manifest (img/v/manifest.json) remembers each source's
+size, mtime and hash, so re-runs only touch new or changed images.
+
+perfumes.json then gets, for every record whose img is one of the
+sources (img itself stays as the full-size fallback):
+  srcset       "…/v/<hash>-80.webp 80w, …/v/<hash>-160.webp 160w, …"
+  srcset_avif  the same for AVIF (only if AVIF variants exist)
+  img_w/img_h  intrinsic size of the source, for layout before load
+
+--dry-run writes nothing: it reports which images would be rendered
+(sizes read from the image headers, nothing decoded), which stale
+variants would be removed, and the catalog changes that would follow.
+
+Requires Pillow (pip install Pillow).
+
+Usage: build_images.py [--dry-run] [--force] [--workers N]
+"""
+
+import os
+import sys
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional
+
+from merge_fragrantica_data import dump_catalog, write_text_atomic, diff_catalogs, print_change_summary
+
+CATALOG_FILE = '/data/workspace/pages/perfume/perfumes.json'
+IMG_DIR = '/data/workspace/pages/perfume/img'
+VARIANTS_SUBDIR = 'v'
+MANIFEST_NAME = 'manifest.json'
+
+# Cards show images at 75px (60px on phones), the modal at 160px; 2x covers retina
+WIDTHS = (80, 160, 320)
+WEBP_QUALITY = 80
+AVIF_QUALITY = 55
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def _require_pillow():
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("ERROR: Pillow is required for image builds. Install it with: pip install Pillow", file=sys.stderr)
+        sys.exit(1)
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def avif_supported() -> bool:
+    from PIL import features
+    try:
+        return bool(features.check('avif'))
+    except ValueError:
+        # Older Pillow: no built-in AVIF; the pillow-avif-plugin registers it on import
+        try:
+            import pillow_avif  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+
+def variant_name(digest: str, width: int, fmt: str) -> str:
+    return f"{digest[:16]}-{width}.{fmt}"
+
+
+def render_variants(src: str, digest: str, out_dir: str, formats: List[str]) -> Dict[str, Any]:
+    """Decode src once and write every width/format (runs in a worker process).
+
+    The EXIF orientation is applied first, then the metadata (EXIF, XMP, ICC)
+    is dropped so it never reaches the variants.
+    """
+    from PIL import Image, ImageOps
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)
+        transparent = im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info)
+        im = im.convert('RGBA' if transparent else 'RGB')
+        width, height = im.size
+        widths = [w for w in WIDTHS if w <= width] or [width]
+        written = {}
+        for w in widths:
+            h = max(1, round(height * w / width))
+            clean = im.resize((w, h), Image.LANCZOS) if w != width else im.copy()
+            # resize/copy carry the source's info dict (exif, icc_profile, xmp) along
+            clean.info = {}
+            for fmt in formats:
+                name = variant_name(digest, w, fmt)
+                path = os.path.join(out_dir, name)
+                tmp = path + '.tmp'
+                if fmt == 'webp':
+                    clean.save(tmp, 'WEBP', quality=WEBP_QUALITY, method=6)
+                else:
+                    clean.save(tmp, 'AVIF', quality=AVIF_QUALITY)
+                os.replace(tmp, path)
+                written.setdefault(fmt, []).append([w, name])
+    return {'width': width, 'height': height, 'variants': written}
+
+
+def planned_variants(src: str, digest: str, formats: List[str]) -> Dict[str, Any]:
+    """The manifest entry render_variants would produce, from the image header alone."""
+    from PIL import Image
+    with Image.open(src) as im:
+        width, height = im.size
+        # EXIF orientations 5-8 are rotated by a quarter turn: exif_transpose swaps the sides
+        if im.getexif().get(0x0112) in (5, 6, 7, 8):
+            width, height = height, width
+    widths = [w for w in WIDTHS if w <= width] or [width]
+    return {'width': width, 'height': height,
+            'variants': {fmt: [[w, variant_name(digest, w, fmt)] for w in widths] for fmt in formats}}
+
+
+def load_manifest(out_dir: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'sources': {}, 'hashes': {}}
+
+
+def build_variants(img_dir: str = IMG_DIR, workers: Optional[int] = None, force: bool = False,
+                   dry_run: bool = False) -> Dict[str, Any]:
+    """Bring img/v/ up to date with img/. Returns the manifest.
+
+    With dry_run nothing is rendered, removed or written: the returned
+    manifest is the one a real run would produce (planned_variants).
+    """
+    _require_pillow()
+    out_dir = os.path.join(img_dir, VARIANTS_SUBDIR)
+    if not dry_run:
+        os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    formats = ['webp'] + (['avif'] if avif_supported() else [])
+    sources = manifest['sources']
+    hashes = manifest['hashes']
+
+    names = sorted(n for n in os.listdir(img_dir) if n.lower().endswith(SOURCE_EXTENSIONS))
+    todo = {}
+    for name in names:
+        path = os.path.join(img_dir, name)
+        st = os.stat(path)
+        known = sources.get(name)
+        if (not force and known and known['size'] == st.st_size and known['mtime'] == st.st_mtime
+                and known['hash'] in hashes):
+            continue
+        digest = file_hash(path)
+        sources[name] = {'size': st.st_size, 'mtime': st.st_mtime, 'hash': digest}
+        entry = hashes.get(digest)
+        have_all = entry and all(fmt in entry['variants'] for fmt in formats) and all(
+            os.path.exists(os.path.join(out_dir, n)) for fmt in formats for _, n in entry['variants'][fmt])
+        if force or not have_all:
+            # Identical content under several names is rendered once
+            todo.setdefault(digest, path)
+    for name in list(sources):
+        if name not in names:
+            del sources[name]
+
+    if todo and dry_run:
+        print(f"🧪 Dry run: would render {len(todo)} images ({', '.join(formats)} at "
+              f"{', '.join(map(str, WIDTHS))}px):")
+        for digest, path in todo.items():
+            hashes[digest] = planned_variants(path, digest, formats)
+            files = sum(len(v) for v in hashes[digest]['variants'].values())
+            print(f"   {os.path.basename(path)} ({hashes[digest]['width']}×{hashes[digest]['height']}): {files} files")
+    elif todo:
+        print(f"🖼  Rendering {len(todo)} images ({', '.join(formats)} at {', '.join(map(str, WIDTHS))}px)...")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(render_variants, path, digest, out_dir, formats): (digest, path)
+                       for digest, path in todo.items()}
+            for future in as_completed(futures):
+                digest, path = futures[future]
+                try:
+                    hashes[digest] = future.result()
+                except Exception as e:
+                    print(f"❌ {os.path.basename(path)}: {e.__class__.__name__}: {e}")
+    else:
+        print("🖼  All image variants up to date")
+
+    # Drop variants no source points at any more
+    live = {s['hash'] for s in sources.values()}
+    stale = 0
+    for digest in list(hashes):
+        if digest not in live:
+            for files in hashes.pop(digest)['variants'].values():
+                for _, name in files:
+                    stale += 1
+                    if dry_run:
+                        continue
+                    try:
+                        os.remove(os.path.join(out_dir, name))
+                    except FileNotFoundError:
+                        pass
+    if dry_run:
+        if stale:
+            print(f"🧪 Dry run: would remove {stale} stale variant files")
+        return manifest
+
+    tmp = os.path.join(out_dir, MANIFEST_NAME + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST_NAME))
+    return manifest
+
+
+def apply_to_catalog(records: List[Dict], manifest: Dict[str, Any]) -> None:
+    """Write srcset/srcset_avif/img_w/img_h for records whose img is a known source."""
+    for record in records:
+        img = record.get('img')
+        if not img:
+            continue
+        base, _, name = img.rpartition('/')
+        source = manifest['sources'].get(name)
+        entry = source and manifest['hashes'].get(source['hash'])
+        if not entry:
+            continue
+        prefix = f"{base}/{VARIANTS_SUBDIR}/" if base else f"{VARIANTS_SUBDIR}/"
+        for fmt, key in (('webp', 'srcset'), ('avif', 'srcset_avif')):
+            files = entry['variants'].get(fmt)
+            if files:
+                record[key] = ', '.join(f"{prefix}{n} {w}w" for w, n in files)
+            else:
+                record.pop(key, None)
+        record['img_w'] = entry['width']
+        record['img_h'] = entry['height']
+
+
+def main():
+    args = sys.argv[1:]
+    dry_run = '--dry-run' in args
+    force = '--force' in args
+    workers = int(args[args.index('--workers') + 1]) if '--workers' in args else None
+
+    manifest = build_variants(IMG_DIR, workers=workers, force=force, dry_run=dry_run)
+
+    with open(CATALOG_FILE, 'r', encoding='utf-8') as f:
+        current_text = f.read()
+    original = json.loads(current_text)
+    records = json.loads(current_text)
+    apply_to_catalog(records, manifest)
+    changes = diff_catalogs(original, records)
+    print_change_summary(records, changes)
+    new_text = dump_catalog(records)
+    if changes and new_text != current_text and not dry_run:
+        write_text_atomic(CATALOG_FILE, new_text)
+        print(f"💾 {CATALOG_FILE} updated ({len(changes)} perfumes)")
+        from build_page import refresh_page, report_refresh
+        report_refresh(refresh_page(records, CATALOG_FILE))
+    else:
+        print(f"📄 {CATALOG_FILE} {'not written (dry run)' if dry_run else 'unchanged'}")
+
+
+if __name__ == '__main__':
+    main()
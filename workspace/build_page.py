@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Pre-render the first screen of the perfume page into index.html.
+
+Without it the page shows an empty grid until the catalog (perfumes.json
+or the build_bundle.py bundle) has downloaded and every card has been
+templated in the browser. This fills three regions of index.html:
+
+  <!-- prerender:cards -->   the first FIRST_SCREEN cards as HTML, with
+                             initials and gradients computed here
+  <!-- prerender:count -->   "N из N ароматов"
+  const PRERENDERED = ...;   the records behind those cards, so they open
+                             their modal before the catalog has loaded
+
+The page then loads the full catalog, keeps the pre-rendered cards and
+appends the rest in chunks as the grid scrolls into view, so the first
+paint costs the same for 50 perfumes or 50,000. Card markup mirrors
+imgHTML()/render() in the page; the gradient list and tag labels are
+read from the page itself, so there is one copy of each.
+
+Every script that rewrites perfumes.json (the merge, similarity.py,
+build_images.py, snapshot restores, catalog_store.py export) calls
+refresh_page(), which also rebuilds the build_bundle.py bundle when the
+page loads one, so the first screen and the bundle behind it always come
+from the same catalog. Running it again replaces the regions; an empty
+catalog clears them.
+
+Usage: build_page.py [--dry-run]
+"""
+
+import os
+import re
+import sys
+import json
+import html
+from typing import Dict, List, Optional
+
+from merge_fragrantica_data import CATALOG_FILE, write_text_atomic
+
+PAGE_FILE = '/data/workspace/pages/perfume/index.html'
+# Cards in the first screen: four rows of the three-column desktop grid
+FIRST_SCREEN = 12
+CARD_SIZES = '(max-width:600px) 60px, 75px'
+
+GRADIENTS_RE = re.compile(r"^const gradients = \[(.*?)\];", re.M | re.S)
+TAG_LABELS_RE = re.compile(r"^const tagLabels = \{(.*?)\};", re.M)
+PRERENDERED_RE = re.compile(r"^const PRERENDERED = .*?;$", re.M)
+SPLIT_RE = re.compile(r'[\s&]+')
+
+
+def region_re(name: str) -> re.Pattern:
+    return re.compile(rf"(<!-- prerender:{name} -->).*?(<!-- /prerender:{name} -->)", re.S)
+
+
+def hash_code(s: str) -> int:
+    """hashCode() of the page: 32-bit string hash over UTF-16 code units."""
+    h = 0
+    data = s.encode('utf-16-le')
+    for i in range(0, len(data), 2):
+        h = ((h << 5) - h + int.from_bytes(data[i:i + 2], 'little')) & 0xFFFFFFFF
+    return abs(h - (1 << 32) if h >= 1 << 31 else h)
+
+
+def initials(brand: str) -> str:
+    """getInitials() of the page."""
+    return ''.join(w[0] for w in SPLIT_RE.split(brand) if w)[:2].upper()
+
+
+def page_constants(page: str) -> Dict[str, object]:
+    """The gradients and tag labels the page's script defines."""
+    found = GRADIENTS_RE.search(page)
+    labels = TAG_LABELS_RE.search(page)
+    if not found or not labels:
+        raise ValueError('page has no gradients/tagLabels constants')
+    return {'gradients': re.findall(r"'([^']+)'", found.group(1)),
+            'tag_labels': dict(re.findall(r"(\w+):'([^']*)'", labels.group(1)))}
+
+
+def img_html(p: Dict, sizes: str, gradient: str) -> str:
+    esc = html.escape
+    ini = esc(initials(p['brand']))
+    if not p.get('img'):
+        return f'<div class="initials" style="background:{gradient}">{ini}</div>'
+    fallback = (f"onerror=\"this.closest('.card-img,.m-photo').innerHTML="
+                f"'<div class=\\'initials\\' style=\\'background:{gradient}\\'>{ini}</div>'\"")
+    srcset = f' srcset="{esc(p["srcset"])}" sizes="{sizes}"' if p.get('srcset') else ''
+    dims = f' width="{p["img_w"]}" height="{p["img_h"]}"' if p.get('img_w') else ''
+    img = (f'<img src="{esc(p["img"])}"{srcset}{dims} alt="{esc(p["name"])}" loading="lazy" '
+           f'decoding="async" {fallback}>')
+    if not p.get('srcset_avif'):
+        return img
+    return f'<picture><source type="image/avif" srcset="{esc(p["srcset_avif"])}" sizes="{sizes}">{img}</picture>'
+
+
+def card_html(p: Dict, idx: int, constants: Dict) -> str:
+    esc = html.escape
+    gradients = constants['gradients']
+    gradient = gradients[hash_code(p['brand'] + p['name']) % len(gradients)]
+    tags = ''.join(f'<span class="tag tag-{esc(t)}">{esc(constants["tag_labels"].get(t, t))}</span>'
+                   for t in p.get('tags') or [])
+    price = f'<span class="card-price">{esc(p["price"])}</span>' if p.get('price') else ''
+    fav = '<div class="fav-ribbon"></div>' if p.get('fav') else ''
+    notes = f'<div class="card-notes">{esc(p["notes"])}</div>' if p.get('notes') and p['notes'] != '—' else ''
+    desc = f'<div class="card-desc">{esc(p["desc"])}</div>' if p.get('desc') and p['desc'] != '—' else ''
+    return f"""
+      <div class="card" onclick="openModal({idx})">
+        <div class="card-img">{fav}{img_html(p, CARD_SIZES, gradient)}</div>
+        <div class="card-body">
+          <div class="card-header">
+            <div class="card-brand">{esc(p['brand'])}</div>
+            {price}
+          </div>
+          <div class="card-name">{esc(p['name'])}</div>
+          {notes}
+          {desc}
+          <div class="card-tags">{tags}</div>
+          <div class="card-source">via {esc(str(p.get('source', '')))}</div>
+        </div>
+      </div>"""
+
+
+def script_json(value) -> str:
+    """JSON safe to inline in a <script> element."""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+
+def prerender(page: str, records: List[Dict], first_screen: int = FIRST_SCREEN) -> str:
+    """page with its prerender regions filled from records."""
+    constants = page_constants(page)
+    head = records[:first_screen]
+    cards = ''.join(card_html(p, i, constants) for i, p in enumerate(head))
+    count = f"{len(records)} из {len(records)} ароматов" if records else ''
+    for name, body in (('cards', cards), ('count', count)):
+        pattern = region_re(name)
+        if not pattern.search(page):
+            raise ValueError(f'page has no prerender:{name} region')
+        page = pattern.sub(lambda m: m.group(1) + body + m.group(2), page, count=1)
+    if not PRERENDERED_RE.search(page):
+        raise ValueError('page has no PRERENDERED line')
+    data = script_json(head) if head else 'null'
+    return PRERENDERED_RE.sub(lambda m: f"const PRERENDERED = {data};", page, count=1)
+
+
+def build_page(records: List[Dict], page_file: str = PAGE_FILE) -> Optional[bool]:
+    """Pre-render page_file in place. Returns True if it changed, None if it is not a prerender template."""
+    with open(page_file, encoding='utf-8') as f:
+        page = f.read()
+    try:
+        new_page = prerender(page, records)
+    except ValueError as e:
+        print(f"❌ {page_file}: {e}")
+        return None
+    if new_page == page:
+        return False
+    write_text_atomic(page_file, new_page)
+    return True
+
+
+def refresh_page(records: List[Dict], catalog_file: str = CATALOG_FILE) -> Dict[str, object]:
+    """Bring the index.html next to catalog_file up to date with records (bundle, then first screen).
+
+    Returns {'bundle': name or None, 'prerendered': build_page()'s result}; {} without a page.
+    """
+    page_file = os.path.join(os.path.dirname(catalog_file), 'index.html')
+    if not os.path.exists(page_file):
+        return {}
+    from build_bundle import rebuild_bundle
+    bundle = rebuild_bundle(records, page_file)
+    return {'bundle': bundle, 'prerendered': build_page(records, page_file)}
+
+
+def report_refresh(refreshed: Dict[str, object]) -> None:
+    """One line per part of the page refresh_page() rewrote."""
+    if refreshed.get('bundle'):
+        print(f"   📦 Page bundle rebuilt: {refreshed['bundle']}")
+    if refreshed.get('prerendered'):
+        print("   🖼  Page first screen re-rendered")
+
+
+def main():
+    dry_run = '--dry-run' in sys.argv[1:]
+    with open(CATALOG_FILE, encoding='utf-8') as f:
+        records = json.load(f)
+    print(f"🖼  Pre-rendering {min(len(records), FIRST_SCREEN)} of {len(records)} cards into {PAGE_FILE}...")
+    if dry_run:
+        with open(PAGE_FILE, encoding='utf-8') as f:
+            page = f.read()
+        print(f"🧪 Dry run: {len(prerender(page, records).encode('utf-8')):,} bytes, not written")
+        return
+    refreshed = refresh_page(records)
+    report_refresh(refreshed)
+    if refreshed.get('prerendered') is not None:
+        print(f"✅ {'page updated' if refreshed['prerendered'] else 'page already current'}")
+
+
+if __name__ == '__main__':
+    main()
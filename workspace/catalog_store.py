@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+SQLite catalog store: perfumes, pyramids, accords and rating history.
+
+Each perfume keeps its full record as a JSON document (so perfumes.json can
+be exported byte-for-byte in the same shape) next to indexed columns and
+child tables that queries use:
+
+  perfumes        id (catalog order), brand/name + normalized keys,
+                  fragrantica_id, family, gender, year, rating, votes, doc
+  pyramid_notes   one row per note per tier
+  accords         one row per accord, with weight and color
+  perfume_terms   tags, seasons, daytime
+  rating_history  (perfume, at, rating, votes) whenever rating/votes change
+  perfumes_fts    FTS5 over brand, name, notes, accords, description
+
+CatalogStore has the same match()/find()/apply()/batch() interface as
+CatalogIndex, so merge_updates() runs against it unchanged and every
+merged record becomes one indexed UPDATE instead of a whole-file rewrite;
+inside batch() they all commit as one transaction. Lookups go through a
+reconcile.Reconciler built from the id/brand/name/fragrantica_id columns
+on first use.
+
+perfumes.json is exported from the store, so anything written to the file
+behind its back (build_images.py srcsets, hand edits) is taken back in
+with sync() before the store is merged into and exported again.
+
+Usage:
+  catalog_store.py import [--db FILE]          load perfumes.json into the store
+  catalog_store.py export [--db FILE]          write perfumes.json from the store
+  catalog_store.py query  [--db FILE] [--note N] [--accord A] [--family F] [--season S]
+                          [--min-rating X] [--max-rating Y] [--text QUERY] [--limit N]
+  catalog_store.py history [--db FILE] BRAND — NAME
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import contextlib
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Iterable
+
+from merge_fragrantica_data import (normalize_name, scraped_fields, dump_catalog, write_text_atomic,
+                                    CATALOG_FILE)
+
+CATALOG_DB = '/data/workspace/state/catalog.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS perfumes (
+    id INTEGER PRIMARY KEY,
+    brand TEXT NOT NULL,
+    name TEXT NOT NULL,
+    brand_key TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    fragrantica_id INTEGER,
+    family TEXT,
+    family_key TEXT,
+    gender TEXT,
+    concentration TEXT,
+    year INTEGER,
+    perfumer TEXT,
+    rating REAL,
+    votes INTEGER,
+    doc TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS perfumes_key ON perfumes (brand_key, name_key);
+CREATE INDEX IF NOT EXISTS perfumes_fid ON perfumes (fragrantica_id) WHERE fragrantica_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS perfumes_family ON perfumes (family_key);
+CREATE INDEX IF NOT EXISTS perfumes_rating ON perfumes (rating);
+
+CREATE TABLE IF NOT EXISTS pyramid_notes (
+    perfume_id INTEGER NOT NULL REFERENCES perfumes (id) ON DELETE CASCADE,
+    tier TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    note TEXT NOT NULL,
+    note_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pyramid_notes_key ON pyramid_notes (note_key);
+CREATE INDEX IF NOT EXISTS pyramid_notes_perfume ON pyramid_notes (perfume_id);
+
+CREATE TABLE IF NOT EXISTS accords (
+    perfume_id INTEGER NOT NULL REFERENCES perfumes (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    w INTEGER,
+    color TEXT
+);
+CREATE INDEX IF NOT EXISTS accords_key ON accords (name_key, w);
+CREATE INDEX IF NOT EXISTS accords_perfume ON accords (perfume_id);
+
+CREATE TABLE IF NOT EXISTS perfume_terms (
+    perfume_id INTEGER NOT NULL REFERENCES perfumes (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS perfume_terms_value ON perfume_terms (kind, value);
+CREATE INDEX IF NOT EXISTS perfume_terms_perfume ON perfume_terms (perfume_id);
+
+CREATE TABLE IF NOT EXISTS rating_history (
+    perfume_id INTEGER NOT NULL REFERENCES perfumes (id) ON DELETE CASCADE,
+    at TEXT NOT NULL,
+    rating REAL,
+    votes INTEGER
+);
+CREATE INDEX IF NOT EXISTS rating_history_perfume ON rating_history (perfume_id, at);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS perfumes_fts USING fts5 (
+    brand, name, notes, accords, description,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# Record keys mirrored into indexed columns of `perfumes`
+COLUMNS = ('family', 'gender', 'concentration', 'year', 'perfumer', 'rating', 'votes')
+TERM_KINDS = {'tags': 'tag', 'seasons': 'season', 'daytime': 'daytime'}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def _split_notes(value) -> List[str]:
+    if isinstance(value, list):
+        return [v for v in value if v]
+    return [n.strip() for n in (value or '').split(',') if n.strip() and n.strip() != '—']
+
+
+def _fts_query(text: str) -> str:
+    """Every word as a quoted prefix term, so user input is never FTS syntax."""
+    words = [w.replace('"', '') for w in text.split()]
+    return ' '.join(f'"{w}"*' for w in words if w)
+
+
+class CatalogStore:
+    """The perfume catalog in SQLite, with the CatalogIndex find()/apply() interface."""
+
+    def __init__(self, path: str = CATALOG_DB):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(SCHEMA)
+        self._reconciler = None
+        self._in_batch = False
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def count(self) -> int:
+        return self.db.execute('SELECT count(*) FROM perfumes').fetchone()[0]
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Run every write inside as one transaction, committed at the end (rolled back on error)."""
+        if self._in_batch:
+            yield self
+            return
+        self._in_batch = True
+        try:
+            with self.db:
+                yield self
+        finally:
+            self._in_batch = False
+
+    def _transaction(self):
+        """The connection as a commit-on-exit context, or nothing when a batch() is open."""
+        return contextlib.nullcontext() if self._in_batch else self.db
+
+    # --- writes -------------------------------------------------------------
+
+    def _write(self, perfume_id: int, record: Dict, new: bool) -> None:
+        """Store record under perfume_id and rebuild its child rows."""
+        values = {
+            'id': perfume_id,
+            'brand': record.get('brand', ''),
+            'name': record.get('name', ''),
+            'brand_key': normalize_name(record.get('brand', '')),
+            'name_key': normalize_name(record.get('name', '')),
+            'fragrantica_id': record.get('fragrantica_id'),
+            **{c: record.get(c) for c in COLUMNS},
+            # SQLite's lower() only folds ASCII, so keys are lower-cased here
+            'family_key': (record.get('family') or '').lower() or None,
+            'doc': json.dumps(record, ensure_ascii=False),
+            'updated_at': _now(),
+        }
+        names = ', '.join(values)
+        if new:
+            self.db.execute(f"INSERT INTO perfumes ({names}) VALUES ({', '.join('?' * len(values))})",
+                            list(values.values()))
+        else:
+            assignments = ', '.join(f"{k} = ?" for k in values if k != 'id')
+            self.db.execute(f"UPDATE perfumes SET {assignments} WHERE id = ?",
+                            [v for k, v in values.items() if k != 'id'] + [perfume_id])
+            for table in ('pyramid_notes', 'accords', 'perfume_terms'):
+                self.db.execute(f"DELETE FROM {table} WHERE perfume_id = ?", (perfume_id,))
+            self.db.execute('DELETE FROM perfumes_fts WHERE rowid = ?', (perfume_id,))
+
+        pyramid = record.get('pyramid') or {}
+        notes = []
+        for tier in ('top', 'mid', 'base'):
+            for position, note in enumerate(_split_notes(pyramid.get(tier))):
+                notes.append((perfume_id, tier, position, note, note.lower()))
+        self.db.executemany('INSERT INTO pyramid_notes VALUES (?, ?, ?, ?, ?)', notes)
+        accords = [(perfume_id, position, a.get('name', ''), (a.get('name') or '').lower(), a.get('w'), a.get('color'))
+                   for position, a in enumerate(record.get('accords') or [])]
+        self.db.executemany('INSERT INTO accords VALUES (?, ?, ?, ?, ?, ?)', accords)
+        terms = [(perfume_id, kind, str(value).lower())
+                 for key, kind in TERM_KINDS.items() for value in record.get(key) or []]
+        self.db.executemany('INSERT INTO perfume_terms VALUES (?, ?, ?)', terms)
+        self.db.execute(
+            'INSERT INTO perfumes_fts (rowid, brand, name, notes, accords, description) VALUES (?, ?, ?, ?, ?, ?)',
+            (perfume_id, values['brand'], values['name'],
+             ', '.join([record.get('notes') or ''] + [n[3] for n in notes]),
+             ', '.join(a[2] for a in accords), record.get('desc') or ''))
+
+    def _record_rating(self, perfume_id: int, record: Dict) -> None:
+        if record.get('rating') is not None or record.get('votes') is not None:
+            self.db.execute('INSERT INTO rating_history VALUES (?, ?, ?, ?)',
+                            (perfume_id, _now(), record.get('rating'), record.get('votes')))
+
+    def import_records(self, records: Iterable[Dict]) -> int:
+        """Replace the store's contents with records, keeping their order."""
+        self._reconciler = None
+        with self._transaction():
+            self.db.execute('DELETE FROM perfumes')
+            self.db.execute('DELETE FROM perfumes_fts')
+            count = 0
+            for i, record in enumerate(records):
+                self._write(i, record, new=True)
+                self._record_rating(i, record)
+                count += 1
+        return count
+
+    def add(self, record: Dict) -> int:
+        """Append a new perfume at the end of the catalog. Returns its id."""
+        next_id = self.db.execute('SELECT coalesce(max(id) + 1, 0) FROM perfumes').fetchone()[0]
+        with self._transaction():
+            self._write(next_id, record, new=True)
+            self._record_rating(next_id, record)
+        if self._reconciler is not None:
+            self._reconciler.add(next_id, record.get('brand'), record.get('name'), record.get('fragrantica_id'))
+        return next_id
+
+    # --- CatalogIndex interface -----------------------------------------------
+
+    def get(self, perfume_id: int) -> Optional[Dict]:
+        row = self.db.execute('SELECT doc FROM perfumes WHERE id = ?', (perfume_id,)).fetchone()
+        return json.loads(row['doc']) if row else None
+
+    @property
+    def reconciler(self):
+        if self._reconciler is None:
+            from reconcile import Reconciler
+            self._reconciler = Reconciler()
+            for row in self.db.execute('SELECT id, brand, name, fragrantica_id FROM perfumes ORDER BY id'):
+                self._reconciler.add(row['id'], row['brand'], row['name'], row['fragrantica_id'])
+        return self._reconciler
+
+    def match(self, brand: Optional[str], name: Optional[str], fid: Optional[int] = None):
+        """fragrantica_id, then exact, folded and fuzzy brand + name (a reconcile.Match or None)."""
+        return self.reconciler.match(brand, name, fid)
+
+    def find(self, brand: Optional[str], name: Optional[str], fid: Optional[int] = None) -> Optional[int]:
+        found = self.match(brand, name, fid)
+        return found.index if found else None
+
+    def apply(self, perfume_id: int, scraped_data: Dict) -> List[str]:
+        """Upsert scraped fields into one perfume. Returns the fields that changed."""
+        record = self.get(perfume_id)
+        changed = []
+        for key, value in scraped_fields(scraped_data).items():
+            if record.get(key) != value:
+                record[key] = value
+                changed.append(key)
+        if changed:
+            with self._transaction():
+                self._write(perfume_id, record, new=False)
+                if 'rating' in changed or 'votes' in changed:
+                    self._record_rating(perfume_id, record)
+        if record.get('fragrantica_id') and self._reconciler is not None:
+            self._reconciler.set_fid(perfume_id, record['fragrantica_id'])
+        return changed
+
+    def set_fields(self, perfume_id: int, fields: Dict[str, Any]) -> None:
+        """Overwrite record fields directly (None removes the field)."""
+        record = self.get(perfume_id)
+        for key, value in fields.items():
+            if value is None:
+                record.pop(key, None)
+            else:
+                record[key] = value
+        with self._transaction():
+            self._write(perfume_id, record, new=False)
+
+    def sync(self, records: List[Dict]) -> int:
+        """Take in perfumes.json as it is on disk: every record whose document differs from the
+        stored one replaces it, records past the store's end are added and stored perfumes past
+        the file's end are dropped. Rating/votes changes go to the rating history. Returns how
+        many perfumes changed."""
+        stored = {row['id']: row['doc'] for row in self.db.execute('SELECT id, doc FROM perfumes')}
+        changed = 0
+        with self._transaction():
+            for i, record in enumerate(records):
+                doc = stored.get(i)
+                if doc == json.dumps(record, ensure_ascii=False):
+                    continue
+                old = json.loads(doc) if doc is not None else {}
+                self._write(i, record, new=doc is None)
+                if (old.get('rating'), old.get('votes')) != (record.get('rating'), record.get('votes')):
+                    self._record_rating(i, record)
+                changed += 1
+            extra = [i for i in stored if i >= len(records)]
+            for i in extra:
+                self.db.execute('DELETE FROM perfumes WHERE id = ?', (i,))
+                self.db.execute('DELETE FROM perfumes_fts WHERE rowid = ?', (i,))
+        if changed or extra:
+            self._reconciler = None
+        return changed + len(extra)
+
+    # --- reads ----------------------------------------------------------------
+
+    def export(self) -> List[Dict]:
+        """All records in catalog order, exactly as perfumes.json holds them."""
+        return [json.loads(row['doc']) for row in self.db.execute('SELECT doc FROM perfumes ORDER BY id')]
+
+    def export_file(self, path: str = CATALOG_FILE) -> bool:
+        """Write perfumes.json atomically if it differs. Returns True if written."""
+        text = dump_catalog(self.export())
+        try:
+            with open(path, encoding='utf-8') as f:
+                if f.read() == text:
+                    return False
+        except FileNotFoundError:
+            pass
+        write_text_atomic(path, text)
+        return True
+
+    def query(self, note: Optional[str] = None, accord: Optional[str] = None, family: Optional[str] = None,
+              season: Optional[str] = None, min_rating: Optional[float] = None,
+              max_rating: Optional[float] = None, text: Optional[str] = None,
+              min_accord_weight: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """Perfumes matching every given filter, best rated first.
+
+        note/accord/family/season match case-insensitively and exactly; text
+        is a prefix full-text search over brand, name, notes, accords and
+        description.
+        """
+        where, params = [], []
+        if note:
+            where.append('p.id IN (SELECT perfume_id FROM pyramid_notes WHERE note_key = ?)')
+            params.append(note.lower())
+        if accord:
+            where.append('p.id IN (SELECT perfume_id FROM accords WHERE name_key = ? AND w >= ?)')
+            params += [accord.lower(), min_accord_weight]
+        if family:
+            where.append('p.family_key = ?')
+            params.append(family.lower())
+        if season:
+            where.append("p.id IN (SELECT perfume_id FROM perfume_terms WHERE kind = 'season' AND value = ?)")
+            params.append(season.lower())
+        if min_rating is not None:
+            where.append('p.rating >= ?')
+            params.append(min_rating)
+        if max_rating is not None:
+            where.append('p.rating <= ?')
+            params.append(max_rating)
+        if text:
+            where.append('p.id IN (SELECT rowid FROM perfumes_fts WHERE perfumes_fts MATCH ?)')
+            params.append(_fts_query(text))
+        sql = 'SELECT p.doc FROM perfumes p'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY p.rating IS NULL, p.rating DESC, p.id'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [json.loads(row['doc']) for row in self.db.execute(sql, params)]
+
+    def rating_history(self, perfume_id: int) -> List[Dict]:
+        rows = self.db.execute('SELECT at, rating, votes FROM rating_history WHERE perfume_id = ? ORDER BY at',
+                               (perfume_id,))
+        return [dict(row) for row in rows]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SQLite catalog store.')
+    parser.add_argument('--db', default=CATALOG_DB)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('import', help='load perfumes.json into the store (replaces its contents)')
+    p.add_argument('--catalog', default=CATALOG_FILE)
+    p = sub.add_parser('export', help='write perfumes.json from the store')
+    p.add_argument('--catalog', default=CATALOG_FILE)
+    p = sub.add_parser('query', help='find perfumes')
+    p.add_argument('--note')
+    p.add_argument('--accord')
+    p.add_argument('--family')
+    p.add_argument('--season')
+    p.add_argument('--min-rating', type=float)
+    p.add_argument('--max-rating', type=float)
+    p.add_argument('--text')
+    p.add_argument('--limit', type=int)
+    p = sub.add_parser('history', help='rating history of one perfume')
+    p.add_argument('label', help="'Brand — Name'")
+    args = parser.parse_args()
+
+    with CatalogStore(args.db) as store:
+        if args.command == 'import':
+            with open(args.catalog, encoding='utf-8') as f:
+                print(f"✅ Imported {store.import_records(json.load(f))} perfumes into {args.db}")
+        elif args.command == 'export':
+            written = store.export_file(args.catalog)
+            print(f"💾 {args.catalog} {'updated' if written else 'unchanged'} ({store.count()} perfumes)")
+            if written:
+                from build_page import refresh_page, report_refresh
+                report_refresh(refresh_page(store.export(), args.catalog))
+        elif args.command == 'query':
+            for p in store.query(note=args.note, accord=args.accord, family=args.family, season=args.season,
+                                 min_rating=args.min_rating, max_rating=args.max_rating, text=args.text,
+                                 limit=args.limit):
+                print(f"{p.get('rating') or '—':>5}  {p['brand']} — {p['name']}  ({p.get('family') or '—'})")
+        elif args.command == 'history':
+            brand, _, name = args.label.partition(' — ')
+            perfume_id = store.find(brand, name)
+            if perfume_id is None:
+                print(f"❌ Not found in catalog: {args.label}")
+                sys.exit(1)
+            print(json.dumps(store.rating_history(perfume_id), ensure_ascii=False, indent=2))
@@ -1,145 +1,157 @@
 #!/usr/bin/env python3
 """
-Merge all scraped Fragrantica data and update the perfume page HTML.
+Merge all scraped Fragrantica data into the perfume page catalog (perfumes.json).
 This script:
 1. Loads scraped data from JSON files
-2. Updates HTML file with pyramid, accords, rating, votes, year, perfumer, concentration, gender
+2. Updates perfumes.json with pyramid, accords, rating, votes, year, perfumer, concentration, gender
+   (and records fragrantica_id, so later batches can match by id)
 3. Does NOT change: brand, name, desc, tags, source, price, img, fav
+
+The catalog is loaded once into an index keyed by normalized (brand, name)
+and fragrantica_id, every batch is applied to it in order (last record wins
+per field), and the result is diffed record by record against the file on
+disk. The file is only rewritten (atomically: temp file + os.replace) when
+something actually changed.
+
+Batch files are read as streams: JSONL from fragrantica_scraper.py
+(--out FILE) or any legacy JSON/mixed-output file.
+
+Records that carry their page url (JSONL from the scraper) also update the
+refresh scheduler state (refresh_scheduler.py): last fetch time and
+rating/votes history per perfume. They are also appended to the rating
+history log (rating_history.py), and each perfume observed more than once
+in the last 30 days gets a trend field (votes gained, per day, growth,
+rating change).
+
+After a merge that writes the catalog, the index.html next to it is
+brought up to date (build_page.refresh_page): its catalog bundle is
+rebuilt when it loads one, and its first screen is pre-rendered again.
+
+--metrics FILE.json records per-stage latency and match/change counts
+(plus FILE.prom for Prometheus); --profile cpu|memory adds a profile.
+
+--db FILE.sqlite merges into the SQLite catalog store (catalog_store.py)
+instead: each matched record is an indexed upsert (the whole merge is one
+transaction), rating changes go to its rating history, and perfumes.json
+is exported from the store. An empty store is first filled from
+perfumes.json; otherwise records edited in the file since the last export
+(build_images.py srcsets, hand edits) are first synced into the store, so
+the export keeps them.
+
+Usage: merge_fragrantica_data.py [--dry-run] [--db FILE.sqlite] [--metrics FILE.json [--profile cpu|memory]] [BATCH_FILE ...]
 """
 
 import json
 import re
 import os
-from typing import Dict, Any, List, Optional
+import sys
+import tempfile
+import itertools
+import contextlib
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'skills', 'scrapingbee'))
+from metrics import METRICS, configure as configure_metrics
 
-def load_json_from_file(filepath: str) -> List[Dict]:
-    """Load JSON data from file, handling mixed raw output."""
+# File paths
+BATCH_FILES = [
+    '/tmp/fragrantica_batch1.json',
+    '/tmp/fragrantica_batch2_new.json', 
+    '/tmp/fragrantica_batch3.json',
+    '/tmp/fragrantica_batch4.json'
+]
+CATALOG_FILE = '/data/workspace/pages/perfume/perfumes.json'
+
+_DECODER = json.JSONDecoder()
+URL_ID_RE = re.compile(r'-(\d+)\.html')
+READ_CHUNK = 64 * 1024
+MAX_BUFFER = 16 * 1024 * 1024
+
+
+def _iter_json_values(f):
+    """Yield every JSON value in a text stream, skipping anything that isn't JSON.
+
+    JSONL is the fast path: one json.loads per line. Anything else (pretty
+    printed objects, whole-file arrays, scraper output mixed with log lines)
+    falls back to raw_decode over a sliding buffer that only ever holds the
+    value currently being decoded.
+    """
+    buf = ''
+    eof = False
+    while True:
+        if not buf:
+            if eof:
+                return
+            line = f.readline()
+            if not line:
+                return
+            stripped = line.strip()
+            if stripped.startswith('{') and stripped.endswith('}'):
+                try:
+                    yield json.loads(stripped)
+                    continue
+                except json.JSONDecodeError:
+                    pass
+            buf = line
+        start = min((i for i in (buf.find('{'), buf.find('[')) if i != -1), default=-1)
+        if start == -1:
+            buf = ''
+            continue
+        try:
+            value, end = _DECODER.raw_decode(buf, start)
+        except json.JSONDecodeError:
+            # Maybe the value continues past the buffer: read more and retry
+            if not eof and len(buf) < MAX_BUFFER:
+                chunk = f.read(READ_CHUNK)
+                if chunk:
+                    buf += chunk
+                    continue
+                eof = True
+                continue
+            buf = buf[start + 1:]
+            continue
+        yield value
+        buf = buf[end:]
+
+
+def _labelled_records(value):
+    """Flatten a decoded JSON value into scraped records."""
+    if isinstance(value, list):
+        for item in value:
+            yield from _labelled_records(item)
+    elif isinstance(value, dict):
+        # {"Brand — Name": {...}, ...} — records keyed by their label
+        if value and all(isinstance(v, dict) and ' — ' in k for k, v in value.items()):
+            for key, item in value.items():
+                brand, name = key.split(' — ', 1)
+                yield {**item, 'brand': brand, 'name': name}
+        else:
+            yield value
+
+
+def iter_scraped_records(filepath: str):
+    """Stream scraped records from a JSONL (or legacy JSON / mixed) file.
+
+    Records written by fragrantica_scraper.py carry url, scraped_at and
+    parser_version; fragrantica_id is filled in from the URL if missing.
+    """
     print(f"Loading {filepath}...")
     
     if not os.path.exists(filepath):
         print(f"File {filepath} not found!")
-        return []
+        return
     
+    count = 0
     with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read().strip()
-    
-    if not content:
-        print(f"File {filepath} is empty!")
-        return []
-    
-    # Handle different formats
-    if filepath.endswith('fragrantica_batch1.json'):
-        # This is object format: {"Brand — Name": {...}, ...}
-        try:
-            data = json.loads(content)
-            result = []
-            for key, value in data.items():
-                brand, name = key.split(' — ', 1)
-                value['brand'] = brand
-                value['name'] = name
-                result.append(value)
-            print(f"Loaded {len(result)} perfumes from batch1")
-            return result
-        except Exception as e:
-            print(f"Error parsing batch1: {e}")
-            return []
-    
-    elif filepath.endswith(('batch2_new.json', 'batch3.json')):
-        # These are array formats with batch_name or perfume_name
-        try:
-            data = json.loads(content)
-            result = []
-            for item in data:
-                if 'batch_name' in item:
-                    # Format: "Brand — Name"
-                    parts = item['batch_name'].split(' — ', 1)
-                    if len(parts) == 2:
-                        item['brand'] = parts[0]
-                        item['name'] = parts[1]
-                    else:
-                        item['brand'] = item['batch_name']
-                        item['name'] = item['batch_name']
-                elif 'perfume_name' in item:
-                    # Format: "Brand — Name"
-                    parts = item['perfume_name'].split(' — ', 1)
-                    if len(parts) == 2:
-                        item['brand'] = parts[0]
-                        item['name'] = parts[1]
-                    else:
-                        item['brand'] = item['perfume_name']
-                        item['name'] = item['perfume_name']
-                result.append(item)
-            print(f"Loaded {len(result)} perfumes from {os.path.basename(filepath)}")
-            return result
-        except Exception as e:
-            print(f"Error parsing {filepath}: {e}")
-            return []
-    
-    elif filepath.endswith('batch4.json'):
-        # This has raw scraper output mixed in - extract JSON objects
-        try:
-            # Find all JSON objects in the mixed content
-            json_objects = []
-            # Split by "Scraping:" to get sections
-            sections = content.split('Scraping:')
-            
-            for section in sections[1:]:  # Skip first empty section
-                # Find the JSON part (starts with {)
-                brace_start = section.find('{')
-                if brace_start == -1:
-                    continue
-                
-                # Find matching closing brace
-                brace_count = 0
-                json_start = brace_start
-                json_end = -1
-                
-                for i, char in enumerate(section[json_start:], json_start):
-                    if char == '{':
-                        brace_count += 1
-                    elif char == '}':
-                        brace_count -= 1
-                        if brace_count == 0:
-                            json_end = i + 1
-                            break
-                
-                if json_end > json_start:
-                    json_str = section[json_start:json_end]
-                    try:
-                        obj = json.loads(json_str)
-                        json_objects.append(obj)
-                    except json.JSONDecodeError as e:
-                        print(f"Failed to parse JSON object: {e}")
-                        print(f"JSON string: {json_str[:200]}...")
-            
-            # Remove duplicates by fragrantica_id
-            seen_ids = set()
-            unique_objects = []
-            for obj in json_objects:
-                fid = obj.get('fragrantica_id')
-                if fid and fid not in seen_ids:
-                    seen_ids.add(fid)
-                    unique_objects.append(obj)
-                elif not fid:
-                    unique_objects.append(obj)
-            
-            # Extract brand/name from URLs or try to infer
-            result = []
-            for obj in unique_objects:
-                # Try to get brand/name - this data seems to be missing from batch4
-                # We'll need to match by fragrantica_id later
-                result.append(obj)
-            
-            print(f"Loaded {len(result)} perfumes from batch4 (unique)")
-            return result
-            
-        except Exception as e:
-            print(f"Error parsing batch4: {e}")
-            return []
-    
-    else:
-        print(f"Unknown file format: {filepath}")
-        return []
+        for value in _iter_json_values(f):
+            for record in _labelled_records(value):
+                if not record.get('fragrantica_id') and record.get('url'):
+                    m = URL_ID_RE.search(record['url'])
+                    if m:
+                        record['fragrantica_id'] = int(m.group(1))
+                count += 1
+                yield record
+    print(f"Loaded {count} perfumes from {os.path.basename(filepath)}")
 
 def clean_perfumer_field(perfumer: str) -> Optional[str]:
     """Clean up the perfumer field that often contains HTML fragments."""
@@ -163,196 +175,318 @@ def normalize_name(name: str) -> str:
     """Normalize perfume name for matching."""
     return name.lower().strip().replace('  ', ' ')
 
-def find_perfume_in_html(brand: str, name: str, html_content: str) -> Optional[int]:
-    """Find perfume index in HTML by matching brand and name."""
-    # Extract perfume data from HTML
-    match = re.search(r'const perfumes = \[(.*?)\];', html_content, re.DOTALL)
-    if not match:
-        return None
-    
-    perfume_array = match.group(1)
-    
-    # Find individual perfume objects
-    objects = []
-    brace_count = 0
-    current_obj = ""
-    
-    for char in perfume_array:
-        current_obj += char
-        if char == '{':
-            brace_count += 1
-        elif char == '}':
-            brace_count -= 1
-            if brace_count == 0:
-                objects.append(current_obj.strip())
-                current_obj = ""
-    
-    # Search for matching perfume
-    target_brand = normalize_name(brand)
-    target_name = normalize_name(name)
-    
-    for i, obj_str in enumerate(objects):
-        # Extract brand and name
-        brand_match = re.search(r'brand\s*:\s*["\']([^"\']+)["\']', obj_str)
-        name_match = re.search(r'name\s*:\s*["\']([^"\']+)["\']', obj_str)
-        
-        if brand_match and name_match:
-            obj_brand = normalize_name(brand_match.group(1))
-            obj_name = normalize_name(name_match.group(1))
-            
-            if obj_brand == target_brand and obj_name == target_name:
-                return i
-    
-    return None
+# --- JS literal parsing -------------------------------------------------------
+# The catalog used to be a `const perfumes = [...]` JavaScript literal inside
+# index.html (unquoted keys, "..." strings) and the index_bag_* backups still
+# are. It is tokenized once, linearly, into Python objects, along with the
+# source span of every top-level object.
 
-def format_pyramid(pyramid: Dict) -> str:
-    """Format pyramid data for JavaScript."""
-    top = ', '.join(pyramid.get('top', [])) if pyramid.get('top') else ''
-    mid = ', '.join(pyramid.get('mid', [])) if pyramid.get('mid') else ''
-    base = ', '.join(pyramid.get('base', [])) if pyramid.get('base') else ''
-    
-    return f'{{top:"{top}",mid:"{mid}",base:"{base}"}}'
+PERFUMES_ARRAY_RE = re.compile(r'const perfumes = \[')
+_JS_SKIP = re.compile(r'(?:\s+|//[^\n]*|/\*.*?\*/)+', re.S)
+_JS_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"|\'((?:[^\'\\]|\\.)*)\'', re.S)
+_JS_NUMBER = re.compile(r'-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+_JS_IDENT = re.compile(r'[A-Za-z_$][\w$]*')
+_JS_KEYWORDS = {'true': True, 'false': False, 'null': None, 'undefined': None}
+_JS_ESCAPE = re.compile(r'\\(u[0-9a-fA-F]{4}|.)', re.S)
+_JS_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0'}
 
-def format_accords(accords: List[Dict]) -> str:
-    """Format accords data for JavaScript."""
-    if not accords:
-        return '[]'
-    
-    accord_strs = []
-    for accord in accords:
-        name = accord.get('name', '').replace('"', '\\"')
-        w = accord.get('w', 0)
-        color = accord.get('color', '#cccccc')
-        accord_strs.append(f'{{name:"{name}",w:{w},color:"{color}"}}')
-    
-    return f"[{','.join(accord_strs)}]"
-
-def update_perfume_in_html(html_content: str, perfume_index: int, scraped_data: Dict) -> str:
-    """Update a specific perfume in the HTML with scraped data."""
-    # Extract perfume array from HTML
-    match = re.search(r'(const perfumes = \[)(.*?)(\];)', html_content, re.DOTALL)
-    if not match:
-        return html_content
-    
-    prefix = match.group(1)
-    perfume_array = match.group(2)
-    suffix = match.group(3)
-    
-    # Find individual perfume objects
-    objects = []
-    brace_count = 0
-    current_obj = ""
-    
-    for char in perfume_array:
-        current_obj += char
-        if char == '{':
-            brace_count += 1
-        elif char == '}':
-            brace_count -= 1
-            if brace_count == 0:
-                objects.append(current_obj.strip())
-                current_obj = ""
-    
-    if perfume_index >= len(objects):
-        print(f"Error: perfume index {perfume_index} out of range")
-        return html_content
-    
-    # Update the specific perfume object
-    obj_str = objects[perfume_index]
-    
-    # Update pyramid
+
+class JSParseError(ValueError):
+    pass
+
+
+def _js_unescape(raw: str) -> str:
+    if '\\' not in raw:
+        return raw
+    def replace(m):
+        esc = m.group(1)
+        if len(esc) == 5:
+            return chr(int(esc[1:], 16))
+        return _JS_ESCAPES.get(esc, esc)
+    return _JS_ESCAPE.sub(replace, raw)
+
+
+def _js_skip(text: str, pos: int) -> int:
+    m = _JS_SKIP.match(text, pos)
+    return m.end() if m else pos
+
+
+def _js_value(text: str, pos: int):
+    """Parse one JS value starting at pos. Returns (value, end)."""
+    pos = _js_skip(text, pos)
+    ch = text[pos:pos + 1]
+    if ch == '{':
+        obj = {}
+        pos = _js_skip(text, pos + 1)
+        while text[pos:pos + 1] != '}':
+            m = _JS_STRING.match(text, pos)
+            if m:
+                key = _js_unescape(m.group(1) if m.group(1) is not None else m.group(2))
+            else:
+                m = _JS_IDENT.match(text, pos)
+                if not m:
+                    raise JSParseError(f"Expected key at offset {pos}")
+                key = m.group(0)
+            pos = _js_skip(text, m.end())
+            if text[pos:pos + 1] != ':':
+                raise JSParseError(f"Expected ':' at offset {pos}")
+            obj[key], pos = _js_value(text, pos + 1)
+            pos = _js_skip(text, pos)
+            if text[pos:pos + 1] == ',':
+                pos = _js_skip(text, pos + 1)
+            elif text[pos:pos + 1] != '}':
+                raise JSParseError(f"Expected ',' or '}}' at offset {pos}")
+        return obj, pos + 1
+    if ch == '[':
+        items = []
+        pos = _js_skip(text, pos + 1)
+        while text[pos:pos + 1] != ']':
+            item, pos = _js_value(text, pos)
+            items.append(item)
+            pos = _js_skip(text, pos)
+            if text[pos:pos + 1] == ',':
+                pos = _js_skip(text, pos + 1)
+            elif text[pos:pos + 1] != ']':
+                raise JSParseError(f"Expected ',' or ']' at offset {pos}")
+        return items, pos + 1
+    m = _JS_STRING.match(text, pos)
+    if m:
+        return _js_unescape(m.group(1) if m.group(1) is not None else m.group(2)), m.end()
+    m = _JS_NUMBER.match(text, pos)
+    if m:
+        num = m.group(0)
+        return (float(num) if any(c in num for c in '.eE') else int(num)), m.end()
+    m = _JS_IDENT.match(text, pos)
+    if m and m.group(0) in _JS_KEYWORDS:
+        return _JS_KEYWORDS[m.group(0)], m.end()
+    raise JSParseError(f"Unexpected input at offset {pos}: {text[pos:pos + 20]!r}")
+
+
+def parse_perfumes_array(html_content: str):
+    """Locate and parse `const perfumes = [...]`.
+
+    Returns (records, spans, array_start, array_end): spans[i] is the
+    (start, end) offset of record i in html_content, and array_start/end
+    delimit the text between the brackets.
+    """
+    m = PERFUMES_ARRAY_RE.search(html_content)
+    if not m:
+        raise JSParseError("`const perfumes = [` not found")
+    records, spans = [], []
+    pos = _js_skip(html_content, m.end())
+    array_start = m.end()
+    while html_content[pos:pos + 1] != ']':
+        start = pos
+        record, pos = _js_value(html_content, pos)
+        records.append(record)
+        spans.append((start, pos))
+        pos = _js_skip(html_content, pos)
+        if html_content[pos:pos + 1] == ',':
+            pos = _js_skip(html_content, pos + 1)
+        elif html_content[pos:pos + 1] != ']':
+            raise JSParseError(f"Expected ',' or ']' at offset {pos}")
+    return records, spans, array_start, pos
+
+
+# --- Merge engine --------------------------------------------------------------
+
+def format_pyramid(pyramid: Dict) -> Dict[str, str]:
+    """Pyramid as stored in the catalog: each tier is one comma-joined string."""
+    return {tier: ', '.join(pyramid.get(tier) or []) for tier in ('top', 'mid', 'base')}
+
+
+def format_accords(accords: List[Dict]) -> List[Dict]:
+    """Accords as stored in the catalog: name, weight, color."""
+    return [{'name': a.get('name', ''), 'w': a.get('w', 0), 'color': a.get('color', '#cccccc')}
+            for a in accords]
+
+
+def scraped_fields(scraped_data: Dict) -> Dict[str, Any]:
+    """Catalog field values a scraped record would write (empty values are skipped)."""
+    fields = {}
     if scraped_data.get('pyramid'):
-        pyramid_str = format_pyramid(scraped_data['pyramid'])
-        if 'pyramid:' in obj_str:
-            obj_str = re.sub(r'pyramid\s*:\s*\{[^}]*\}', f'pyramid:{pyramid_str}', obj_str)
-        else:
-            # Add pyramid before the closing brace
-            obj_str = obj_str.rstrip(' },') + f',\n    pyramid:{pyramid_str}' + obj_str[obj_str.rfind(' }'):] if obj_str.endswith(' }') else obj_str + f',pyramid:{pyramid_str}'
-    
-    # Update accords
+        fields['pyramid'] = format_pyramid(scraped_data['pyramid'])
     if scraped_data.get('accords'):
-        accords_str = format_accords(scraped_data['accords'])
-        if 'accords:' in obj_str:
-            obj_str = re.sub(r'accords\s*:\s*\[[^\]]*\]', f'accords:{accords_str}', obj_str)
-        else:
-            obj_str = obj_str.rstrip(' },') + f',\n    accords:{accords_str}' + obj_str[obj_str.rfind(' }'):] if obj_str.endswith(' }') else obj_str + f',accords:{accords_str}'
-    
-    # Update rating
-    if scraped_data.get('rating'):
-        rating = scraped_data['rating']
-        if 'rating:' in obj_str:
-            obj_str = re.sub(r'rating\s*:\s*[^,}\s]+', f'rating:{rating}', obj_str)
-        else:
-            obj_str = obj_str.rstrip(' },') + f',\n    rating:{rating}' + (obj_str[obj_str.rfind(' }'):] if obj_str.endswith(' }') else '')
-    
-    # Update votes
-    if scraped_data.get('votes'):
-        votes = scraped_data['votes']
-        if 'votes:' in obj_str:
-            obj_str = re.sub(r'votes\s*:\s*[^,}\s]+', f'votes:{votes}', obj_str)
-        else:
-            obj_str = obj_str.rstrip(' },') + f',\n    votes:{votes}' + (obj_str[obj_str.rfind(' }'):] if obj_str.endswith(' }') else '')
-    
-    # Update year
-    if scraped_data.get('year'):
-        year = scraped_data['year']
-        if 'year:' in obj_str:
-            obj_str = re.sub(r'year\s*:\s*[^,}\s]+', f'year:{year}', obj_str)
-        else:
-            obj_str = obj_str.rstrip(' },') + f',\n    year:{year}' + (obj_str[obj_str.rfind(' }'):] if obj_str.endswith(' }') else '')
-    
-    # Update perfumer
+        fields['accords'] = format_accords(scraped_data['accords'])
+    for key in ('rating', 'votes', 'year', 'concentration', 'gender'):
+        if scraped_data.get(key):
+            fields[key] = scraped_data[key]
     perfumer = clean_perfumer_field(scraped_data.get('perfumer', ''))
     if perfumer:
-        if 'perfumer:' in obj_str:
-            obj_str = re.sub(r'perfumer\s*:\s*["\'][^"\']*["\']', f'perfumer:"{perfumer}"', obj_str)
-        else:
-            obj_str = obj_str.rstrip(' },') + f',\n    perfumer:"{perfumer}"' + (obj_str[obj_str.rfind(' }'):] if obj_str.endswith(' }') else '')
-    
-    # Update concentration
-    if scraped_data.get('concentration'):
-        conc = scraped_data['concentration'].replace('"', '\\"')
-        if 'concentration:' in obj_str:
-            obj_str = re.sub(r'concentration\s*:\s*["\'][^"\']*["\']', f'concentration:"{conc}"', obj_str)
-        else:
-            obj_str = obj_str.rstrip(' },') + f',\n    concentration:"{conc}"' + (obj_str[obj_str.rfind(' }'):] if obj_str.endswith(' }') else '')
-    
-    # Update gender
-    if scraped_data.get('gender'):
-        gender = scraped_data['gender'].replace('"', '\\"')
-        if 'gender:' in obj_str:
-            obj_str = re.sub(r'gender\s*:\s*["\'][^"\']*["\']', f'gender:"{gender}"', obj_str)
-        else:
-            obj_str = obj_str.rstrip(' },') + f',\n    gender:"{gender}"' + (obj_str[obj_str.rfind(' }'):] if obj_str.endswith(' }') else '')
-    
-    # Update the object in the array
-    objects[perfume_index] = obj_str
-    
-    # Reconstruct HTML
-    new_perfume_array = ',\n\n  '.join(objects)
-    new_html = html_content.replace(match.group(0), f'{prefix}\n  {new_perfume_array}\n{suffix}')
-    
-    return new_html
+        fields['perfumer'] = perfumer
+    if scraped_data.get('fragrantica_id'):
+        fields['fragrantica_id'] = scraped_data['fragrantica_id']
+    return fields
+
+
+def resolve_brand_name(perfume: Dict) -> Tuple[Optional[str], Optional[str]]:
+    """Brand and name of a scraped record, falling back to 'Brand — Name' labels."""
+    brand, name = perfume.get('brand'), perfume.get('name')
+    if brand and name:
+        return brand, name
+    for label_key in ('batch_name', 'perfume_name'):
+        if label_key in perfume:
+            parts = perfume[label_key].split(' — ', 1)
+            return (parts[0], parts[1]) if len(parts) == 2 else (perfume[label_key], '')
+    return None, None
+
+
+class CatalogIndex:
+    """In-memory catalog; scraped records are resolved by reconcile.Reconciler."""
+
+    def __init__(self, records: List[Dict]):
+        from reconcile import Reconciler
+        self.records = records
+        self.reconciler = Reconciler()
+        for i, record in enumerate(records):
+            self.reconciler.add(i, record.get('brand'), record.get('name'), record.get('fragrantica_id'))
+
+    def match(self, brand: Optional[str], name: Optional[str], fid: Optional[int] = None):
+        """fragrantica_id, then exact, folded and fuzzy brand + name (a reconcile.Match or None)."""
+        return self.reconciler.match(brand, name, fid)
+
+    def find(self, brand: Optional[str], name: Optional[str], fid: Optional[int] = None) -> Optional[int]:
+        found = self.match(brand, name, fid)
+        return found.index if found else None
+
+    def apply(self, index: int, scraped_data: Dict) -> List[str]:
+        """Write scraped fields into record `index`. Returns the fields that changed."""
+        record = self.records[index]
+        changed = []
+        for key, value in scraped_fields(scraped_data).items():
+            if record.get(key) != value:
+                record[key] = value
+                changed.append(key)
+        if record.get('fragrantica_id'):
+            self.reconciler.set_fid(index, record['fragrantica_id'])
+        return changed
+
+    def batch(self):
+        """CatalogStore commits a batch of apply() calls at once; in memory there is nothing to do."""
+        return contextlib.nullcontext(self)
+
+
+def merge_updates(index: CatalogIndex, updates: Iterable[Dict]) -> Dict[str, Any]:
+    """Apply all scraped updates to the index in order.
+
+    Updates are applied in the order given (batch order), so when several
+    records target the same perfume each field ends up with the value from
+    the last record that provides it.
+
+    Records that came from a real fetch (they carry the page url) are also
+    returned as fetch observations for the refresh scheduler, and records
+    that only matched fuzzily are listed so the pairing can be checked.
+    """
+    changed: Dict[int, set] = {}
+    matched: Dict[int, int] = {}
+    missing = []
+    fetches = []
+    fuzzy = []
+    processed = 0
+    for perfume in updates:
+        processed += 1
+        brand, name = resolve_brand_name(perfume)
+        found = index.match(brand, name, perfume.get('fragrantica_id'))
+        if found is None:
+            label = f"{brand} — {name}" if brand else f"fragrantica_id {perfume.get('fragrantica_id')}"
+            missing.append(label)
+            continue
+        i = found.index
+        if found.method == 'fuzzy':
+            fuzzy.append((f"{brand} — {name}", i, found.score))
+        matched[i] = matched.get(i, 0) + 1
+        fields = index.apply(i, perfume)
+        if fields:
+            changed.setdefault(i, set()).update(fields)
+        if perfume.get('url'):
+            fetches.append({'index': i, 'url': perfume['url'], 'scraped_at': perfume.get('scraped_at'),
+                            'rating': perfume.get('rating'), 'votes': perfume.get('votes'),
+                            'changed': sorted(fields)})
+    return {'changed': changed, 'matched': matched, 'missing': missing, 'processed': processed,
+            'fetches': fetches, 'fuzzy': fuzzy}
+
+
+# --- perfumes.json I/O ----------------------------------------------------------
+
+def dump_catalog(records: List[Dict]) -> str:
+    """Serialize the catalog exactly the way perfumes.json is formatted."""
+    return json.dumps(records, ensure_ascii=False, indent=2)
+
+
+def write_text_atomic(path: str, text: str) -> None:
+    """Write text to path via a temp file in the same directory + os.replace."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp, os.stat(path).st_mode & 0o777)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def diff_catalogs(old: List[Dict], new: List[Dict]) -> Dict[int, Dict[str, Tuple[Any, Any]]]:
+    """Per-record field changes: {index: {field: (old_value, new_value)}}."""
+    changes = {}
+    for i, (before, after) in enumerate(zip(old, new)):
+        if before == after:
+            continue
+        fields = {}
+        for key in list(before) + [k for k in after if k not in before]:
+            if before.get(key) != after.get(key):
+                fields[key] = (before.get(key), after.get(key))
+        changes[i] = fields
+    # Records only the new catalog has (the SQLite store can grow)
+    for i in range(len(old), len(new)):
+        changes[i] = {key: (None, value) for key, value in new[i].items()}
+    return changes
+
+
+def _short(value: Any, limit: int = 60) -> str:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def print_change_summary(records: List[Dict], changes: Dict[int, Dict[str, Tuple[Any, Any]]]) -> None:
+    """Per-record and per-field summary of what the merge changed."""
+    field_counts: Dict[str, int] = {}
+    for i, fields in sorted(changes.items()):
+        record = records[i]
+        print(f"✏️  {record.get('brand')} — {record.get('name')}")
+        for field, (before, after) in fields.items():
+            field_counts[field] = field_counts.get(field, 0) + 1
+            if field in ('pyramid', 'accords'):
+                print(f"      {field}: updated")
+            else:
+                print(f"      {field}: {_short(before) if before is not None else '∅'} → {_short(after)}")
+    if field_counts:
+        summary = ', '.join(f"{field} ×{n}" for field, n in sorted(field_counts.items(), key=lambda x: -x[1]))
+        print(f"\n📋 Changed fields: {summary}")
+
 
 def main():
     """Main function to merge all Fragrantica data."""
     print("🔄 Starting Fragrantica data merge...")
     
-    # File paths
-    batch_files = [
-        '/tmp/fragrantica_batch1.json',
-        '/tmp/fragrantica_batch2_new.json', 
-        '/tmp/fragrantica_batch3.json',
-        '/tmp/fragrantica_batch4.json'
-    ]
-    
-    html_file = '/data/workspace/pages/perfume/index.html'
-    
-    # Load all scraped data
-    all_perfumes = []
-    for filepath in batch_files:
-        batch_data = load_json_from_file(filepath)
-        all_perfumes.extend(batch_data)
+    argv = sys.argv[1:]
+    options = {'--metrics': None, '--profile': None, '--db': None}
+    for flag in options:
+        if flag in argv:
+            i = argv.index(flag)
+            options[flag] = argv[i + 1]
+            del argv[i:i + 2]
+    if options['--metrics']:
+        configure_metrics(options['--metrics'], options['--profile'])
+    args = [a for a in argv if not a.startswith('--')]
+    batch_files = args or BATCH_FILES
+    catalog_file = CATALOG_FILE
+    dry_run = '--dry-run' in argv
     
     # Add Delina data (manually parsed from HTML)
     delina_data = {
@@ -361,55 +495,119 @@ def main():
         'rating': 3.98,
         'votes': 12572
     }
-    all_perfumes.append(delina_data)
     
-    print(f"\n📊 Total perfumes loaded: {len(all_perfumes)}")
+    # Scraped data is streamed from the batch files straight into the merge
+    all_perfumes = itertools.chain.from_iterable(
+        [iter_scraped_records(filepath) for filepath in batch_files] + [[delina_data]])
     
-    # Load HTML file
-    if not os.path.exists(html_file):
-        print(f"❌ HTML file not found: {html_file}")
+    # Load the catalog
+    if not os.path.exists(catalog_file):
+        print(f"❌ Catalog not found: {catalog_file}")
         return
     
-    with open(html_file, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    # Update perfumes in HTML
-    updated_count = 0
-    
-    for perfume in all_perfumes:
-        brand = perfume.get('brand')
-        name = perfume.get('name') 
-        
-        if not brand or not name:
-            # Try to extract from batch_name or perfume_name
-            if 'batch_name' in perfume:
-                parts = perfume['batch_name'].split(' — ', 1)
-                brand, name = parts if len(parts) == 2 else (perfume['batch_name'], '')
-            elif 'perfume_name' in perfume:
-                parts = perfume['perfume_name'].split(' — ', 1)
-                brand, name = parts if len(parts) == 2 else (perfume['perfume_name'], '')
-            else:
-                print(f"⚠️  Skipping perfume with missing brand/name: {perfume}")
-                continue
-        
-        # Find perfume in HTML
-        perfume_index = find_perfume_in_html(brand, name, html_content)
-        
-        if perfume_index is not None:
-            print(f"✅ Updating: {brand} — {name}")
-            html_content = update_perfume_in_html(html_content, perfume_index, perfume)
-            updated_count += 1
+    with METRICS.timer('merge_stage_seconds', stage='load_catalog'):
+        with open(catalog_file, 'r', encoding='utf-8') as f:
+            current_text = f.read()
+        original = json.loads(current_text)
+        if options['--db']:
+            from catalog_store import CatalogStore
+            store = CatalogStore(options['--db'])
+            if store.count() == 0:
+                store.import_records(original)
+                print(f"🗄  Store {options['--db']} created from {catalog_file}")
+            index = store
         else:
-            print(f"❌ Not found in HTML: {brand} — {name}")
-    
-    # Write updated HTML back to file
-    with open(html_file, 'w', encoding='utf-8') as f:
-        f.write(html_content)
-    
-    print(f"\n🎉 Update complete!")
-    print(f"   📄 Updated {updated_count} perfumes")
-    print(f"   📊 Total perfumes processed: {len(all_perfumes)}")
-    print(f"   💾 HTML file updated: {html_file}")
+            records = json.loads(current_text)
+            index = CatalogIndex(records)
+    
+    # Apply every batch to the index (batch files are read as they stream in)
+    if options['--db'] and dry_run:
+        # Upserts commit as they go: a dry run merges into a scratch copy of the store
+        scratch = CatalogStore(':memory:')
+        index.db.backup(scratch.db)
+        index.close()
+        index = scratch
+    if options['--db']:
+        # perfumes.json is the newer copy of anything written to it outside the store
+        synced = index.sync(original)
+        if synced:
+            print(f"🗄  {synced} perfumes edited in {catalog_file} synced into the store")
+    with METRICS.timer('merge_stage_seconds', stage='merge'):
+        with index.batch():
+            result = merge_updates(index, all_perfumes)
+    if options['--db']:
+        records = index.export()
+    
+    # Append this merge's rating/votes observations to the history log and
+    # export the trends over the last TREND_DAYS (rating_history.py movers)
+    import rating_history
+    with METRICS.timer('merge_stage_seconds', stage='trends'):
+        history = rating_history.RatingHistory()
+        observations = rating_history.fetch_observations(records, result['fetches'])
+        appended = history.append(observations) if not dry_run else 0
+        trends = history.trends(extra=observations if dry_run else ())
+        with index.batch():
+            for i in rating_history.apply_trends(records, trends):
+                if options['--db']:
+                    index.set_fields(i, {'trend': records[i].get('trend')})
+    if options['--db']:
+        index.close()
+    METRICS.inc('merge_records_total', len(result['matched']), result='matched')
+    METRICS.inc('merge_records_total', len(result['missing']), result='missing')
+    METRICS.inc('merge_records_total', len(result['changed']), result='changed')
+    METRICS.inc('merge_records_total', len(result['fuzzy']), result='fuzzy')
+    print(f"\n📊 Total perfumes loaded: {result['processed']}")
+    for label in result['missing']:
+        print(f"❌ Not found in catalog: {label}")
+    for label, i, score in result['fuzzy']:
+        print(f"🔎 Fuzzy match: {label} → {records[i]['brand']} — {records[i]['name']} ({score})")
+    
+    # Diff against what is on disk and write only if something changed
+    with METRICS.timer('merge_stage_seconds', stage='diff'):
+        changes = diff_catalogs(original, records)
+    print_change_summary(records, changes)
+    with METRICS.timer('merge_stage_seconds', stage='serialize'):
+        new_text = dump_catalog(records)
+    written = bool(changes) and new_text != current_text and not dry_run
+    refreshed = {}
+    if written:
+        with METRICS.timer('merge_stage_seconds', stage='write'):
+            write_text_atomic(catalog_file, new_text)
+        # Snapshot the catalog as it was and as it is now (snapshots.py log/diff/restore);
+        # the "before" one is skipped when the last merge already recorded it
+        from snapshots import SnapshotStore
+        snapshot_store = SnapshotStore()
+        with METRICS.timer('merge_stage_seconds', stage='snapshot'):
+            snapshot_store.commit(original, 'before merge')
+            snapshot = snapshot_store.commit(records, 'merge: ' + ', '.join(os.path.basename(f) for f in batch_files))
+        # Rebuild the bundle and the first screen of the page next to the catalog (build_page.py)
+        from build_page import refresh_page, report_refresh
+        with METRICS.timer('merge_stage_seconds', stage='prerender'):
+            refreshed = refresh_page(records, catalog_file)
+    
+    # Feed fetch times and rating/votes movement to the refresh scheduler
+    if result['fetches'] and not dry_run:
+        import refresh_scheduler
+        state = refresh_scheduler.load_state()
+        for fetch in result['fetches']:
+            refresh_scheduler.observe(state, records[fetch['index']], fetch['url'], fetch['scraped_at'],
+                                      fetch['rating'], fetch['votes'], fetch['changed'])
+        refresh_scheduler.save_state(state)
+        print(f"   🕒 Refresh state updated for {len(result['fetches'])} fetches")
+    if appended or trends:
+        print(f"   📈 Rating history: +{appended} observations, {len(trends)} perfumes with a trend")
+    
+    print("\n🎉 Update complete!")
+    print(f"   📄 Changed {len(changes)} perfumes ({len(result['matched'])} matched)")
+    print(f"   📊 Total perfumes processed: {result['processed']}")
+    if dry_run:
+        print(f"   🧪 Dry run: {catalog_file} not written")
+    else:
+        print(f"   💾 {catalog_file} {'updated' if written else 'unchanged'}")
+        if written and snapshot:
+            print(f"   📸 Snapshot {snapshot['id']} (+{snapshot['added']} ~{snapshot['changed']} -{snapshot['removed']})")
+        if written:
+            report_refresh(refreshed)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
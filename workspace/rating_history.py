@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Append-only history of Fragrantica rating/votes observations.
+
+The merge overwrites rating and votes in place; every fetch it merges is
+also appended here, so the movement over time is kept:
+
+  <root>/YYYY-MM.bin   one segment per calendar month (UTC) of the
+                       observation time; fixed ROW.size-byte rows,
+                       little-endian, in arrival order:
+                         fragrantica_id  u32
+                         ts              u32  unix seconds
+                         rating          f32  NaN when unknown
+                         votes           u32  NO_VOTES when unknown
+
+A row is 16 bytes, so a year of daily fetches of 10,000 perfumes is about
+58 MB. Window queries only open the segments that overlap the window and
+stream their rows (struct.iter_unpack over an mmap, READ_ROWS rows at a
+time), keeping the first and last observation per perfume: memory grows
+with the number of perfumes in the window, not with the history. Appending the same
+(fragrantica_id, ts) twice is a no-op, so re-merging a batch file is safe.
+
+Trends over a window compare the first and last observation in it:
+  votes        votes gained            votes_per_day   votes / days
+  growth       votes / first votes     rating          rating change
+The merge exports them into perfumes.json as trend: {...} (TREND_DAYS
+window, perfumes observed at least MIN_SPAN_DAYS apart).
+
+Usage:
+  rating_history.py show FRAGRANTICA_ID [--days N]
+  rating_history.py movers [--days N] [--by votes_per_day|growth|votes|rating] [--top K]
+  rating_history.py stats
+  rating_history.py import-refresh   seed from refresh_scheduler state histories
+"""
+
+import os
+import re
+import sys
+import math
+import mmap
+import fcntl
+import heapq
+import itertools
+import struct
+import argparse
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+from merge_fragrantica_data import CATALOG_FILE, URL_ID_RE
+
+HISTORY_DIR = '/data/workspace/state/rating_history'
+ROW = struct.Struct('<IIfI')
+NO_VOTES = 0xFFFFFFFF
+READ_ROWS = 4096
+TREND_DAYS = 30
+MIN_SPAN_DAYS = 1.0
+TOP_K = 10
+MOVER_KEYS = ('votes_per_day', 'growth', 'votes', 'rating')
+
+_SEGMENT_RE = re.compile(r'^(\d{4})-(\d{2})\.bin$')
+
+Observation = Tuple[int, int, Optional[float], Optional[int]]
+
+
+def to_timestamp(value: Optional[str]) -> int:
+    """Unix seconds for an ISO time (naive means UTC); now when missing or unparseable."""
+    try:
+        parsed = datetime.fromisoformat(value) if value else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        return int(datetime.now(timezone.utc).timestamp())
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def fragrantica_id_of(record: Dict, url: Optional[str] = None) -> Optional[int]:
+    if record.get('fragrantica_id'):
+        return int(record['fragrantica_id'])
+    found = URL_ID_RE.search(url or '')
+    return int(found.group(1)) if found else None
+
+
+def _month(ts: int) -> Tuple[int, int]:
+    at = datetime.fromtimestamp(ts, timezone.utc)
+    return at.year, at.month
+
+
+def _unpack(row: Tuple[int, int, float, int]) -> Observation:
+    fid, ts, rating, votes = row
+    return fid, ts, None if math.isnan(rating) else rating, None if votes == NO_VOTES else votes
+
+
+class RatingHistory:
+    def __init__(self, root: str = HISTORY_DIR):
+        self.root = root
+
+    def _segment_path(self, year: int, month: int) -> str:
+        return os.path.join(self.root, f"{year:04d}-{month:02d}.bin")
+
+    def segments(self) -> List[Tuple[int, int]]:
+        """(year, month) of every segment, oldest first."""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        found = (_SEGMENT_RE.match(name) for name in names)
+        return sorted((int(m.group(1)), int(m.group(2))) for m in found if m)
+
+    @staticmethod
+    def _read(path: str) -> Iterator[Tuple[int, int, float, int]]:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            size -= size % ROW.size  # ignore a torn last row
+            if not size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                step = READ_ROWS * ROW.size
+                for start in range(0, size, step):
+                    yield from ROW.iter_unpack(mapped[start:min(start + step, size)])
+
+    def append(self, observations: Iterable[Observation]) -> int:
+        """Append (fragrantica_id, ts, rating, votes) rows; returns how many were new."""
+        by_segment: Dict[Tuple[int, int], List[Observation]] = {}
+        for obs in observations:
+            if obs[0] and (obs[2] is not None or obs[3] is not None):
+                by_segment.setdefault(_month(obs[1]), []).append(obs)
+        if not by_segment:
+            return 0
+        os.makedirs(self.root, exist_ok=True)
+        added = 0
+        for (year, month), rows in sorted(by_segment.items()):
+            with open(self._segment_path(year, month), 'a+b') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    data = f.read()
+                    whole = len(data) - len(data) % ROW.size
+                    seen = {(fid, ts) for fid, ts, _, _ in ROW.iter_unpack(data[:whole])}
+                    packed = []
+                    for fid, ts, rating, votes in rows:
+                        if (fid, ts) in seen:
+                            continue
+                        seen.add((fid, ts))
+                        packed.append(ROW.pack(fid, ts, math.nan if rating is None else rating,
+                                               NO_VOTES if votes is None else votes))
+                    if packed:
+                        # Cut a torn last row first, or every row after it would be misaligned
+                        if whole != len(data):
+                            f.truncate(whole)
+                        f.seek(whole)
+                        f.write(b''.join(packed))
+                        f.flush()
+                    added += len(packed)
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        return added
+
+    def rows(self, since: Optional[int] = None, until: Optional[int] = None) -> Iterator[Observation]:
+        """Observations with since <= ts <= until, reading only the segments that can hold them."""
+        first = _month(since) if since is not None else None
+        last = _month(until) if until is not None else None
+        for year, month in self.segments():
+            if (first and (year, month) < first) or (last and (year, month) > last):
+                continue
+            for row in self._read(self._segment_path(year, month)):
+                ts = row[1]
+                if (since is None or ts >= since) and (until is None or ts <= until):
+                    yield _unpack(row)
+
+    def series(self, fid: int, since: Optional[int] = None) -> List[Observation]:
+        return sorted((row for row in self.rows(since) if row[0] == fid), key=lambda row: row[1])
+
+    def window(self, since: int, until: int,
+               extra: Iterable[Observation] = ()) -> Dict[int, Tuple[Observation, Observation]]:
+        """First and last observation (by time) of every perfume seen in [since, until]."""
+        ends: Dict[int, Tuple[Observation, Observation]] = {}
+        extra = [row for row in extra if since <= row[1] <= until]
+        for row in itertools.chain(self.rows(since, until), extra):
+            found = ends.get(row[0])
+            if found is None:
+                ends[row[0]] = (row, row)
+            else:
+                first, last = found
+                ends[row[0]] = (row if row[1] < first[1] else first, row if row[1] >= last[1] else last)
+        return ends
+
+    def trends(self, days: float = TREND_DAYS, now: Optional[int] = None,
+               extra: Iterable[Observation] = ()) -> Dict[int, Dict[str, Any]]:
+        """Trend per fragrantica_id over the last `days` (extra: rows not yet appended)."""
+        now = now if now is not None else int(datetime.now(timezone.utc).timestamp())
+        found = {}
+        for fid, (first, last) in self.window(now - int(days * 86400), now, extra).items():
+            span = (last[1] - first[1]) / 86400
+            if span < MIN_SPAN_DAYS:
+                continue
+            trend: Dict[str, Any] = {'days': round(span, 1),
+                                     'since': datetime.fromtimestamp(first[1], timezone.utc).date().isoformat()}
+            if first[3] is not None and last[3] is not None:
+                trend['votes'] = last[3] - first[3]
+                trend['votes_per_day'] = round(trend['votes'] / span, 2)
+                if first[3]:
+                    trend['growth'] = round(trend['votes'] / first[3], 4)
+            if first[2] is not None and last[2] is not None:
+                trend['rating'] = round(last[2] - first[2], 3)
+            if len(trend) > 2:
+                found[fid] = trend
+        return found
+
+    def top_movers(self, days: float = TREND_DAYS, by: str = 'votes_per_day', k: int = TOP_K,
+                   now: Optional[int] = None) -> List[Tuple[int, Dict[str, Any]]]:
+        trends = self.trends(days, now)
+        scored = [(fid, t) for fid, t in trends.items() if t.get(by) is not None]
+        return heapq.nlargest(k, scored, key=lambda item: (item[1][by], -item[0]))
+
+    def stats(self) -> Dict[str, Any]:
+        segments = self.segments()
+        sizes = [os.path.getsize(self._segment_path(y, m)) for y, m in segments]
+        return {'directory': self.root, 'segments': len(segments), 'rows': sum(sizes) // ROW.size,
+                'bytes': sum(sizes),
+                'first_month': f"{segments[0][0]}-{segments[0][1]:02d}" if segments else None,
+                'last_month': f"{segments[-1][0]}-{segments[-1][1]:02d}" if segments else None}
+
+
+def fetch_observations(records: List[Dict], fetches: List[Dict]) -> List[Observation]:
+    """History rows for merge_updates()' fetch list (records as merged, for their fragrantica_id)."""
+    rows = []
+    for fetch in fetches:
+        fid = fragrantica_id_of(records[fetch['index']], fetch.get('url'))
+        if fid:
+            rows.append((fid, to_timestamp(fetch.get('scraped_at')), fetch.get('rating'), fetch.get('votes')))
+    return rows
+
+
+def apply_trends(records: List[Dict], trends: Dict[int, Dict[str, Any]]) -> List[int]:
+    """Set (or drop) the trend field of every record from trends by fragrantica_id.
+    Returns the indexes of the records whose trend changed."""
+    changed = []
+    for i, record in enumerate(records):
+        trend = trends.get(record.get('fragrantica_id'))
+        if trend == record.get('trend'):
+            continue
+        if trend:
+            record['trend'] = trend
+        else:
+            record.pop('trend', None)
+        changed.append(i)
+    return changed
+
+
+def _labels() -> Dict[int, str]:
+    import json
+    try:
+        with open(CATALOG_FILE, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {r['fragrantica_id']: f"{r['brand']} — {r['name']}" for r in records if r.get('fragrantica_id')}
+
+
+def _format_trend(trend: Dict[str, Any]) -> str:
+    parts = []
+    if 'votes' in trend:
+        parts.append(f"{trend['votes']:+d} votes ({trend['votes_per_day']:+.1f}/day")
+        parts[-1] += f", {trend['growth']:+.1%})" if 'growth' in trend else ')'
+    if 'rating' in trend:
+        parts.append(f"rating {trend['rating']:+.2f}")
+    return ', '.join(parts) + f" over {trend['days']} days"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rating/votes history of the catalog.')
+    parser.add_argument('--dir', default=HISTORY_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('show')
+    p.add_argument('fragrantica_id', type=int)
+    p.add_argument('--days', type=float)
+    p = sub.add_parser('movers')
+    p.add_argument('--days', type=float, default=TREND_DAYS)
+    p.add_argument('--by', choices=MOVER_KEYS, default='votes_per_day')
+    p.add_argument('--top', type=int, default=TOP_K)
+    sub.add_parser('stats')
+    sub.add_parser('import-refresh', help='append the histories kept in the refresh scheduler state')
+    args = parser.parse_args()
+
+    history = RatingHistory(args.dir)
+    if args.command == 'show':
+        since = None
+        if args.days:
+            since = int((datetime.now(timezone.utc) - timedelta(days=args.days)).timestamp())
+        rows = history.series(args.fragrantica_id, since)
+        if not rows:
+            print(f"No history for {args.fragrantica_id}")
+            sys.exit(1)
+        for _, ts, rating, votes in rows:
+            at = datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec='minutes')
+            print(f"{at}  rating {'—' if rating is None else f'{rating:.2f}'}  votes {'—' if votes is None else votes}")
+    elif args.command == 'movers':
+        labels = _labels()
+        movers = history.top_movers(args.days, args.by, args.top)
+        if not movers:
+            print(f"No perfume observed twice in the last {args.days:g} days")
+        for rank, (fid, trend) in enumerate(movers, 1):
+            print(f"{rank:>3}. {labels.get(fid, f'fragrantica_id {fid}')}: {_format_trend(trend)}")
+    elif args.command == 'stats':
+        for key, value in history.stats().items():
+            print(f"{key}: {value}")
+    elif args.command == 'import-refresh':
+        import refresh_scheduler
+        rows = []
+        for key, entry in refresh_scheduler.load_state().get('entries', {}).items():
+            fid = int(key[3:]) if key.startswith('id:') else fragrantica_id_of({}, entry.get('url'))
+            for obs in entry.get('history', []):
+                rows.append((fid, to_timestamp(obs.get('at')), obs.get('rating'), obs.get('votes')))
+        print(f"📈 {history.append(rows)} observations added ({len(rows)} in the refresh state)")
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Reconcile scraped records with catalog entries.
+
+Scraped brand/name pairs often differ from the catalog's spelling:
+Cyrillic vs Latin ("Вишнёвый" / "Vishnevyy"), accents ("Gumìn" / "Gumin"),
+"N°1" / "No 1" / "N1", "&" / "and", an "EDP" suffix, "MFK" / "Maison
+Francis Kurkdjian". Reconciler resolves a scraped record in this order:
+
+  1. fragrantica_id  authoritative once known: a hit wins, and a catalog
+                     entry that already has a different id is never
+                     matched by name
+  2. exact           normalize_name(brand), normalize_name(name)
+  3. folded          both sides transliterated to Latin, accents stripped,
+                     number signs and '&' unified, concentration words
+                     dropped, brand abbreviations expanded
+  4. fuzzy           character trigram blocking plus scored ranking
+
+Fuzzy candidates come from an inverted index of name trigrams. Only the
+rarest trigrams of the query are looked up: any name with a trigram Dice
+of at least BLOCK_DICE shares ceil(BLOCK_DICE·q/2) of the query's q
+trigrams, so it must appear in one of the q - that + 1 rarest posting
+lists. A lookup reads a few short lists instead of the whole catalog.
+Candidates are scored by trigram Dice and difflib ratio on the name,
+blended with a brand score; names whose numbers differ ("Molecule 01" /
+"Molecule 02", "No 5" / "No 19") are different perfumes and never
+candidates. The best must reach MIN_SCORE and beat the runner-up by
+MARGIN, otherwise nothing is matched (a miss is reported, a wrong merge
+would silently overwrite another perfume).
+
+Usage: reconcile.py [--catalog FILE] "Brand — Name" ...
+"""
+
+import re
+import sys
+import json
+import math
+import heapq
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from merge_fragrantica_data import normalize_name, CATALOG_FILE
+
+MIN_SCORE = 0.8
+MARGIN = 0.05
+BRAND_MIN = 0.6
+NAME_WEIGHT = 0.7
+BLOCK_DICE = 0.5
+MAX_CANDIDATES = 50
+
+CYRILLIC = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh',
+    'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+# Letters NFKD does not decompose into base letter + accent
+LETTERS = {'ß': 'ss', 'æ': 'ae', 'œ': 'oe', 'ø': 'o', 'ł': 'l', 'đ': 'd', 'ð': 'd', 'þ': 'th'}
+_TRANSLATE = str.maketrans({**CYRILLIC, **LETTERS})
+
+# Folded brand spellings the catalog abbreviates (or the other way round)
+BRAND_ALIASES = {
+    'mfk': 'maison francis kurkdjian',
+    'ysl': 'yves saint laurent',
+    'd and g': 'dolce and gabbana',
+    'dg': 'dolce and gabbana',
+    'pdm': 'parfums de marly',
+    'jhag': 'juliette has a gun',
+    'tf': 'tom ford',
+    'lv': 'louis vuitton',
+}
+
+_NUMBER_RE = re.compile(r'\bn\s*[o°]?\s*\.?\s*(\d+)')
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+_DIGITS_RE = re.compile(r'\d+')
+_CONCENTRATION_RE = re.compile(r'\b(?:eau de (?:parfum|toilette|cologne)|extrait de parfum|extrait'
+                               r'|edp|edt|edc|parfum|cologne)\b')
+
+
+class Match(NamedTuple):
+    index: int
+    score: float
+    method: str  # 'fragrantica_id', 'exact', 'folded' or 'fuzzy'
+
+
+def fold(text: str) -> str:
+    """Lower-case ASCII form: Cyrillic transliterated, accents stripped, N°/No/№ and & unified."""
+    text = (text or '').lower().translate(_TRANSLATE)
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c)).lower()
+    text = _NUMBER_RE.sub(r' no\1 ', text.replace('&', ' and '))
+    return ' '.join(_NON_ALNUM_RE.sub(' ', text).split())
+
+
+def name_key(name: str) -> str:
+    folded = fold(name)
+    stripped = ' '.join(_CONCENTRATION_RE.sub(' ', folded).split())
+    # "Extrait de Parfum" can be the whole name
+    return stripped or folded
+
+
+def brand_key(brand: str) -> str:
+    folded = fold(brand)
+    return BRAND_ALIASES.get(folded, folded)
+
+
+def trigrams(key: str) -> Set[str]:
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def dice(a: Set[str], b: Set[str]) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+def brand_similarity(a: str, b: str, a_grams: Set[str], b_grams: Set[str]) -> float:
+    """1.0 for equal brands or when one is the other plus words ("Kilian" / "By Kilian")."""
+    if a == b:
+        return 1.0
+    a_words, b_words = set(a.split()), set(b.split())
+    shorter = a if len(a) < len(b) else b
+    if len(shorter) >= 3 and (a_words <= b_words or b_words <= a_words):
+        return 1.0
+    return dice(a_grams, b_grams)
+
+
+class Reconciler:
+    """Lookup of catalog entries (by any int key) from scraped brand, name and fragrantica_id."""
+
+    def __init__(self):
+        self.by_fid: Dict[int, int] = {}
+        self.fid_of: Dict[int, int] = {}
+        self.by_exact: Dict[Tuple[str, str], int] = {}
+        self.by_folded: Dict[Tuple[str, str], int] = {}
+        self.entries: Dict[int, Tuple[str, str, Set[str]]] = {}
+        self.postings: Dict[str, List[int]] = {}
+        self.brand_grams: Dict[str, Set[str]] = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, index: int, brand: Optional[str], name: Optional[str], fid: Optional[int] = None) -> None:
+        brand, name = brand or '', name or ''
+        self.by_exact.setdefault((normalize_name(brand), normalize_name(name)), index)
+        bkey, nkey = brand_key(brand), name_key(name)
+        self.by_folded.setdefault((bkey, nkey), index)
+        grams = trigrams(nkey)
+        self.entries[index] = (bkey, nkey, grams)
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(index)
+        if bkey not in self.brand_grams:
+            self.brand_grams[bkey] = trigrams(bkey)
+        if fid:
+            self.set_fid(index, fid)
+
+    def set_fid(self, index: int, fid: int) -> None:
+        self.by_fid.setdefault(fid, index)
+        self.fid_of[index] = fid
+
+    def _allowed(self, index: int, fid: Optional[int]) -> bool:
+        known = self.fid_of.get(index)
+        return not (fid and known and known != fid)
+
+    def candidates(self, grams: Set[str]) -> List[int]:
+        """Entries sharing enough trigrams to possibly reach BLOCK_DICE, most shared first."""
+        if not grams:
+            return []
+        need = max(1, math.ceil(BLOCK_DICE * len(grams) / 2))
+        lists = sorted((self.postings.get(g, ()) for g in grams), key=len)
+        shared: Dict[int, int] = {}
+        for posting in lists[:len(grams) - need + 1]:
+            for i in posting:
+                shared[i] = shared.get(i, 0) + 1
+        return heapq.nlargest(MAX_CANDIDATES, shared, key=shared.get)
+
+    def rank(self, brand: str, name: str, fid: Optional[int] = None) -> List[Tuple[float, int]]:
+        """Scored fuzzy candidates, best first."""
+        bkey, nkey = brand_key(brand), name_key(name)
+        grams = trigrams(nkey)
+        bgrams = self.brand_grams.get(bkey) or trigrams(bkey)
+        numbers = _DIGITS_RE.findall(nkey)
+        scored = []
+        for i in self.candidates(grams):
+            if not self._allowed(i, fid):
+                continue
+            cand_brand, cand_name, cand_grams = self.entries[i]
+            if _DIGITS_RE.findall(cand_name) != numbers:
+                continue
+            brand_score = brand_similarity(bkey, cand_brand, bgrams, self.brand_grams[cand_brand])
+            if brand_score < BRAND_MIN:
+                continue
+            name_score = (dice(grams, cand_grams) + SequenceMatcher(None, nkey, cand_name).ratio()) / 2
+            scored.append((NAME_WEIGHT * name_score + (1 - NAME_WEIGHT) * brand_score, i))
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        return scored
+
+    def match(self, brand: Optional[str], name: Optional[str], fid: Optional[int] = None) -> Optional[Match]:
+        if fid and fid in self.by_fid:
+            return Match(self.by_fid[fid], 1.0, 'fragrantica_id')
+        if not (brand and name):
+            return None
+        i = self.by_exact.get((normalize_name(brand), normalize_name(name)))
+        if i is not None and self._allowed(i, fid):
+            return Match(i, 1.0, 'exact')
+        i = self.by_folded.get((brand_key(brand), name_key(name)))
+        if i is not None and self._allowed(i, fid):
+            return Match(i, 1.0, 'folded')
+        ranked = self.rank(brand, name, fid)
+        if not ranked or ranked[0][0] < MIN_SCORE:
+            return None
+        if len(ranked) > 1 and ranked[0][0] - ranked[1][0] < MARGIN:
+            return None
+        return Match(ranked[0][1], round(ranked[0][0], 3), 'fuzzy')
+
+
+def main():
+    args = sys.argv[1:]
+    catalog_file = CATALOG_FILE
+    if '--catalog' in args:
+        i = args.index('--catalog')
+        catalog_file = args[i + 1]
+        del args[i:i + 2]
+    if not args:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+
+    with open(catalog_file, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    reconciler = Reconciler()
+    for i, record in enumerate(records):
+        reconciler.add(i, record.get('brand'), record.get('name'), record.get('fragrantica_id'))
+
+    for label in args:
+        brand, _, name = label.partition(' — ')
+        found = reconciler.match(brand, name)
+        if found:
+            record = records[found.index]
+            print(f"✅ {label} → {record['brand']} — {record['name']} ({found.method}, {found.score})")
+        else:
+            print(f"❌ {label}: no match")
+        for score, i in reconciler.rank(brand, name)[:3]:
+            print(f"   {score:.3f}  {records[i]['brand']} — {records[i]['name']}")
+
+
+if __name__ == '__main__':
+    main()
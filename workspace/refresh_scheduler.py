@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Staleness-driven refresh scheduler for the perfume catalog.
+
+The merge step records, per catalog entry, when it was last fetched, from
+which Fragrantica URL, and a short history of rating/votes observations.
+From that the scheduler ranks entries by staleness × volatility (how fast
+their votes/rating moved last time) and picks the top-K that fit in a
+credit and time budget. `run` turns the plan into a crawl job.
+
+Usage:
+  refresh_scheduler.py plan [--credits N] [--seconds N] [--top K]
+  refresh_scheduler.py run  [--credits N] [--seconds N] [--top K] [--job NAME]
+  refresh_scheduler.py show [BRAND — NAME]
+"""
+
+import os
+import sys
+import json
+import heapq
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'skills', 'scrapingbee'))
+
+STATE_FILE = '/data/workspace/state/fragrantica_refresh.json'
+CATALOG_FILE = '/data/workspace/pages/perfume/perfumes.json'
+
+HISTORY_LENGTH = 10
+# Rough wall time per ladder step, used for the time budget
+STEP_SECONDS = {'plain': 3, 'js': 10, 'premium': 15}
+# A never-refreshed entry counts as this many days stale
+UNKNOWN_AGE_DAYS = 365
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def record_key(record: Dict) -> str:
+    """State key: fragrantica_id when known, else normalized brand|name."""
+    if record.get('fragrantica_id'):
+        return f"id:{record['fragrantica_id']}"
+    return f"{record.get('brand', '').lower().strip()}|{record.get('name', '').lower().strip()}"
+
+
+def load_state(path: str = STATE_FILE) -> Dict[str, Any]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'entries': {}}
+
+
+def save_state(state: Dict[str, Any], path: str = STATE_FILE) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def observe(state: Dict[str, Any], record: Dict, url: str, scraped_at: Optional[str],
+            rating: Optional[float], votes: Optional[int], changed: List[str]) -> None:
+    """Record one fetch of a catalog entry and update its volatility.
+
+    Volatility is an exponentially weighted rate of change: relative votes
+    growth per day plus rating movement per day, from consecutive fetches.
+    """
+    entries = state.setdefault('entries', {})
+    key = record_key(record)
+    # A record first matched by name may gain its fragrantica_id later: move its history over
+    name_key = f"{record.get('brand', '').lower().strip()}|{record.get('name', '').lower().strip()}"
+    if key != name_key and key not in entries and name_key in entries:
+        entries[key] = entries.pop(name_key)
+    entry = entries.setdefault(key, {
+        'brand': record.get('brand'), 'name': record.get('name'),
+        'url': url, 'last_fetched': None, 'volatility': 0.0, 'history': [],
+    })
+    fetched_at = _parse_time(scraped_at) or datetime.now(timezone.utc)
+    last = entry['history'][-1] if entry['history'] else None
+    if last is not None:
+        days = max((fetched_at - _parse_time(last['at'])).total_seconds() / 86400, 1 / 24)
+        rate = 0.0
+        if votes is not None and last.get('votes'):
+            rate += abs(votes - last['votes']) / last['votes'] / days
+        if rating is not None and last.get('rating') is not None:
+            rate += abs(rating - last['rating']) / days
+        entry['volatility'] = round(0.5 * entry['volatility'] + 0.5 * rate, 6)
+    entry['url'] = url or entry.get('url')
+    entry['last_fetched'] = fetched_at.isoformat(timespec='seconds')
+    entry['history'].append({'at': entry['last_fetched'], 'rating': rating, 'votes': votes,
+                             'changed': sorted(changed)})
+    del entry['history'][:-HISTORY_LENGTH]
+
+
+def priority(entry: Dict[str, Any], record: Dict, now: datetime) -> float:
+    """Higher is more urgent: age in days, scaled up by volatility and missing data."""
+    last = _parse_time(entry.get('last_fetched'))
+    age_days = (now - last).total_seconds() / 86400 if last else UNKNOWN_AGE_DAYS
+    boost = 1.0 + 100 * entry.get('volatility', 0.0)
+    if not record.get('pyramid') or not record.get('accords') or not record.get('rating'):
+        boost += 1.0
+    return age_days * boost
+
+
+def plan(catalog: List[Dict], state: Dict[str, Any], credits: Optional[int] = None,
+         seconds: Optional[float] = None, top: Optional[int] = None, concurrency: int = 4,
+         now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Pick the most urgent entries that fit in the credit/time budget.
+
+    Entries without a known Fragrantica URL cannot be refreshed and are
+    skipped. Cost per entry comes from the ladder step that worked last time.
+    """
+    from scrape import credit_cost
+    from fragrantica_scraper import ladder_memory, LADDER
+    memory = ladder_memory()
+    now = now or datetime.now(timezone.utc)
+    entries = state.get('entries', {})
+
+    queue = []
+    for i, record in enumerate(catalog):
+        entry = entries.get(record_key(record))
+        if not entry or not entry.get('url'):
+            continue
+        score = priority(entry, record, now)
+        heapq.heappush(queue, (-score, i, entry['url']))
+
+    selected, spent_credits, spent_seconds = [], 0, 0.0
+    while queue and (top is None or len(selected) < top):
+        neg_score, i, url = heapq.heappop(queue)
+        rung = LADDER[memory.start_step(url)]
+        step = rung['step']
+        cost = credit_cost(rung['render_js'], rung['premium_proxy'])
+        duration = STEP_SECONDS[step] / max(concurrency, 1)
+        if credits is not None and spent_credits + cost > credits:
+            continue
+        if seconds is not None and spent_seconds + duration > seconds:
+            continue
+        spent_credits += cost
+        spent_seconds += duration
+        record = catalog[i]
+        selected.append({'brand': record.get('brand'), 'name': record.get('name'), 'url': url,
+                         'score': round(-neg_score, 2), 'step': step, 'credits': cost})
+    return selected
+
+
+def _load_catalog(path: str = CATALOG_FILE) -> List[Dict]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refresh the stalest, most volatile catalog entries.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name in ('plan', 'run'):
+        p = sub.add_parser(name)
+        p.add_argument('--credits', type=int, default=100, help='credit budget for this refresh')
+        p.add_argument('--seconds', type=float, help='wall-time budget for this refresh')
+        p.add_argument('--top', type=int, help='refresh at most K entries')
+        p.add_argument('--concurrency', type=int, default=4)
+        if name == 'run':
+            p.add_argument('--job', help='crawl job name (default: refresh-<timestamp>)')
+    p = sub.add_parser('show')
+    p.add_argument('label', nargs='?', help="'Brand — Name' to show one entry")
+    args = parser.parse_args()
+
+    state = load_state()
+    if args.command == 'show':
+        entries = state.get('entries', {})
+        if args.label:
+            brand, _, name = args.label.partition(' — ')
+            entries = {k: v for k, v in entries.items()
+                       if (v.get('brand') or '').lower() == brand.lower() and (v.get('name') or '').lower() == name.lower()}
+        print(json.dumps(entries, ensure_ascii=False, indent=2))
+        sys.exit(0)
+
+    selected = plan(_load_catalog(), state, credits=args.credits, seconds=args.seconds,
+                    top=args.top, concurrency=args.concurrency)
+    for item in selected:
+        print(f"{item['score']:>9.2f}  {item['step']:<7} {item['credits']:>2}cr  {item['brand']} — {item['name']}")
+    print(f"{len(selected)} entries, {sum(i['credits'] for i in selected)} credits", file=sys.stderr)
+
+    if args.command == 'run' and selected:
+        from crawl_job import CrawlJob
+        name = args.job or 'refresh-' + datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')
+        job = CrawlJob(name)
+        job.create([item['url'] for item in selected], budget=args.credits, concurrency=args.concurrency)
+        job.run()
+        print(f"Merge with: python3 /data/workspace/merge_fragrantica_data.py {job.results_path}")
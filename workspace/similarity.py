@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+"Similar perfumes": top-k neighbours by accord and note profile.
+
+Every perfume becomes a sparse vector:
+  accord:<name>  weight w/100 (Fragrantica's bar width) × ACCORD_WEIGHT
+  note:<name>    one-hot per note, scaled by its tier (base notes count
+                 most, top notes least — they are gone in minutes) and by
+                 the note's inverse document frequency, so musk and
+                 bergamot do not make everything look alike
+Vectors are L2-normalised and compared by cosine similarity.
+
+With NumPy the catalog is a dense float32 matrix and similarities come
+from chunked matrix products (CHUNK rows × all perfumes at a time) with
+argpartition for the top k. Without NumPy the same scores come from a
+sparse product over an inverted index (feature → perfumes): a perfume
+is only ever scored against perfumes that share a feature with it.
+
+Results go into perfumes.json as
+  similar: [{"brand": ..., "name": ..., "score": 0.87}, ...]
+
+Usage: similarity.py [--k N] [--min-score X] [--db FILE.sqlite] [--dry-run] [--pure-python]
+"""
+
+import sys
+import json
+import math
+import heapq
+from typing import Dict, Any, List, Tuple
+
+from merge_fragrantica_data import (dump_catalog, write_text_atomic, diff_catalogs, print_change_summary,
+                                    CATALOG_FILE)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TOP_K = 5
+MIN_SCORE = 0.15
+CHUNK = 1024
+ACCORD_WEIGHT = 1.0
+TIER_WEIGHTS = {'top': 0.5, 'mid': 0.8, 'base': 1.0}
+
+
+def normalize_note(note: str) -> str:
+    note = note.strip().lower().replace('ё', 'е')
+    # Fragrantica's English meta description leaks "are" into the first note
+    if note.startswith('are '):
+        note = note[4:]
+    return note
+
+
+def _notes(value) -> List[str]:
+    if isinstance(value, list):
+        value = ', '.join(value)
+    return [n for n in (normalize_note(v) for v in (value or '').split(',')) if n and n != '—']
+
+
+def feature_vectors(records: List[Dict]) -> List[Dict[str, float]]:
+    """Sparse, L2-normalised feature vector per record (empty if it has no data)."""
+    raw = []
+    df: Dict[str, int] = {}
+    for record in records:
+        vec: Dict[str, float] = {}
+        for accord in record.get('accords') or []:
+            if accord.get('name'):
+                key = 'accord:' + accord['name'].strip().lower()
+                vec[key] = max(vec.get(key, 0.0), (accord.get('w') or 0) / 100 * ACCORD_WEIGHT)
+        pyramid = record.get('pyramid') or {}
+        for tier, weight in TIER_WEIGHTS.items():
+            for note in _notes(pyramid.get(tier)):
+                key = 'note:' + note
+                vec[key] = max(vec.get(key, 0.0), weight)
+        for key in vec:
+            if key.startswith('note:'):
+                df[key] = df.get(key, 0) + 1
+        raw.append(vec)
+
+    n = len(records)
+    vectors = []
+    for vec in raw:
+        for key in vec:
+            if key.startswith('note:'):
+                vec[key] *= math.log(1 + n / df[key])
+        norm = math.sqrt(sum(v * v for v in vec.values()))
+        vectors.append({k: v / norm for k, v in vec.items()} if norm else {})
+    return vectors
+
+
+def top_k_sparse(vectors: List[Dict[str, float]], k: int = TOP_K,
+                 min_score: float = MIN_SCORE) -> List[List[Tuple[int, float]]]:
+    """Cosine top-k via an inverted index: only co-occurring pairs are scored."""
+    postings: Dict[str, List[Tuple[int, float]]] = {}
+    for i, vec in enumerate(vectors):
+        for key, value in vec.items():
+            postings.setdefault(key, []).append((i, value))
+
+    neighbours = []
+    for i, vec in enumerate(vectors):
+        scores: Dict[int, float] = {}
+        for key, value in vec.items():
+            for j, other in postings[key]:
+                if j != i:
+                    scores[j] = scores.get(j, 0.0) + value * other
+        best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        neighbours.append([(j, s) for j, s in best if s >= min_score])
+    return neighbours
+
+
+def top_k_numpy(vectors: List[Dict[str, float]], k: int = TOP_K, min_score: float = MIN_SCORE,
+                chunk: int = CHUNK) -> List[List[Tuple[int, float]]]:
+    """Cosine top-k with chunked dense matrix products."""
+    columns: Dict[str, int] = {}
+    for vec in vectors:
+        for key in vec:
+            columns.setdefault(key, len(columns))
+    matrix = np.zeros((len(vectors), max(len(columns), 1)), dtype=np.float32)
+    for i, vec in enumerate(vectors):
+        for key, value in vec.items():
+            matrix[i, columns[key]] = value
+
+    n = len(vectors)
+    kk = min(k, n - 1)
+    neighbours = []
+    for start in range(0, n, chunk):
+        scores = matrix[start:start + chunk] @ matrix.T
+        rows = np.arange(scores.shape[0])
+        scores[rows, rows + start] = -1.0
+        if kk <= 0:
+            neighbours += [[] for _ in rows]
+            continue
+        candidates = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+        for r in rows:
+            picked = sorted(((int(j), float(scores[r, j])) for j in candidates[r]),
+                            key=lambda item: (-item[1], item[0]))
+            neighbours.append([(j, s) for j, s in picked if s >= min_score])
+    return neighbours
+
+
+def similar_perfumes(records: List[Dict], k: int = TOP_K, min_score: float = MIN_SCORE,
+                     pure_python: bool = False) -> List[List[Dict[str, Any]]]:
+    vectors = feature_vectors(records)
+    if np is not None and not pure_python:
+        neighbours = top_k_numpy(vectors, k, min_score)
+    else:
+        neighbours = top_k_sparse(vectors, k, min_score)
+    return [[{'brand': records[j]['brand'], 'name': records[j]['name'], 'score': round(s, 3)}
+             for j, s in found] for found in neighbours]
+
+
+def apply_similar(records: List[Dict], similar: List[List[Dict[str, Any]]]) -> None:
+    for record, found in zip(records, similar):
+        if found:
+            record['similar'] = found
+        else:
+            record.pop('similar', None)
+
+
+def main():
+    args = sys.argv[1:]
+    k = int(args[args.index('--k') + 1]) if '--k' in args else TOP_K
+    min_score = float(args[args.index('--min-score') + 1]) if '--min-score' in args else MIN_SCORE
+    db = args[args.index('--db') + 1] if '--db' in args else None
+    dry_run = '--dry-run' in args
+    pure_python = '--pure-python' in args
+
+    store = None
+    if db:
+        from catalog_store import CatalogStore
+        store = CatalogStore(db)
+    try:
+        if store:
+            if not dry_run:
+                # Edits made to perfumes.json outside the store survive the export below
+                with open(CATALOG_FILE, 'r', encoding='utf-8') as f:
+                    store.sync(json.load(f))
+            original = store.export()
+        else:
+            with open(CATALOG_FILE, 'r', encoding='utf-8') as f:
+                original = json.load(f)
+        records = json.loads(json.dumps(original, ensure_ascii=False))
+
+        engine = 'NumPy' if np is not None and not pure_python else 'sparse index'
+        print(f"🧭 Computing top-{k} neighbours for {len(records)} perfumes ({engine})...")
+        apply_similar(records, similar_perfumes(records, k, min_score, pure_python))
+        changes = diff_catalogs(original, records)
+        print_change_summary(records, changes)
+        if dry_run:
+            print("🧪 Dry run: nothing written")
+            return
+        if store:
+            with store.batch():
+                for i in changes:
+                    store.set_fields(i, {'similar': records[i].get('similar')})
+            written = store.export_file(CATALOG_FILE)
+        else:
+            new_text = dump_catalog(records)
+            written = bool(changes)
+            if written:
+                write_text_atomic(CATALOG_FILE, new_text)
+    finally:
+        if store:
+            store.close()
+    print(f"💾 {CATALOG_FILE} {'updated' if written else 'unchanged'} ({len(changes)} perfumes changed)")
+    if written:
+        from build_page import refresh_page, report_refresh
+        report_refresh(refresh_page(records, CATALOG_FILE))
+
+
+if __name__ == '__main__':
+    main()
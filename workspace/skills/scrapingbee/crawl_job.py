@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Resumable Fragrantica crawl jobs.
+
+A job is a directory with:
+  manifest.json  — URL → state (pending/done/failed), attempts, last error,
+                   credits spent, ladder step; checkpointed after every page
+  results.jsonl  — parsed records (same format as fragrantica_scraper.py --out),
+                   ready for merge_fragrantica_data.py
+
+Usage:
+  crawl_job.py new <job> [URL ...] [--file urls.txt] [--budget N] [--concurrency N] [--max-attempts N]
+  crawl_job.py add <job> [URL ...] [--file urls.txt]
+  crawl_job.py resume <job> [--budget N] [--retry-failed]
+  crawl_job.py status <job>
+  crawl_job.py list
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from scrape import scrape_many, CreditBudget
+from fragrantica_scraper import (fetch_with_escalation, missing_fields, make_record, JsonlWriter)
+
+JOBS_DIR = os.environ.get('FRAGRANTICA_JOBS_DIR',
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs'))
+
+PENDING, DONE, FAILED = 'pending', 'done', 'failed'
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class _TrackedBudget:
+    """Per-URL view of the job budget: charges the parent, remembers its own spend."""
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.spent = 0
+        self.exhausted = False
+
+    def reserve(self, cost):
+        if not self.parent.reserve(cost):
+            self.exhausted = True
+            return False
+        self.spent += cost
+        return True
+
+    def refund(self, cost):
+        self.parent.refund(cost)
+        self.spent -= cost
+
+
+class CrawlJob:
+    """A named crawl with a persistent manifest."""
+
+    def __init__(self, name, jobs_dir=JOBS_DIR):
+        self.name = name
+        self.dir = os.path.join(jobs_dir, name)
+        self.manifest_path = os.path.join(self.dir, 'manifest.json')
+        self.results_path = os.path.join(self.dir, 'results.jsonl')
+        self.manifest = None
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def create(self, urls, budget=None, concurrency=4, max_attempts=3):
+        if self.exists():
+            raise FileExistsError(f"Job '{self.name}' already exists")
+        os.makedirs(self.dir, exist_ok=True)
+        self.manifest = {
+            'name': self.name,
+            'created_at': _now(),
+            'settings': {'budget': budget, 'concurrency': concurrency, 'max_attempts': max_attempts},
+            'credits_spent': 0,
+            'urls': {},
+        }
+        self.add(urls)
+
+    def load(self):
+        with open(self.manifest_path, encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        return self
+
+    def checkpoint(self):
+        """Atomically persist the manifest."""
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_path)
+
+    def add(self, urls):
+        added = 0
+        for url in urls:
+            if url not in self.manifest['urls']:
+                self.manifest['urls'][url] = {'state': PENDING, 'attempts': 0, 'last_error': None,
+                                              'credits': 0, 'step': None, 'updated_at': None}
+                added += 1
+        self.checkpoint()
+        return added
+
+    def todo(self, retry_failed=False):
+        """URLs still to fetch: pending ones, plus failed ones with attempts left."""
+        max_attempts = self.manifest['settings'].get('max_attempts', 3)
+        urls = []
+        for url, entry in self.manifest['urls'].items():
+            if entry['state'] == PENDING:
+                urls.append(url)
+            elif entry['state'] == FAILED and (retry_failed or entry['attempts'] < max_attempts):
+                urls.append(url)
+        return urls
+
+    def counts(self):
+        counts = {PENDING: 0, DONE: 0, FAILED: 0}
+        for entry in self.manifest['urls'].values():
+            counts[entry['state']] += 1
+        return counts
+
+    def run(self, budget=None, retry_failed=False, use_cache=True):
+        """Fetch every outstanding URL, checkpointing after each page.
+
+        budget overrides the job's remaining budget for this run. Stops
+        early (leaving URLs pending) when the budget runs out.
+        """
+        settings = self.manifest['settings']
+        if budget is None and settings.get('budget') is not None:
+            budget = max(0, settings['budget'] - self.manifest['credits_spent'])
+        job_budget = CreditBudget(budget)
+        urls = self.todo(retry_failed)
+        if not urls:
+            print(f"Job '{self.name}': nothing to do", file=sys.stderr)
+            return self.counts()
+        print(f"Job '{self.name}': {len(urls)} URLs to fetch", file=sys.stderr)
+
+        def fetch(url):
+            tracked = _TrackedBudget(job_budget)
+            try:
+                data, _, step = fetch_with_escalation(url, use_cache=use_cache, budget=tracked)
+                error = None
+            except Exception as e:
+                data, step, error = None, None, f"{e.__class__.__name__}: {e}"
+            return data, step, tracked, error
+
+        with open(self.results_path, 'a', encoding='utf-8') as out:
+            writer = JsonlWriter(out)
+            for url, (data, step, tracked, error) in scrape_many(
+                    urls, concurrency=settings.get('concurrency', 4), fetch=fetch):
+                entry = self.manifest['urls'][url]
+                entry['credits'] += tracked.spent
+                entry['updated_at'] = _now()
+                self.manifest['credits_spent'] += tracked.spent
+                if data is None and tracked.exhausted:
+                    # Not an attempt: the page was never fetched
+                    entry['last_error'] = 'credit budget exhausted'
+                elif data is None:
+                    entry['attempts'] += 1
+                    entry['state'] = FAILED
+                    entry['last_error'] = error or 'fetch failed'
+                else:
+                    entry['attempts'] += 1
+                    writer.write(make_record(url, data))
+                    entry['state'] = DONE
+                    entry['step'] = step
+                    missing = missing_fields(data)
+                    entry['last_error'] = f"missing: {', '.join(missing)}" if missing else None
+                self.checkpoint()
+                print(f"[{entry['state']}] {url} ({tracked.spent} credits)", file=sys.stderr)
+        return self.counts()
+
+    def status(self):
+        counts = self.counts()
+        return {
+            'name': self.name,
+            'created_at': self.manifest['created_at'],
+            'total': len(self.manifest['urls']),
+            **counts,
+            'credits_spent': self.manifest['credits_spent'],
+            'budget': self.manifest['settings'].get('budget'),
+            'results': self.results_path,
+            'failed_urls': {url: e['last_error'] for url, e in self.manifest['urls'].items()
+                            if e['state'] == FAILED},
+        }
+
+
+def _urls_from(args):
+    urls = list(args.urls)
+    if args.file:
+        with open(args.file) as f:
+            urls += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return urls
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resumable Fragrantica crawl jobs.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('new', help='create a job')
+    p.add_argument('job')
+    p.add_argument('urls', nargs='*')
+    p.add_argument('--file')
+    p.add_argument('--budget', type=int, help='total credits the job may spend')
+    p.add_argument('--concurrency', type=int, default=4)
+    p.add_argument('--max-attempts', type=int, default=3)
+    p.add_argument('--start', action='store_true', help='run the job right away')
+    p = sub.add_parser('add', help='add URLs to a job')
+    p.add_argument('job')
+    p.add_argument('urls', nargs='*')
+    p.add_argument('--file')
+    p = sub.add_parser('resume', help='continue a job where it stopped')
+    p.add_argument('job')
+    p.add_argument('--budget', type=int, help='credits for this run (default: what is left of the job budget)')
+    p.add_argument('--retry-failed', action='store_true', help='retry failed URLs even past max attempts')
+    p.add_argument('--no-cache', action='store_true')
+    p = sub.add_parser('status', help='show job progress')
+    p.add_argument('job')
+    sub.add_parser('list', help='list jobs')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        if os.path.isdir(JOBS_DIR):
+            for name in sorted(os.listdir(JOBS_DIR)):
+                job = CrawlJob(name)
+                if job.exists():
+                    c = job.load().counts()
+                    print(f"{name}: {c[DONE]} done, {c[PENDING]} pending, {c[FAILED]} failed")
+        sys.exit(0)
+
+    job = CrawlJob(args.job)
+    if args.command == 'new':
+        job.create(_urls_from(args), budget=args.budget, concurrency=args.concurrency,
+                   max_attempts=args.max_attempts)
+        print(f"Created job '{args.job}' with {len(job.manifest['urls'])} URLs in {job.dir}")
+        if args.start:
+            job.run()
+            print(json.dumps(job.status(), ensure_ascii=False, indent=2))
+        sys.exit(0)
+
+    if not job.exists():
+        print(f"ERROR: no such job '{args.job}' in {JOBS_DIR}", file=sys.stderr)
+        sys.exit(1)
+    job.load()
+    if args.command == 'add':
+        print(f"Added {job.add(_urls_from(args))} URLs")
+    elif args.command == 'resume':
+        started = time.monotonic()
+        job.run(budget=args.budget, retry_failed=args.retry_failed, use_cache=not args.no_cache)
+        status = job.status()
+        print(json.dumps(status, ensure_ascii=False, indent=2))
+        print(f"Run took {time.monotonic() - started:.1f}s", file=sys.stderr)
+        sys.exit(0 if status[PENDING] == 0 and status[FAILED] == 0 else 1)
+    elif args.command == 'status':
+        print(json.dumps(job.status(), ensure_ascii=False, indent=2))
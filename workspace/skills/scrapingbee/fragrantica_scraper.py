@@ -3,140 +3,606 @@
 Fragrantica scraper — extracts perfume data using ScrapingBee.
 Parses: notes pyramid, accords (with colors!), rating, gender, year, perfumer.
 Works with fragrantica.ru and fragrantica.com.
+
+Lean mode (--lean) asks ScrapingBee to cut the page down server-side
+(LEAN_PROFILE: extract_rules for the meta description, accord bars,
+pyramid block and rating microdata, images/CSS blocked, wait_for the
+accord bars instead of a fixed wait). A few KB of JSON come back instead
+of a few hundred KB of HTML; extracted_page() puts the pieces back into
+their original markup so parse_fragrantica reads them unchanged. Year,
+perfumer and concentration are not in the profile.
+
+Adaptive waits (--adaptive-wait): instead of a fixed wait=5000 the JS
+steps wait_for READY_SELECTOR, so the API returns as soon as the page has
+rendered, plus a learned extra wait: first the domain's p50 of the waits
+that produced complete pages before, then — only if the parse comes back
+incomplete — its p95, then MAX_WAIT_MS (which is how longer waits get
+learned at all). Every PROBE_EVERY-th page of a domain first tries half
+its p50, which is how shorter waits get learned when the site speeds up.
+The wait that produced a complete page is recorded whether it was fetched
+or came from the cache. LadderMemory keeps the last WAIT_SAMPLES per
+domain; DEFAULT_WAITS stands in until there are WAIT_MIN_SAMPLES.
+`--wait-stats` prints them.
 """
 
 import sys
 import os
 import re
 import json
+import time
+import fcntl
+import http.client
+import atexit
+import tempfile
+import threading
+import urllib.parse
+import html as htmllib
+from collections import Counter
+from datetime import datetime, timezone
 
 sys.path.insert(0, os.path.dirname(__file__))
-from scrape import scrape
+import scrape as scrapingbee
+from scrape import scrape, scrape_many, credit_cost, CreditBudget
+from response_cache import cache_key
+from metrics import METRICS, configure as configure_metrics
+
+# Bump when parse_fragrantica output changes, so merged records can be traced
+PARSER_VERSION = 2
+
+# Fetch escalation ladder: cheapest first, climb only when the parse is incomplete
+LADDER = [
+    {'step': 'plain', 'render_js': False, 'wait_ms': 0, 'premium_proxy': False},
+    {'step': 'js', 'render_js': True, 'wait_ms': 5000, 'premium_proxy': False},
+    {'step': 'premium', 'render_js': True, 'wait_ms': 5000, 'premium_proxy': True},
+]
+REQUIRED_FIELDS = ('pyramid', 'accords', 'rating')
+
+# Adaptive waits: the element whose appearance means the page has rendered,
+# and the (p50, p95) extra wait in ms assumed before a domain has history
+READY_SELECTOR = '.accord-box'
+DEFAULT_WAITS = (0, 3000)
+WAIT_MIN_SAMPLES = 5
+WAIT_SAMPLES = 200
+MAX_WAIT_MS = 10000
+WAIT_STEP_MS = 500
+# One plan in this many per domain starts with a probe at half the p50
+PROBE_EVERY = 10
+
+# Server-side extraction: only the parts of the page parse_fragrantica needs
+# for REQUIRED_FIELDS (plus votes and gender, which ride along)
+LEAN_PROFILE = {
+    'extract_rules': {
+        'description': {'selector': 'meta[name=description]', 'output': '@content'},
+        'accords': {'selector': '.accord-box', 'output': 'html'},
+        'pyramid': {'selector': '#pyramid', 'output': 'html'},
+        'rating': {'selector': '[itemprop=ratingValue]', 'output': 'text'},
+        'votes': {'selector': '[itemprop=ratingCount]', 'output': 'text'},
+    },
+    'block_resources': True,
+    'wait_for': READY_SELECTOR,
+}
+LEAN_FIELDS = ('pyramid', 'accords', 'rating', 'votes', 'gender', 'fragrantica_id')
+LADDER_STATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'ladder.json')
+# LadderMemory writes ladder.json after this many records (and at exit)
+LADDER_SAVE_EVERY = 50
+
+
+# Patterns are compiled once at import; parse_fragrantica only runs the ones
+# for the requested fields, each over the page regions that hold it
+# (pos/endpos on the page, no copies) rather than the whole document.
+_PAREN = re.compile(r'\([^)]*\)')
+_PAREN_KEY = re.compile(r'__PAREN(\d+)__')
+_AND_RU = re.compile(r'\s+и\s+')
+_AND_EN = re.compile(r'\s+and\s+')
+
+_PYRAMID_META = re.compile(
+    r'(?:Верхние ноты|Top notes)[:\s]*(.+?);\s*'
+    r'(?:средние ноты|middle notes|heart notes)[:\s]*(.+?);\s*'
+    r'(?:базовые ноты|base notes)[:\s]*(.+?)(?:\.|<|")',
+    re.I
+)
+_PYRAMID_LABEL = re.compile(
+    r'(?:верхние|начальные|top)\s*нот\w*\s*</span>|'
+    r'(?:средние|middle|heart)\s*нот\w*\s*</span>|'
+    r'(?:базовые|base)\s*нот\w*\s*</span>',
+    re.I
+)
+_PYRAMID_NOTE = re.compile(r'pyramid-note-label[^>]*>\s*([^<]+?)\s*</span>')
+_ACCORD = re.compile(
+    r'background:\s*rgb\((\d+),\s*(\d+),\s*(\d+)\)[^"]*width:\s*(\d+(?:\.\d+)?)%[^>]*><span[^>]*>([^<]+)')
+_RATING_MICRODATA = re.compile(r'itemprop="ratingValue"[^>]*>([0-9.]+)')
+_RATING_JSON = re.compile(r'"ratingValue"\s*[":]+\s*([0-9.]+)')
+_VOTES_MICRODATA = re.compile(r'itemprop="ratingCount"\s*content="(\d+)"')
+_VOTES_JSON = re.compile(r'"ratingCount"\s*[":]+\s*(\d+)')
+# Checked in priority order: "women and men" in a region wins over either on its own
+_GENDER_UNISEX = re.compile(r'для женщин и мужчин|for women and men', re.I)
+_GENDER = [
+    (re.compile(r'для женщин(?!\s*и)|for women(?!\s*and)', re.I), 'Ж'),
+    (re.compile(r'для мужчин(?!\s*и)|for men(?!\s*and)', re.I), 'М'),
+]
+_YEAR = re.compile(r'(?:выпущен в|запущен в|launched in)\s*(\d{4})', re.I)
+# Possessive quantifiers: the skipped tags/whitespace can never be followed
+# by the capital letter, so backtracking into them is pure waste.
+_PERFUMER = re.compile(r'(?:Парфюмер|Perfumer|Nose)[:\s]*+(?:<[^>]*>\s*)*+([A-ZА-ЯЁ][^<]{2,55})', re.I)
+_PERFUMER_JUNK = re.compile(r'^(div|span|class|style)', re.I)
+_CONCENTRATION = re.compile(r'(Eau de Parfum|Eau de Toilette|Extrait de Parfum|Parfum Cologne|Cologne)', re.I)
+_FRAGRANTICA_ID = re.compile(r'/perfume/[^/]+/[^/]+-(\d+)\.html')
+
+ALL_FIELDS = ('pyramid', 'accords', 'rating', 'votes', 'gender', 'year',
+              'perfumer', 'concentration', 'fragrantica_id')
+MAX_ACCORDS = 10
+
+# Page regions (see page_regions): the product block runs from the <h1> or the
+# rating microdata, whichever comes first, to MAIN_AFTER chars past the later one
+_LD_JSON = 'application/ld+json'
+_RATING_ANCHOR = 'itemprop="ratingValue"'
+MAIN_AFTER = 32 * 1024
 
 
 def clean_note_list(text):
     """Split notes by comma, handling parentheses correctly."""
     # First replace " и " / " and " with comma (but not inside parentheses)
     # Approach: temporarily replace content in parens
-    protected = {}
-    counter = [0]
+    protected = []
     def protect(m):
-        key = f"__PAREN{counter[0]}__"
-        counter[0] += 1
-        protected[key] = m.group(0)
-        return key
-    text = re.sub(r'\([^)]*\)', protect, text)
-    text = re.sub(r'\s+и\s+', ', ', text)
-    text = re.sub(r'\s+and\s+', ', ', text)
+        protected.append(m.group(0))
+        return f"__PAREN{len(protected) - 1}__"
+    text = _PAREN.sub(protect, text)
+    text = _AND_RU.sub(', ', text)
+    text = _AND_EN.sub(', ', text)
     parts = [p.strip() for p in text.split(',') if p.strip()]
+    if not protected:
+        return parts
     # Restore parenthesized content
-    result = []
-    for p in parts:
-        for key, val in protected.items():
-            p = p.replace(key, val)
-        result.append(p)
-    return result
+    restore = lambda m: protected[int(m.group(1))]
+    return [_PAREN_KEY.sub(restore, p) for p in parts]
 
 
-def parse_fragrantica(html):
-    """Parse Fragrantica perfume page HTML and extract structured data."""
-    data = {}
-    
-    # === NOTES from meta/description text (most reliable) ===
-    meta_match = re.search(
-        r'(?:Верхние ноты|Top notes)[:\s]*(.+?);\s*'
-        r'(?:средние ноты|middle notes|heart notes)[:\s]*(.+?);\s*'
-        r'(?:базовые ноты|base notes)[:\s]*(.+?)(?:\.|<|")',
-        html, re.I
-    )
-    
+def _parse_pyramid(html, head_end):
+    # Meta description first (most reliable): it lives in <head>
+    meta_match = _PYRAMID_META.search(html, 0, head_end)
     if meta_match:
-        data['pyramid'] = {
+        return {
             'top': clean_note_list(meta_match.group(1)),
             'mid': clean_note_list(meta_match.group(2)),
             'base': clean_note_list(meta_match.group(3)),
         }
-    else:
-        # Fallback: parse from pyramid-note-label spans
-        sections = re.split(
-            r'(?:верхние|начальные|top)\s*нот\w*\s*</span>|'
-            r'(?:средние|middle|heart)\s*нот\w*\s*</span>|'
-            r'(?:базовые|base)\s*нот\w*\s*</span>',
-            html, flags=re.I
-        )
-        pyramid = {'top': [], 'mid': [], 'base': []}
-        keys = ['top', 'mid', 'base']
-        for i, section in enumerate(sections[1:4]):
-            if i < len(keys):
-                notes = re.findall(r'pyramid-note-label[^>]*>\s*([^<]+?)\s*</span>', section)
-                pyramid[keys[i]] = [n.strip() for n in notes if n.strip()]
-        data['pyramid'] = pyramid
-    
-    # === ACCORDS with colors ===
-    accord_pattern = r'background:\s*rgb\((\d+),\s*(\d+),\s*(\d+)\)[^"]*width:\s*(\d+(?:\.\d+)?)%[^>]*><span[^>]*>([^<]+)'
-    matches = re.findall(accord_pattern, html)
-    
+    # Fallback: pyramid-note-label spans between the tier headings
+    bounds = []
+    for m in _PYRAMID_LABEL.finditer(html):
+        bounds.append(m)
+        if len(bounds) == 4:
+            break
+    pyramid = {'top': [], 'mid': [], 'base': []}
+    for key, start, end in zip(('top', 'mid', 'base'),
+                               (m.end() for m in bounds),
+                               [m.start() for m in bounds[1:]] + [len(html)]):
+        notes = _PYRAMID_NOTE.findall(html, start, end)
+        pyramid[key] = [n.strip() for n in notes if n.strip()]
+    return pyramid
+
+
+def _parse_accords(html):
+    # Accord bars start at the first "background: rgb(" on the page
+    start = html.find('rgb(')
     accords = []
+    if start == -1:
+        return accords
+    bar = html.rfind('background', 0, start)
     seen = set()
-    for r, g, b, w, name in matches:
+    for m in _ACCORD.finditer(html, bar if bar != -1 else start):
+        r, g, b, w, name = m.groups()
         name = name.strip()
         if name.lower() not in seen and len(name) > 1 and len(name) < 35:
             seen.add(name.lower())
             hex_color = f"#{int(r):02x}{int(g):02x}{int(b):02x}"
             accords.append({'name': name, 'w': round(float(w)), 'color': hex_color})
+            if len(accords) == MAX_ACCORDS:
+                break
+    return accords
+
+
+def page_regions(html):
+    """(start, end) of the regions the scalar fields live in, located once per page.
+
+    head  -- <head>: title, meta description (year and nose on real pages), canonical url;
+             without a </head>, everything before <body (or <h1, or the whole page)
+    main  -- the product block: <h1>, concentration, rating microdata, launch year, perfumer
+    ld    -- the JSON-LD <script>, the fallback for rating and votes ((0, 0) when absent)
+    """
+    head_end = html.find('</head>')
+    if head_end == -1:
+        head_end = next((i for i in (html.find('<body'), html.find('<h1')) if i != -1), len(html))
+    anchors = [i for i in (html.find('<h1', head_end), html.find(_RATING_ANCHOR, head_end)) if i != -1]
+    main_start = min(anchors) if anchors else head_end
+    main_end = min(len(html), (max(anchors) if anchors else head_end) + MAIN_AFTER)
+    ld_start = html.find(_LD_JSON)
+    ld_end = html.find('</script>', ld_start) if ld_start != -1 else -1
+    return {'head': (0, head_end), 'main': (main_start, main_end),
+            'ld': (ld_start, ld_end) if ld_end != -1 else (0, 0)}
+
+
+def _search(pattern, html, spans):
+    """First match of pattern in the given (start, end) spans, tried in order."""
+    for start, end in spans:
+        if start < end:
+            found = pattern.search(html, start, end)
+            if found:
+                return found
+    return None
+
+
+def _parse_gender(html, spans):
+    if _search(_GENDER_UNISEX, html, spans):
+        return 'Унисекс'
+    for pattern, gender in _GENDER:
+        if _search(pattern, html, spans):
+            return gender
+    return None
+
+
+def parse_fragrantica(html, fields=None):
+    """Parse Fragrantica perfume page HTML and extract structured data.
+
+    fields -- optional iterable of keys from ALL_FIELDS; only those are
+              extracted (default: all of them).
+    """
+    started = time.perf_counter()
+    wanted = set(ALL_FIELDS if fields is None else fields)
+    data = {}
+    regions = page_regions(html)
+    head_end = regions['head'][1]
+    # Document order, so a field found in both keeps the first occurrence on the page
+    text = (regions['head'], regions['main'])
     
-    data['accords'] = accords[:10]
+    # === NOTES from meta/description text (most reliable) ===
+    if 'pyramid' in wanted:
+        data['pyramid'] = _parse_pyramid(html, head_end)
     
-    # === RATING ===
-    rating_match = re.search(r'itemprop="ratingValue"[^>]*>([0-9.]+)', html)
-    if not rating_match:
-        rating_match = re.search(r'"ratingValue"\s*[":]+\s*([0-9.]+)', html)
-    votes_match = re.search(r'itemprop="ratingCount"\s*content="(\d+)"', html)
-    if not votes_match:
-        votes_match = re.search(r'"ratingCount"\s*[":]+\s*(\d+)', html)
+    # === ACCORDS with colors ===
+    if 'accords' in wanted:
+        data['accords'] = _parse_accords(html)
     
-    if rating_match:
-        data['rating'] = float(rating_match.group(1))
-    if votes_match:
-        data['votes'] = int(votes_match.group(1))
+    # === RATING (microdata, then JSON-LD) ===
+    if 'rating' in wanted:
+        rating_match = (_search(_RATING_MICRODATA, html, [regions['main']])
+                        or _search(_RATING_JSON, html, [regions['ld']]))
+        if rating_match:
+            data['rating'] = float(rating_match.group(1))
+    if 'votes' in wanted:
+        votes_match = (_search(_VOTES_MICRODATA, html, [regions['main']])
+                       or _search(_VOTES_JSON, html, [regions['ld']]))
+        if votes_match:
+            data['votes'] = int(votes_match.group(1))
     
     # === GENDER ===
-    if re.search(r'для женщин и мужчин|for women and men', html, re.I):
-        data['gender'] = 'Унисекс'
-    elif re.search(r'для женщин(?!\s*и)|for women(?!\s*and)', html, re.I):
-        data['gender'] = 'Ж'
-    elif re.search(r'для мужчин(?!\s*и)|for men(?!\s*and)', html, re.I):
-        data['gender'] = 'М'
+    if 'gender' in wanted:
+        gender = _parse_gender(html, text)
+        if gender:
+            data['gender'] = gender
     
     # === YEAR ===
-    year = re.search(r'(?:выпущен в|запущен в|launched in)\s*(\d{4})', html, re.I)
-    if year:
-        data['year'] = int(year.group(1))
+    if 'year' in wanted:
+        year = _search(_YEAR, html, text)
+        if year:
+            data['year'] = int(year.group(1))
     
     # === PERFUMER ===
-    perfumer = re.search(r'(?:Парфюмер|Perfumer|Nose)[:\s]*(?:</[^>]*>\s*)*(?:<[^>]*>\s*)*([A-ZА-ЯЁ][^<]{2,55})', html, re.I)
-    if perfumer:
-        name = perfumer.group(1).strip().rstrip('.')
-        if len(name) > 2 and not re.match(r'^(div|span|class|style)', name, re.I):
-            data['perfumer'] = name
+    if 'perfumer' in wanted:
+        perfumer = _search(_PERFUMER, html, text)
+        if perfumer:
+            name = perfumer.group(1).strip().rstrip('.')
+            if len(name) > 2 and not _PERFUMER_JUNK.match(name):
+                data['perfumer'] = name
     
     # === CONCENTRATION ===
-    conc = re.search(r'(Eau de Parfum|Eau de Toilette|Extrait de Parfum|Parfum Cologne|Cologne)', html, re.I)
-    if conc:
-        data['concentration'] = conc.group(1)
+    if 'concentration' in wanted:
+        conc = _search(_CONCENTRATION, html, text)
+        if conc:
+            data['concentration'] = conc.group(1)
     
     # === FRAGRANTICA ID ===
-    fid = re.search(r'/perfume/[^/]+/[^/]+-(\d+)\.html', html)
-    if fid:
-        data['fragrantica_id'] = int(fid.group(1))
+    if 'fragrantica_id' in wanted:
+        fid = _search(_FRAGRANTICA_ID, html, text)
+        if fid:
+            data['fragrantica_id'] = int(fid.group(1))
     
+    METRICS.parse(data, wanted, time.perf_counter() - started, len(html))
     return data
 
 
-def scrape_fragrantica(url, save_html=True):
-    """Scrape a Fragrantica URL and return parsed data."""
+def missing_fields(data, required=REQUIRED_FIELDS):
+    """Required fields the parse did not produce (empty pyramid counts as missing)."""
+    missing = []
+    for field in required:
+        value = data.get(field)
+        if field == 'pyramid' and value:
+            value = any(value.values())
+        if not value:
+            missing.append(field)
+    return missing
+
+
+def extracted_page(url, body):
+    """Rebuild a minimal page from a LEAN_PROFILE extract_rules response ('' if it is not one)."""
+    try:
+        found = json.loads(body or '')
+    except ValueError:
+        return ''
+    if not isinstance(found, dict):
+        return ''
+
+    def text(key):
+        value = found.get(key)
+        if isinstance(value, list):
+            value = '\n'.join(str(v) for v in value if v)
+        return str(value or '').strip()
+
+    description = text('description').replace('"', '&quot;')
+    votes = re.sub(r'\D', '', text('votes'))
+    return (f'<html><head><meta name="description" content="{description}">'
+            f'<link rel="canonical" href="{htmllib.escape(url)}"></head><body>\n'
+            f'<div class="cell accord-box">{text("accords")}</div>\n'
+            f'<span itemprop="ratingValue">{text("rating")}</span>'
+            f'<span itemprop="ratingCount" content="{votes}">{votes}</span>\n'
+            f'<div id="pyramid">{text("pyramid")}</div>\n</body></html>')
+
+
+def parse_lean(url, body):
+    """Parse the JSON a LEAN_PROFILE request returns."""
+    return parse_fragrantica(extracted_page(url, body), fields=LEAN_FIELDS)
+
+
+def rung_request(rung, lean=False, wait_ms=None):
+    """scrape() arguments for one LADDER step.
+
+    lean applies LEAN_PROFILE; wait_ms (adaptive waits) replaces the step's
+    fixed wait with wait_for READY_SELECTOR plus that much extra wait.
+    """
+    request = {'render_js': rung['render_js'], 'wait_ms': rung['wait_ms'], 'premium_proxy': rung['premium_proxy']}
+    if lean:
+        request.update(LEAN_PROFILE)
+    if rung['render_js'] and (lean or wait_ms is not None):
+        # wait_for returns as soon as the accord bars render instead of sleeping a fixed wait
+        request['wait_for'] = READY_SELECTOR
+        request['wait_ms'] = wait_ms or 0
+    else:
+        request.pop('wait_for', None)
+    return request
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LadderMemory:
+    """Remembers which ladder step worked, per URL and per domain.
+
+    A URL starts at the step that worked for it last time; an unseen URL
+    starts at the step that most often worked for its domain. For adaptive
+    waits it also keeps, per domain, the extra wait of the last
+    WAIT_SAMPLES JS fetches that parsed complete.
+
+    Records are saved every LADDER_SAVE_EVERY and at exit (flush()). The
+    daemon and the CLIs share the file: a save takes an exclusive lock on
+    path + '.lock', merges what this process learned since its last save
+    into the state on disk, and replaces the file through a unique temp file.
+    """
+
+    def __init__(self, path=LADDER_STATE):
+        self.path = path
+        self.lock = threading.Lock()
+        state = self._load()
+        self.urls = state.get('urls', {})
+        self.domains = state.get('domains', {})
+        self.waits = state.get('waits', {})
+        self.plans = Counter()
+        # Learned since the last save, merged into the file by _save()
+        self._new_urls = {}
+        self._new_counts = {}
+        self._new_waits = {}
+        self._unsaved = 0
+        atexit.register(self.flush)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def start_step(self, url):
+        steps = [s['step'] for s in LADDER]
+        with self.lock:
+            step = self.urls.get(url)
+            if step is None:
+                counts = self.domains.get(urllib.parse.urlsplit(url).hostname or '', {})
+                if counts:
+                    step = Counter(counts).most_common(1)[0][0]
+        return steps.index(step) if step in steps else 0
+
+    def record(self, url, step):
+        host = urllib.parse.urlsplit(url).hostname or ''
+        with self.lock:
+            self.urls[url] = self._new_urls[url] = step
+            counts = self.domains.setdefault(host, {})
+            counts[step] = counts.get(step, 0) + 1
+            new = self._new_counts.setdefault(host, {})
+            new[step] = new.get(step, 0) + 1
+            self._saved_soon()
+
+    def record_wait(self, url, ms):
+        host = urllib.parse.urlsplit(url).hostname or ''
+        with self.lock:
+            samples = self.waits.setdefault(host, [])
+            samples.append(int(ms))
+            del samples[:-WAIT_SAMPLES]
+            self._new_waits.setdefault(host, []).append(int(ms))
+            self._saved_soon()
+
+    def wait_stats(self, host):
+        """{'n', 'p50', 'p95'} in ms for a domain, or None before WAIT_MIN_SAMPLES."""
+        with self.lock:
+            samples = list(self.waits.get(host, ()))
+        if len(samples) < WAIT_MIN_SAMPLES:
+            return None
+        return {'n': len(samples), 'p50': percentile(samples, 0.5), 'p95': percentile(samples, 0.95)}
+
+    def wait_plan(self, url):
+        """Extra waits (ms) to try on a JS step, shortest first: p50, p95, then MAX_WAIT_MS.
+
+        Every PROBE_EVERY-th plan for a domain starts with half its p50
+        (rounded down), so waits can shrink again when the site gets faster.
+        """
+        host = urllib.parse.urlsplit(url).hostname or ''
+        stats = self.wait_stats(host)
+        waits = DEFAULT_WAITS if stats is None else (stats['p50'], stats['p95'])
+        # Rounded up to WAIT_STEP_MS, so few distinct waits (and cache keys) come out of the stats
+        plan = {min(-(-w // WAIT_STEP_MS) * WAIT_STEP_MS, MAX_WAIT_MS) for w in waits} | {MAX_WAIT_MS}
+        if stats is not None and stats['p50'] > 0:
+            with self.lock:
+                self.plans[host] += 1
+                probe = self.plans[host] % PROBE_EVERY == 1
+            if probe:
+                plan.add(stats['p50'] // 2 // WAIT_STEP_MS * WAIT_STEP_MS)
+        return sorted(plan)
+
+    def _saved_soon(self):
+        """Count one record (lock held); save every LADDER_SAVE_EVERY."""
+        self._unsaved += 1
+        if self._unsaved >= LADDER_SAVE_EVERY:
+            self._save()
+
+    def flush(self):
+        """Save whatever was recorded since the last save."""
+        with self.lock:
+            if self._unsaved:
+                self._save()
+
+    def _save(self):
+        """Merge this process's new records into the file on disk (lock held)."""
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                state = self._load()
+                urls = state.get('urls', {})
+                urls.update(self._new_urls)
+                domains = state.get('domains', {})
+                for host, new in self._new_counts.items():
+                    counts = domains.setdefault(host, {})
+                    for step, n in new.items():
+                        counts[step] = counts.get(step, 0) + n
+                waits = state.get('waits', {})
+                for host, new in self._new_waits.items():
+                    waits[host] = (waits.get(host, []) + new)[-WAIT_SAMPLES:]
+                fd, tmp = tempfile.mkstemp(prefix='.ladder.', suffix='.tmp', dir=directory)
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump({'urls': urls, 'domains': domains, 'waits': waits}, f,
+                                  ensure_ascii=False, indent=1)
+                    os.replace(tmp, self.path)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        # Other processes' learning comes back with the merged state
+        self.urls, self.domains, self.waits = urls, domains, waits
+        self._new_urls, self._new_counts, self._new_waits = {}, {}, {}
+        self._unsaved = 0
+
+
+_memory = None
+
+def ladder_memory():
+    global _memory
+    if _memory is None:
+        _memory = LadderMemory()
+    return _memory
+
+
+def ladder_attempts(url, memory, adaptive=False):
+    """(rung, wait_ms) pairs to try in order; wait_ms None means the step's fixed wait."""
+    plan = memory.wait_plan(url) if adaptive else None
+    for rung in LADDER[memory.start_step(url):]:
+        if not (adaptive and rung['render_js']):
+            yield rung, None
+        elif rung['premium_proxy']:
+            # 25 credits a try: a single attempt, with the longest wait
+            yield rung, plan[-1]
+        else:
+            for wait_ms in plan:
+                yield rung, wait_ms
+
+
+def fetch_with_escalation(url, use_cache=True, refresh=False, budget=None, memory=None, lean=False,
+                          adaptive=False):
+    """Fetch and parse a page, climbing LADDER only while required fields are missing.
+
+    Returns (data, html, step) for the best attempt, or (None, None, None)
+    if every step failed to fetch. budget is an optional CreditBudget.
+    With lean=True every step uses LEAN_PROFILE and html is the rebuilt page.
+    With adaptive=True a JS step waits for READY_SELECTOR plus the shortest
+    learned wait, and is retried with longer ones (memory.wait_plan) only
+    while the parse is incomplete.
+    """
+    memory = memory or ladder_memory()
+    best = (None, None, None)
+    for rung, wait_ms in ladder_attempts(url, memory, adaptive):
+        request = rung_request(rung, lean, wait_ms)
+        # Cached pages are free, so they never touch the budget
+        cached = use_cache and not refresh and scrapingbee.CACHE.contains(cache_key(url, **request))
+        cost = 0 if cached else credit_cost(rung['render_js'], rung['premium_proxy'])
+        if cost and budget is not None and not budget.reserve(cost):
+            print(f"ERROR: credit budget exhausted, stopping at '{rung['step']}' for {url}", file=sys.stderr)
+            break
+        html = scrape(url, use_cache=use_cache, refresh=refresh, **request)
+        if not html:
+            if cost and budget is not None:
+                budget.refund(cost)
+            continue
+        if lean:
+            html = extracted_page(url, html)
+        data = parse_fragrantica(html, fields=LEAN_FIELDS if lean else None)
+        missing = missing_fields(data)
+        if best[0] is None or len(missing) < len(missing_fields(best[0])):
+            best = (data, html, rung['step'])
+        if wait_ms is not None:
+            METRICS.inc('fragrantica_wait_attempts_total', outcome='incomplete' if missing else 'complete',
+                        wait_ms=wait_ms)
+        if not missing:
+            if wait_ms is not None:
+                memory.record_wait(url, wait_ms)
+            memory.record(url, rung['step'])
+            return best
+        step = f"'{rung['step']}'" + (f" (wait {wait_ms} ms)" if wait_ms is not None else '')
+        print(f"Step {step} missing {', '.join(missing)}, escalating", file=sys.stderr)
+    return best
+
+
+def scrape_fragrantica(url, save_html=True, use_cache=True, refresh=False, escalate=True, budget=None,
+                       lean=False, adaptive=False):
+    """Scrape a Fragrantica URL and return parsed data.
+
+    With escalate=True the page is fetched through LADDER (plain -> JS ->
+    premium); otherwise a single JS-rendered fetch is made. lean=True
+    fetches with LEAN_PROFILE, adaptive=True uses adaptive waits on the
+    ladder's JS steps (see the module docstring).
+    """
     print(f"Scraping: {url}", file=sys.stderr)
-    html = scrape(url, render_js=True, wait_ms=5000)
+    if escalate:
+        data, html, step = fetch_with_escalation(url, use_cache=use_cache, refresh=refresh, budget=budget,
+                                                 lean=lean, adaptive=adaptive)
+    else:
+        html = scrape(url, use_cache=use_cache, refresh=refresh, **rung_request(LADDER[1], lean))
+        data, step = None, 'js'
+        if html and lean:
+            data = parse_lean(url, html)
+            html = extracted_page(url, html)
     if not html:
         print("ERROR: Failed to fetch page", file=sys.stderr)
         return None
@@ -144,18 +610,154 @@ def scrape_fragrantica(url, save_html=True):
     if save_html:
         with open('/tmp/fragrantica_last.html', 'w') as f:
             f.write(html)
-        print(f"HTML saved ({len(html)} bytes)", file=sys.stderr)
+        print(f"HTML saved ({len(html)} bytes, step '{step}')", file=sys.stderr)
     
-    return parse_fragrantica(html)
+    return data if data is not None else parse_fragrantica(html)
+
+
+def scrape_fragrantica_many(urls, concurrency=4, per_host=2, rate=None, budget=None,
+                            use_cache=True, refresh=False, escalate=True, lean=False, adaptive=False):
+    """Scrape a list of Fragrantica URLs in parallel.
+
+    Yields (url, data) as each page finishes; data is None on failure.
+    See scrape.scrape_many for the concurrency/rate/budget knobs.
+    """
+    if not escalate:
+        parse = parse_lean if lean else lambda url, html: parse_fragrantica(html)
+        for url, html in scrape_many(urls, concurrency=concurrency, per_host=per_host,
+                                     rate=rate, budget=budget, use_cache=use_cache, refresh=refresh,
+                                     **rung_request(LADDER[1], lean)):
+            print(f"Scraped: {url}", file=sys.stderr)
+            yield url, parse(url, html) if html else None
+        return
+    
+    # The ladder spends a different amount per step, so it charges the budget itself
+    if not isinstance(budget, CreditBudget):
+        budget = CreditBudget(budget)
+    
+    def fetch(url):
+        data, _, step = fetch_with_escalation(url, use_cache=use_cache, refresh=refresh, budget=budget,
+                                              lean=lean, adaptive=adaptive)
+        if data is not None:
+            print(f"Scraped: {url} (step '{step}')", file=sys.stderr)
+        return data
+    
+    yield from scrape_many(urls, concurrency=concurrency, per_host=per_host, rate=rate, fetch=fetch)
+
+
+class JsonlWriter:
+    """Thread-safe append-only JSONL sink: one record per line, flushed per line."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+
+def make_record(url, data):
+    """Wrap parsed data with its provenance for the JSONL output."""
+    return {
+        'url': url,
+        'scraped_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'parser_version': PARSER_VERSION,
+        **data,
+    }
+
+
+def print_wait_stats(memory):
+    if not memory.waits:
+        print("No adaptive-wait history yet", file=sys.stderr)
+    for host in sorted(memory.waits):
+        stats = memory.wait_stats(host)
+        if stats is None:
+            print(f"{host}: {len(memory.waits[host])} samples (using defaults {list(DEFAULT_WAITS)} ms)")
+        else:
+            print(f"{host}: n={stats['n']} p50={stats['p50']} ms p95={stats['p95']} ms "
+                  f"-> waits {memory.wait_plan('https://' + host + '/')} ms")
 
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        print(f"Usage: {sys.argv[0]} <fragrantica_url>")
+        print(f"Usage: {sys.argv[0]} <fragrantica_url> [<url> ...] [--out FILE.jsonl] [--concurrency N] [--budget CREDITS] [--no-cache] [--refresh] [--no-escalate] [--lean] [--adaptive-wait] [--no-daemon] [--metrics FILE.json [--profile cpu|memory]]")
+        print(f"       {sys.argv[0]} --wait-stats")
         sys.exit(1)
+    if sys.argv[1] == '--wait-stats':
+        print_wait_stats(ladder_memory())
+        sys.exit(0)
+    
+    args = sys.argv[1:]
+    use_cache = '--no-cache' not in args
+    refresh = '--refresh' in args
+    escalate = '--no-escalate' not in args
+    lean = '--lean' in args
+    adaptive = '--adaptive-wait' in args
+    no_daemon = '--no-daemon' in args
+    args = [a for a in args
+            if a not in ('--no-cache', '--refresh', '--no-escalate', '--lean', '--adaptive-wait', '--no-daemon')]
+    options = {'--concurrency': '4', '--budget': None, '--out': None, '--metrics': None, '--profile': None}
+    for flag in options:
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    concurrency = int(options['--concurrency'])
+    budget = int(options['--budget']) if options['--budget'] else None
+    if options['--metrics']:
+        configure_metrics(options['--metrics'], options['--profile'])
+    
+    # A running scrape_daemon.py does the work (warm connections, shared cache and ladder
+    # memory); metrics are only measured in-process
+    daemon = None
+    if not (no_daemon or options['--metrics']):
+        from scrape_daemon import client as daemon_client
+        daemon = daemon_client()
     
-    result = scrape_fragrantica(sys.argv[1])
-    if result:
-        print(json.dumps(result, ensure_ascii=False, indent=2))
+    # Records go to --out (appended, JSONL) or stdout; logs always go to stderr
+    out = open(options['--out'], 'a', encoding='utf-8') if options['--out'] else None
+    writer = JsonlWriter(out) if out else None
+    
+    if len(args) == 1:
+        result = None
+        if daemon:
+            try:
+                result = daemon.fragrantica(args[0], use_cache=use_cache, refresh=refresh, escalate=escalate,
+                                            lean=lean, adaptive=adaptive, budget=budget)['data']
+            except (OSError, http.client.HTTPException, ValueError, KeyError) as e:
+                print(f"daemon: {e}, scraping in-process", file=sys.stderr)
+                daemon = None
+        if not daemon:
+            result = scrape_fragrantica(args[0], use_cache=use_cache, refresh=refresh, escalate=escalate,
+                                        budget=CreditBudget(budget), lean=lean, adaptive=adaptive)
+        if not result:
+            sys.exit(1)
+        if writer:
+            writer.write(make_record(args[0], result))
+        else:
+            print(json.dumps(make_record(args[0], result), ensure_ascii=False, indent=2))
     else:
-        sys.exit(1)
+        # Batch: one JSON object per line, in completion order
+        writer = writer or JsonlWriter(sys.stdout)
+        if daemon:
+            results = ((e['url'], e['data']) for e in daemon.batch('fragrantica', args, concurrency=concurrency,
+                                                                 budget=budget, use_cache=use_cache,
+                                                                 refresh=refresh, escalate=escalate, lean=lean,
+                                                                 adaptive=adaptive)
+                       if not e.get('done'))
+        else:
+            results = scrape_fragrantica_many(args, concurrency=concurrency, budget=budget,
+                                              use_cache=use_cache, refresh=refresh, escalate=escalate,
+                                              lean=lean, adaptive=adaptive)
+        failed = 0
+        for url, result in results:
+            if result is None:
+                failed += 1
+                continue
+            writer.write(make_record(url, result))
+        if failed:
+            print(f"{failed}/{len(args)} pages failed", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Keep-alive HTTP(S) connection pool on top of http.client.
+
+One pool per origin; idle connections are reused across requests and
+threads, so a batch pays the TCP + TLS handshake once per worker instead of
+once per page. Response bodies are read in chunks and can be streamed
+straight into a file-like sink.
+"""
+
+import io
+import queue
+import http.client
+import urllib.parse
+
+CHUNK_SIZE = 64 * 1024
+
+# Errors that mean a reused keep-alive connection went stale under us
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                 ConnectionResetError, BrokenPipeError)
+
+
+class Response:
+    """Status, headers and (unless streamed to a sink) the raw body."""
+
+    def __init__(self, status, reason, headers, body, size):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.size = size
+
+    def header(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def text(self):
+        """Decode the body using the charset from Content-Type (utf-8 by default)."""
+        charset = 'utf-8'
+        for part in self.header('content-type', '').split(';'):
+            part = part.strip()
+            if part.lower().startswith('charset='):
+                charset = part.split('=', 1)[1].strip('"\'') or charset
+        try:
+            return self.body.decode(charset, errors='replace')
+        except LookupError:
+            return self.body.decode('utf-8', errors='replace')
+
+
+class ConnectionPool:
+    """Reusable connections to a single scheme://host:port."""
+
+    def __init__(self, base_url, maxsize=16, timeout=60):
+        parts = urllib.parse.urlsplit(base_url)
+        self.scheme = parts.scheme or 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(maxsize)
+
+    def _new_connection(self, timeout):
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=timeout)
+
+    def _checkout(self, timeout):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            return self._new_connection(timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _checkin(self, conn):
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method, path, headers=None, sink=None, timeout=None):
+        """Send a request and read the full response.
+
+        If sink (a writable binary file-like object) is given the body is
+        streamed into it and Response.body is None; otherwise the body is
+        collected in memory. Raises OSError/http.client errors on failure.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        conn, reused = self._checkout(timeout)
+        try:
+            try:
+                conn.request(method, path, headers=headers or {})
+                resp = conn.getresponse()
+            except _STALE_ERRORS:
+                if not reused:
+                    raise
+                # Server dropped an idle keep-alive connection: retry once on a fresh one
+                conn.close()
+                conn = self._new_connection(timeout)
+                conn.request(method, path, headers=headers or {})
+                resp = conn.getresponse()
+
+            out = sink if sink is not None else io.BytesIO()
+            size = 0
+            while True:
+                chunk = resp.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+                size += len(chunk)
+            headers_ = {k.lower(): v for k, v in resp.getheaders()}
+            result = Response(resp.status, resp.reason, headers_,
+                              None if sink is not None else out.getvalue(), size)
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self._checkin(conn)
+        return result
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
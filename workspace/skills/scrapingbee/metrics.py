@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Structured metrics for the scrape → parse → merge pipeline.
+
+Hooks in scrape(), parse_fragrantica() and the merge record into the
+process-wide METRICS registry; nothing is recorded until it is enabled
+(configure(), --metrics PATH on the CLIs, or SCRAPINGBEE_METRICS=PATH in
+the environment). At exit the registry is written twice:
+
+  PATH        — JSON: counters, latency summaries, the last requests
+  PATH.prom   — Prometheus text format (node_exporter textfile collector)
+
+--profile cpu|memory additionally captures cProfile stats (PATH.pstats plus
+the top functions in the JSON) or tracemalloc's top allocation sites.
+
+Usage: metrics.py FILE.json   (pretty-print a metrics file)
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Latency histogram buckets, seconds
+BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Per-request records kept for the JSON file
+MAX_REQUESTS = 5000
+PROFILE_TOP = 30
+
+HELP = {
+    'scrapingbee_requests_total': 'ScrapingBee requests by outcome',
+    'scrapingbee_response_bytes_total': 'Response bytes received (or read from cache)',
+    'scrapingbee_credits_total': 'Credits consumed, derived from render_js/premium_proxy',
+    'scrapingbee_request_seconds': 'Request latency, including cache lookups',
+    'scrapingbee_retries_total': 'Requests retried after a 429/5xx or network error',
+    'scrapingbee_circuit_opened_total': 'Times a target host circuit opened',
+    'scrapingbee_circuit_rejected_total': 'Requests refused because the host circuit was open',
+    'fragrantica_wait_attempts_total': 'Adaptive-wait fetch attempts by outcome',
+    'fragrantica_parse_seconds': 'parse_fragrantica latency',
+    'fragrantica_parse_pages_total': 'Pages parsed',
+    'fragrantica_parse_field_total': 'Pages where the field was extracted',
+    'fragrantica_parse_chars_total': 'HTML characters parsed',
+    'merge_stage_seconds': 'Merge stage latency',
+    'merge_records_total': 'Merge records by result',
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+    return '{' + body + '}'
+
+
+class Metrics:
+    """Thread-safe counters, latency histograms and a ring of request records."""
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        self.counters = {}
+        self.histograms = {}
+        self.requests = deque(maxlen=MAX_REQUESTS)
+        self.profile = None
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.requests.clear()
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self.lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = {'count': 0, 'sum': 0.0, 'min': seconds, 'max': seconds,
+                                            'buckets': [0] * len(BUCKETS)}
+            h['count'] += 1
+            h['sum'] += seconds
+            h['min'] = min(h['min'], seconds)
+            h['max'] = max(h['max'], seconds)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    h['buckets'][i] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def request(self, url, status, size, seconds, credits, cache_hit, render_js, premium_proxy):
+        """One scrape: status is the HTTP status, or 'error' for network failures."""
+        if not self.enabled:
+            return
+        labels = {'status': status, 'cache': 'hit' if cache_hit else 'miss',
+                  'render_js': bool(render_js), 'premium': bool(premium_proxy)}
+        self.inc('scrapingbee_requests_total', **labels)
+        self.inc('scrapingbee_response_bytes_total', size or 0, cache=labels['cache'])
+        if credits:
+            self.inc('scrapingbee_credits_total', credits, render_js=bool(render_js),
+                     premium=bool(premium_proxy))
+        self.observe('scrapingbee_request_seconds', seconds, cache=labels['cache'])
+        with self.lock:
+            self.requests.append({'at': round(time.time(), 3), 'url': url, 'status': status,
+                                  'bytes': size, 'seconds': round(seconds, 4), 'credits': credits,
+                                  'cache_hit': cache_hit})
+
+    def parse(self, data, fields, seconds, size):
+        """One parse_fragrantica call: latency and which requested fields came out."""
+        if not self.enabled:
+            return
+        self.observe('fragrantica_parse_seconds', seconds)
+        self.inc('fragrantica_parse_pages_total')
+        self.inc('fragrantica_parse_chars_total', size)
+        for field in fields:
+            value = data.get(field)
+            if isinstance(value, dict):
+                value = any(value.values())
+            if value:
+                self.inc('fragrantica_parse_field_total', field=field)
+
+    def snapshot(self):
+        with self.lock:
+            counters = [{'name': n, 'labels': dict(k), 'value': v}
+                        for (n, k), v in sorted(self.counters.items())]
+            histograms = [{'name': n, 'labels': dict(k), 'count': h['count'], 'sum': round(h['sum'], 6),
+                           'mean': round(h['sum'] / h['count'], 6), 'min': round(h['min'], 6),
+                           'max': round(h['max'], 6)}
+                          for (n, k), h in sorted(self.histograms.items())]
+            requests = list(self.requests)
+        snap = {'started_at': self.started_at,
+                'written_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'pid': os.getpid(), 'argv': sys.argv,
+                'counters': counters, 'histograms': histograms, 'requests': requests}
+        if self.profile:
+            snap['profile'] = self.profile
+        return snap
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        described = set()
+        for (name, key), value in counters:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(key)} {value}")
+        for (name, key), h in histograms:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            for bound, count in zip(BUCKETS, h['buckets']):
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', str(bound))])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {h['count']}")
+            lines.append(f"{name}_sum{_format_labels(key)} {h['sum']:.6f}")
+            lines.append(f"{name}_count{_format_labels(key)} {h['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write PATH (JSON) and PATH.prom (Prometheus), each atomically."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        prom_path = (path[:-5] if path.endswith('.json') else path) + '.prom'
+        for target, text in ((path, json.dumps(self.snapshot(), ensure_ascii=False, indent=1)),
+                             (prom_path, self.to_prometheus())):
+            tmp = f"{target}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, target)
+        return path, prom_path
+
+
+METRICS = Metrics()
+
+
+def _start_profile(kind):
+    if kind == 'cpu':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def stop(path):
+            import pstats
+            profiler.disable()
+            stats_path = (path[:-5] if path.endswith('.json') else path) + '.pstats'
+            profiler.dump_stats(stats_path)
+            stats = pstats.Stats(profiler)
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+            METRICS.profile = {'kind': 'cpu', 'pstats': stats_path, 'top': [
+                {'function': f"{filename}:{line}({func})", 'calls': nc,
+                 'self_seconds': round(tt, 6), 'cumulative_seconds': round(ct, 6)}
+                for (filename, line, func), (cc, nc, tt, ct, _) in rows[:PROFILE_TOP]]}
+        return stop
+    if kind == 'memory':
+        import tracemalloc
+        tracemalloc.start()
+
+        def stop(path):
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            METRICS.profile = {'kind': 'memory', 'current_bytes': current, 'peak_bytes': peak, 'top': [
+                {'site': str(stat.traceback), 'bytes': stat.size, 'blocks': stat.count}
+                for stat in snapshot.statistics('lineno')[:PROFILE_TOP]]}
+        return stop
+    raise ValueError(f"unknown profile kind: {kind}")
+
+
+_CONFIG = {}
+
+
+def configure(path, profile=None):
+    """Enable recording and write PATH/PATH.prom when the process exits.
+
+    Safe to call again (the environment configures at import, then the CLI
+    from --metrics): a later call only changes the output path, and starts
+    a profile if none is running yet.
+    """
+    METRICS.enabled = True
+    if not _CONFIG:
+        atexit.register(_flush)
+    _CONFIG['path'] = path
+    if profile and not _CONFIG.get('stop_profile'):
+        _CONFIG['stop_profile'] = _start_profile(profile)
+    return METRICS
+
+
+def _flush():
+    path = _CONFIG['path']
+    if _CONFIG.get('stop_profile'):
+        _CONFIG['stop_profile'](path)
+    written = METRICS.write(path)
+    print(f"Metrics written to {' and '.join(written)}", file=sys.stderr)
+
+
+def add_arguments(parser):
+    """--metrics/--profile for the pipeline CLIs."""
+    parser.add_argument('--metrics', metavar='FILE.json',
+                        default=os.environ.get('SCRAPINGBEE_METRICS'),
+                        help='write JSON + Prometheus (.prom) metrics here at exit')
+    parser.add_argument('--profile', choices=('cpu', 'memory'),
+                        help='also capture a cProfile or tracemalloc profile (needs --metrics)')
+
+
+def configure_from_args(args):
+    if args.metrics:
+        configure(args.metrics, args.profile)
+    elif args.profile:
+        print("ERROR: --profile needs --metrics FILE.json", file=sys.stderr)
+        sys.exit(1)
+
+
+# Library users (crawl jobs, the merge) get metrics from the environment alone
+if os.environ.get('SCRAPINGBEE_METRICS') and __name__ != '__main__':
+    configure(os.environ['SCRAPINGBEE_METRICS'], os.environ.get('SCRAPINGBEE_PROFILE') or None)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(f"Usage: {sys.argv[0]} FILE.json")
+        sys.exit(1)
+    with open(sys.argv[1], encoding='utf-8') as f:
+        data = json.load(f)
+    for c in data['counters']:
+        print(f"{c['name']:<36} {json.dumps(c['labels'], ensure_ascii=False):<60} {c['value']}")
+    for h in data['histograms']:
+        print(f"{h['name']:<36} {json.dumps(h['labels'], ensure_ascii=False):<60} "
+              f"n={h['count']} mean={h['mean'] * 1000:.1f}ms max={h['max'] * 1000:.1f}ms")
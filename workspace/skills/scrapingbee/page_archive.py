@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Append-only archive of every page fetched from the API.
+
+The response cache forgets pages after its TTL and LRU cap; the archive
+keeps them, so a parser fix can be applied to everything ever fetched
+without spending credits again.
+
+Layout (SCRAPINGBEE_ARCHIVE_DIR, default archive/ next to the skill):
+  pages-0001.gz   segments; every page is one independent gzip member,
+                  so a segment is also a plain multi-member .gz file.
+                  A new segment starts after SEGMENT_BYTES.
+  index.jsonl     one line per page: url, fetched_at, request params
+                  (response_cache.request_params),
+                  segment, offset, length (compressed), size, sha1
+
+A page is read by random access: mmap the segment, slice
+[offset:offset + length], gunzip. Pages identical to the last archived
+copy of the same URL and params are not stored again. Appends take an
+exclusive lock on the index, so the daemon and CLIs can share an archive.
+
+append_file() archives a page straight from a file (scrape_to_file's
+streamed pages), reading and compressing it in chunks.
+
+reparse runs parse_fragrantica over the archived pages (or lean
+extracts) of every Fragrantica URL on a process pool: the newest copy
+that parses complete, trying the newest copy from each ladder rung
+(plain, JS, premium) newest first, else the most complete one. It writes
+merge-ready JSONL (with scraped_at = when the page was fetched); --merge
+passes it straight to merge_fragrantica_data.py.
+
+Usage:
+  page_archive.py stats
+  page_archive.py list [--match TEXT]
+  page_archive.py cat URL [--out FILE]
+  page_archive.py reparse [--out FILE.jsonl] [--workers N] [--match TEXT] [--merge [--dry-run]]
+"""
+
+import os
+import sys
+import gzip
+import json
+import mmap
+import fcntl
+import shutil
+import hashlib
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from response_cache import request_params
+
+DEFAULT_DIR = os.environ.get(
+    'SCRAPINGBEE_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'))
+ENABLED = os.environ.get('SCRAPINGBEE_ARCHIVE', 'on').lower() not in ('off', 'no', '0')
+SEGMENT_BYTES = 256 * 1024 * 1024
+MERGE_SCRIPT = '/data/workspace/merge_fragrantica_data.py'
+REPARSE_OUT = '/tmp/fragrantica_reparse.jsonl'
+READ_CHUNK = 1024 * 1024
+
+
+def rung(entry):
+    """Ladder rung of an entry's request: 0 plain, 1 JS, 2 premium proxy."""
+    params = entry['params']
+    return 2 if params[3] else 1 if params[1] else 0
+
+
+class PageArchive:
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.jsonl')
+        self.lock = threading.Lock()
+        self._maps = {}
+        # Last sha1 per (url, params), to skip storing the same page twice, kept in
+        # step with the index (other processes append too) from _pos on
+        self._last = {}
+        self._pos = 0
+        self._segment = 1
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"pages-{segment:04d}.gz")
+
+    def entries(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def candidates(self, match=None, keep=None):
+        """Per URL (optionally only URLs containing match, entries keep() accepts), the newest
+        entry of every rung it was fetched with, newest first; URLs in first-fetch order."""
+        by_url = {}
+        for pos, entry in enumerate(self.entries()):
+            if (match is None or match in entry['url']) and (keep is None or keep(entry)):
+                by_url.setdefault(entry['url'], {})[rung(entry)] = (pos, entry)
+        # The index is append-only, so a later line is a newer entry
+        return [[entry for _, entry in sorted(rungs.values(), key=lambda found: found[0], reverse=True)]
+                for rungs in by_url.values()]
+
+    def latest(self, match=None, keep=None):
+        """Newest entry per URL from the highest rung it was fetched with, in first-fetch order:
+        a later plain fetch does not hide a JS or premium one."""
+        return [max(found, key=rung) for found in self.candidates(match, keep)]
+
+    def append(self, url, data, render_js=True, wait_ms=3000, premium_proxy=False, **extras):
+        """Archive one page (str or bytes). Returns its index entry, or None if unchanged."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        member = gzip.compress(data, compresslevel=6, mtime=0)
+        params = request_params(url, render_js, wait_ms, premium_proxy, **extras)
+        return self._append(url, params, hashlib.sha1(data).hexdigest(), len(data), lambda f: f.write(member))
+
+    def append_file(self, url, path, render_js=True, wait_ms=3000, premium_proxy=False, **extras):
+        """Archive the page in file path without loading it into memory. Same result as append()."""
+        digest = hashlib.sha1()
+        size = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+                digest.update(chunk)
+                size += len(chunk)
+
+        def write_member(out):
+            with open(path, 'rb') as src, gzip.GzipFile(filename='', mode='wb', fileobj=out,
+                                                         compresslevel=6, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, READ_CHUNK)
+
+        params = request_params(url, render_js, wait_ms, premium_proxy, **extras)
+        return self._append(url, params, digest.hexdigest(), size, write_member)
+
+    def _append(self, url, params, digest, size, write_member):
+        """Write one gzip member (write_member(segment_file)) and its index line, under the lock."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock, open(self.index_path, 'a+b') as index:
+            fcntl.flock(index, fcntl.LOCK_EX)
+            try:
+                index.seek(self._pos)
+                for line in iter(index.readline, b''):
+                    if line.strip():
+                        e = json.loads(line)
+                        self._last[json.dumps(e['params'], sort_keys=True)] = e['sha1']
+                        self._segment = e['segment']
+                self._pos = index.tell()
+                if self._last.get(json.dumps(params, sort_keys=True)) == digest:
+                    return None
+                path = self._segment_path(self._segment)
+                if os.path.exists(path) and os.path.getsize(path) >= SEGMENT_BYTES:
+                    self._segment += 1
+                    path = self._segment_path(self._segment)
+                with open(path, 'ab') as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    write_member(f)
+                    length = f.tell() - offset
+                entry = {'url': url, 'fetched_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                         'params': params, 'segment': self._segment, 'offset': offset, 'length': length,
+                         'size': size, 'sha1': digest}
+                index.seek(0, os.SEEK_END)
+                index.write((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8'))
+                index.flush()
+                self._pos = index.tell()
+                self._last[json.dumps(params, sort_keys=True)] = digest
+                return entry
+            finally:
+                fcntl.flock(index, fcntl.LOCK_UN)
+
+    def read(self, entry):
+        """The page of one index entry, as text."""
+        segment = entry['segment']
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < entry['offset'] + entry['length']:
+            # New segment, or it grew since it was mapped
+            if mapped is not None:
+                mapped.close()
+            with open(self._segment_path(segment), 'rb') as f:
+                mapped = self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return gzip.decompress(mapped[entry['offset']:entry['offset'] + entry['length']]).decode('utf-8')
+
+    def stats(self):
+        entries = self.entries()
+        segments = sorted({e['segment'] for e in entries})
+        return {
+            'directory': self.directory,
+            'pages': len(entries),
+            'urls': len({e['url'] for e in entries}),
+            'segments': len(segments),
+            'bytes': sum(os.path.getsize(self._segment_path(s)) for s in segments),
+            'raw_bytes': sum(e['size'] for e in entries),
+        }
+
+
+ARCHIVE = PageArchive()
+
+
+def archive_page(url, data, render_js=True, wait_ms=3000, premium_proxy=False, **extras):
+    """Archive a freshly fetched page; never lets an archive problem fail the scrape."""
+    if not ENABLED:
+        return
+    try:
+        ARCHIVE.append(url, data, render_js, wait_ms, premium_proxy, **extras)
+    except OSError as e:
+        print(f"ERROR: page archive: {e}", file=sys.stderr)
+
+
+def archive_file(url, path, render_js=True, wait_ms=3000, premium_proxy=False, **extras):
+    """archive_page for a page already written to path, streamed from the file."""
+    if not ENABLED:
+        return
+    try:
+        ARCHIVE.append_file(url, path, render_js, wait_ms, premium_proxy, **extras)
+    except OSError as e:
+        print(f"ERROR: page archive: {e}", file=sys.stderr)
+
+
+_worker_archive = None
+
+
+def _reparse_entry(args):
+    """Worker: parse the candidate copies of one URL, newest first, and return the record of the
+    first complete one, else of the most complete (higher rung on ties). Runs in a pool process."""
+    global _worker_archive
+    directory, candidates = args
+    from fragrantica_scraper import parse_fragrantica, parse_lean, make_record, missing_fields
+    if _worker_archive is None or _worker_archive.directory != directory:
+        _worker_archive = PageArchive(directory)
+    best = None
+    for entry in candidates:
+        body = _worker_archive.read(entry)
+        extras = entry['params'][4] if len(entry['params']) > 4 else {}
+        if 'extract_rules' in extras:
+            # A lean fetch: the body is the extract_rules JSON, not the page
+            data = parse_lean(entry['url'], body)
+        else:
+            data = parse_fragrantica(body)
+        score = (len(missing_fields(data)), -rung(entry))
+        if best is None or score < best[0]:
+            best = (score, entry, data)
+        if not score[0]:
+            break
+    _, entry, data = best
+    record = make_record(entry['url'], data)
+    record['scraped_at'] = entry['fetched_at']
+    return record
+
+
+def _reparsable(entry):
+    """Full pages and LEAN_PROFILE extracts; other extract_rules results are not pages."""
+    from fragrantica_scraper import LEAN_PROFILE
+    extras = entry['params'][4] if len(entry['params']) > 4 else {}
+    return extras.get('extract_rules', LEAN_PROFILE['extract_rules']) == LEAN_PROFILE['extract_rules']
+
+
+def reparse(archive, out_path, workers=None, match='fragrantica.'):
+    """Parse the best archived copy of every matching URL into out_path. Returns the record count."""
+    entries = archive.candidates(match, keep=_reparsable)
+    tmp = out_path + '.tmp'
+    count = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(tmp, 'w', encoding='utf-8') as out:
+        jobs = ((archive.directory, entry) for entry in entries)
+        for record in pool.map(_reparse_entry, jobs, chunksize=8):
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+    os.replace(tmp, out_path)
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archive of every fetched page.')
+    parser.add_argument('--dir', default=DEFAULT_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats')
+    p = sub.add_parser('list')
+    p.add_argument('--match')
+    p = sub.add_parser('cat', help='print the newest archived copy of a URL')
+    p.add_argument('url')
+    p.add_argument('--out')
+    p = sub.add_parser('reparse', help='parse archived Fragrantica pages into merge-ready JSONL')
+    p.add_argument('--out', default=REPARSE_OUT)
+    p.add_argument('--workers', type=int)
+    p.add_argument('--match', default='fragrantica.')
+    p.add_argument('--merge', action='store_true', help='run merge_fragrantica_data.py on the result')
+    p.add_argument('--dry-run', action='store_true', help='with --merge: merge without writing')
+    args = parser.parse_args()
+
+    archive = PageArchive(args.dir)
+    if args.command == 'stats':
+        print(json.dumps(archive.stats(), indent=2))
+    elif args.command == 'list':
+        for e in archive.entries():
+            if not args.match or args.match in e['url']:
+                print(f"{e['fetched_at']}  {e['size']:>8}  {e['url']}")
+    elif args.command == 'cat':
+        found = [e for e in archive.entries() if e['url'] == args.url]
+        if not found:
+            print(f"ERROR: {args.url} is not in the archive", file=sys.stderr)
+            sys.exit(1)
+        html = archive.read(found[-1])
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as f:
+                f.write(html)
+        else:
+            print(html)
+    elif args.command == 'reparse':
+        count = reparse(archive, args.out, workers=args.workers, match=args.match)
+        print(f"Re-parsed {count} pages into {args.out}", file=sys.stderr)
+        if args.merge and count:
+            cmd = [sys.executable, MERGE_SCRIPT, args.out] + (['--dry-run'] if args.dry_run else [])
+            sys.exit(subprocess.run(cmd).returncode)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+On-disk cache for ScrapingBee responses.
+
+Entries are gzip-compressed HTML stored under a content-addressed key built
+from the request parameters (url, render_js, wait, premium_proxy and, when
+set, extract_rules / block_resources / wait_for), so the same page fetched
+the same way never costs credits twice within the TTL.
+
+Timestamps live on the files themselves:
+  mtime — when the page was fetched (TTL check)
+  atime — when the entry was last read (LRU eviction, set explicitly)
+
+Writes keep a running total of the cache size (one directory scan, on
+the first write) and only prune when it goes over max_bytes, or every
+PRUNE_EVERY writes to pick up what other processes sharing the
+directory have added. Eviction goes down to PRUNE_TO of the cap.
+
+Usage: response_cache.py [stats|prune|clear]
+"""
+
+import os
+import sys
+import gzip
+import time
+import json
+import shutil
+import hashlib
+import threading
+
+DEFAULT_DIR = os.environ.get(
+    'SCRAPINGBEE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+DEFAULT_TTL = float(os.environ.get('SCRAPINGBEE_CACHE_TTL', 7 * 24 * 3600))
+DEFAULT_MAX_BYTES = int(os.environ.get('SCRAPINGBEE_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+# Writes between full rescans when the running total stays under the cap
+PRUNE_EVERY = 1000
+# Eviction goes this far below the cap, so the next writes do not prune again straight away
+PRUNE_TO = 0.9
+
+
+def request_params(url, render_js=True, wait_ms=3000, premium_proxy=False, extract_rules=None,
+                   block_resources=None, wait_for=None):
+    """The parameters that identify one ScrapingBee request, as a JSON-able list.
+
+    Optional API parameters are only appended when set, so requests without
+    them keep the keys they always had.
+    """
+    params = [url, bool(render_js), int(wait_ms or 0), bool(premium_proxy)]
+    extras = {name: value for name, value in (('extract_rules', extract_rules),
+                                              ('block_resources', block_resources),
+                                              ('wait_for', wait_for)) if value is not None}
+    if extras:
+        params.append(extras)
+    return params
+
+
+def cache_key(url, render_js=True, wait_ms=3000, premium_proxy=False, **extras):
+    """Stable key for one ScrapingBee request (extras: extract_rules, block_resources, wait_for)."""
+    params = json.dumps(request_params(url, render_js, wait_ms, premium_proxy, **extras), sort_keys=True)
+    return hashlib.sha256(params.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Compressed, TTL-bounded, size-capped page cache."""
+
+    def __init__(self, directory=DEFAULT_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._total = None  # bytes on disk, as of the last scan plus this process's writes
+        self._writes = 0
+
+    def _size(self, path):
+        try:
+            return os.stat(path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _stored(self, path, old_size):
+        """Account for an entry just written over old_size bytes; prune when over the cap or due."""
+        if self.max_bytes is None:
+            return
+        with self.lock:
+            if self._total is None:
+                self._total = sum(e[2] for e in self._entries())
+            else:
+                self._total += self._size(path) - old_size
+            self._writes += 1
+            due = self._total > self.max_bytes or self._writes >= PRUNE_EVERY
+        if due:
+            self.prune()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.html.gz')
+
+    def get(self, key):
+        """Return cached HTML for key, or None if missing or expired."""
+        path = self._path(key)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if self.ttl is not None and now - st.st_mtime > self.ttl:
+            return None
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                html = f.read()
+        except (OSError, EOFError):
+            return None
+        os.utime(path, (now, st.st_mtime))
+        return html
+
+    def contains(self, key):
+        """True if a fresh entry exists for key (does not touch its LRU stamp)."""
+        try:
+            mtime = os.stat(self._path(key)).st_mtime
+        except FileNotFoundError:
+            return False
+        return self.ttl is None or time.time() - mtime <= self.ttl
+
+    def get_to_file(self, key, dest):
+        """Decompress a fresh entry into dest. Returns bytes written or None."""
+        path = self._path(key)
+        if not self.contains(key):
+            return None
+        try:
+            with gzip.open(path, 'rb') as src, open(dest, 'wb') as out:
+                shutil.copyfileobj(src, out)
+        except (OSError, EOFError):
+            return None
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+        return os.path.getsize(dest)
+
+    def put(self, key, html):
+        """Store HTML under key (atomically) and evict if over the size cap."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, 'wt', encoding='utf-8', compresslevel=6) as f:
+            f.write(html)
+        old_size = self._size(path)
+        os.replace(tmp, path)
+        self._stored(path, old_size)
+
+    def put_file(self, key, src):
+        """Store the contents of file src under key without loading it into memory."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(src, 'rb') as f, gzip.open(tmp, 'wb', compresslevel=6) as out:
+            shutil.copyfileobj(f, out)
+        old_size = self._size(path)
+        os.replace(tmp, path)
+        self._stored(path, old_size)
+
+    def _entries(self):
+        """List (atime, mtime, size, path) for every cache entry."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for sub in os.listdir(self.directory):
+            subdir = os.path.join(self.directory, sub)
+            if not os.path.isdir(subdir):
+                continue
+            for name in os.listdir(subdir):
+                if not name.endswith('.html.gz'):
+                    continue
+                path = os.path.join(subdir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_atime, st.st_mtime, st.st_size, path))
+        return entries
+
+    def prune(self):
+        """Drop expired entries, then, when over max_bytes, least recently used ones until
+        under PRUNE_TO of it."""
+        removed = 0
+        with self.lock:
+            now = time.time()
+            live = []
+            for atime, mtime, size, path in self._entries():
+                if self.ttl is not None and now - mtime > self.ttl:
+                    removed += _unlink(path)
+                else:
+                    live.append((atime, size, path))
+            total = sum(size for _, size, _ in live)
+            if self.max_bytes is not None and total > self.max_bytes:
+                for atime, size, path in sorted(live):
+                    if total <= self.max_bytes * PRUNE_TO:
+                        break
+                    removed += _unlink(path)
+                    total -= size
+            self._total = total
+            self._writes = 0
+        return removed
+
+    def clear(self):
+        removed = 0
+        with self.lock:
+            for _, _, _, path in self._entries():
+                removed += _unlink(path)
+            self._total = 0
+        return removed
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'directory': self.directory,
+            'entries': len(entries),
+            'bytes': sum(e[2] for e in entries),
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl,
+        }
+
+
+def _unlink(path):
+    try:
+        os.remove(path)
+        return 1
+    except FileNotFoundError:
+        return 0
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    cache = ResponseCache()
+    if command == 'stats':
+        print(json.dumps(cache.stats(), indent=2))
+    elif command == 'prune':
+        print(f"Removed {cache.prune()} entries")
+    elif command == 'clear':
+        print(f"Removed {cache.clear()} entries")
+    else:
+        print(f"Usage: {sys.argv[0]} [stats|prune|clear]")
+        sys.exit(1)
@@ -3,12 +3,146 @@
 
 import sys
 import os
+import time
+import hashlib
+import argparse
+import threading
 import urllib.parse
-import subprocess
+import functools
+import http.client
 import json
+import random
+import shutil
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from response_cache import ResponseCache, cache_key
+from http_pool import ConnectionPool
+from page_archive import archive_page, archive_file
+from metrics import METRICS, add_arguments as add_metrics_arguments, configure_from_args
+
+# SCRAPINGBEE_API_URL (or set_api_url) points the client at another endpoint, e.g. benchmarks/standin_api.py
+API_URL = os.environ.get('SCRAPINGBEE_API_URL', 'https://app.scrapingbee.com/api/v1')
+DEFAULT_TIMEOUT = float(os.environ.get('SCRAPINGBEE_TIMEOUT', 90))
+# Throttling and server errors are retried with exponential backoff (plus jitter)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRIES = int(os.environ.get('SCRAPINGBEE_RETRIES', 3))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+# Consecutive failed requests to one target host (or, for 429, to the API) that open
+# its circuit, and for how long
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 60.0
+
+# Shared page cache; callers may swap in their own ResponseCache
+CACHE = ResponseCache()
+# Keep-alive connections to the API, shared by all threads
+POOL = ConnectionPool(API_URL, timeout=DEFAULT_TIMEOUT)
+
+
+def set_api_url(url, timeout=DEFAULT_TIMEOUT):
+    """Send all further requests to url (scheme://host[:port]/path), on a fresh connection pool."""
+    global API_URL, POOL
+    old = POOL
+    API_URL = url
+    POOL = ConnectionPool(url, timeout=timeout)
+    old.close()
+
+
+class InFlight:
+    """Coalesces identical concurrent requests: the first caller fetches, the rest wait for its result."""
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def run(self, key, fetch):
+        """Return (result, shared); shared is True when another caller's fetch was reused."""
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+        if not leader:
+            METRICS.inc('scrapingbee_coalesced_total')
+            return future.result(), True
+        try:
+            result = fetch()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+
+INFLIGHT = InFlight()
+
+
+class CircuitBreaker:
+    """Circuit breaker keyed by host, for 429/5xx and network failures.
+
+    After `threshold` consecutive failures a host's circuit opens: requests
+    to it fail at once, without reaching the API, for `cooldown` seconds.
+    Then a single trial request is let through; success closes the
+    circuit, failure opens it for another cooldown. request_with_retry
+    keys 5xx/network failures on the target host and 429s on the API
+    itself (the account's rate limit).
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = {}
+        self.opened = {}
+        self.trials = set()
+        self.lock = threading.Lock()
+
+    def allow(self, host):
+        with self.lock:
+            opened = self.opened.get(host)
+            if opened is None:
+                return True
+            if time.monotonic() - opened < self.cooldown or host in self.trials:
+                return False
+            self.trials.add(host)
+            return True
+
+    def retry_in(self, host):
+        """Seconds until host's circuit lets a trial request through (0 if closed)."""
+        with self.lock:
+            opened = self.opened.get(host)
+        return max(0.0, opened + self.cooldown - time.monotonic()) if opened is not None else 0.0
+
+    def release(self, host):
+        """Give back a trial slot allow() handed out for a request that was not judged."""
+        with self.lock:
+            self.trials.discard(host)
+
+    def success(self, host):
+        with self.lock:
+            self.failures.pop(host, None)
+            self.opened.pop(host, None)
+            self.trials.discard(host)
+
+    def failure(self, host):
+        with self.lock:
+            self.trials.discard(host)
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if self.failures[host] < self.threshold and host not in self.opened:
+                return
+            self.opened[host] = time.monotonic()
+        METRICS.inc('scrapingbee_circuit_opened_total', host=host)
+        print(f"ERROR: {host} keeps failing, pausing requests to it for {self.cooldown:g}s", file=sys.stderr)
+
+
+BREAKER = CircuitBreaker()
+
+@functools.lru_cache(maxsize=None)
 def get_api_key():
-    """Load API key from .env file."""
+    """Load API key from .env file (read once per process)."""
     env_path = os.path.join(os.path.dirname(__file__), '.env')
     if os.path.exists(env_path):
         with open(env_path) as f:
@@ -21,51 +155,457 @@ def get_api_key():
     print("ERROR: No API key found. Set SCRAPINGBEE_API_KEY in .env or environment.", file=sys.stderr)
     sys.exit(1)
 
-def scrape(url, render_js=True, wait_ms=3000, premium_proxy=False):
-    """Scrape a URL using ScrapingBee API. Returns HTML string."""
-    api_key = get_api_key()
-    encoded_url = urllib.parse.quote(url, safe='')
-    
-    api_url = f"https://app.scrapingbee.com/api/v1?api_key={api_key}&url={encoded_url}"
-    if render_js:
-        api_url += "&render_js=true"
+def credit_cost(render_js=True, premium_proxy=False):
+    """Credits ScrapingBee charges for one request (see SKILL.md)."""
+    if premium_proxy:
+        return 25 if render_js else 10
+    return 5 if render_js else 1
+
+def cached_page(url, render_js=True, wait_ms=3000, premium_proxy=False, **extras):
+    """Return the cached HTML for this exact request, or None."""
+    return CACHE.get(cache_key(url, render_js, wait_ms, premium_proxy, **extras))
+
+def api_request(url, render_js=True, wait_ms=3000, premium_proxy=False, sink=None, timeout=None,
+                extract_rules=None, block_resources=None, wait_for=None):
+    """Send one request to the ScrapingBee API over the shared keep-alive pool.
+
+    extract_rules   -- dict (or JSON string) of CSS-selector rules; the API
+                       then returns the extracted JSON instead of the page
+    block_resources -- True/False to block or load images and CSS (the API
+                       default is to block them)
+    wait_for        -- CSS selector to wait for before returning (JS only)
+
+    Returns an http_pool.Response (body streamed into sink if given), or
+    None if the request failed at the network level.
+    """
+    # render_js defaults to true on the API side, so plain requests must say so
+    params = {'api_key': get_api_key(), 'url': url, 'render_js': 'true' if render_js else 'false'}
     if wait_ms:
-        api_url += f"&wait={wait_ms}"
+        params['wait'] = wait_ms
     if premium_proxy:
-        api_url += "&premium_proxy=true"
-    
-    result = subprocess.run(
-        ['curl', '-s', '-w', '\n%{http_code}', api_url],
-        capture_output=True, text=True, timeout=60
-    )
-    
-    output = result.stdout
-    lines = output.rsplit('\n', 1)
-    html = lines[0] if len(lines) > 1 else output
-    status = lines[1] if len(lines) > 1 else '000'
-    
-    if status != '200':
-        print(f"ERROR: HTTP {status}", file=sys.stderr)
-        if len(html) < 500:
-            print(html, file=sys.stderr)
+        params['premium_proxy'] = 'true'
+    if extract_rules is not None:
+        params['extract_rules'] = (extract_rules if isinstance(extract_rules, str)
+                                   else json.dumps(extract_rules, ensure_ascii=False, separators=(',', ':')))
+    if block_resources is not None:
+        params['block_resources'] = 'true' if block_resources else 'false'
+    if wait_for and render_js:
+        params['wait_for'] = wait_for
+    path = f"{urllib.parse.urlsplit(API_URL).path}?{urllib.parse.urlencode(params)}"
+    try:
+        return POOL.request('GET', path, sink=sink, timeout=timeout)
+    except (OSError, http.client.HTTPException) as e:
+        print(f"ERROR: request failed: {e.__class__.__name__}: {e}", file=sys.stderr)
         return None
+
+def backoff_delay(attempt, resp=None):
+    """Seconds to sleep before retry number attempt + 1: exponential with jitter, at least Retry-After."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+    retry_after = resp.header('retry-after') if resp is not None else None
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, min(BACKOFF_MAX, float(retry_after)))
+    return delay
+
+def request_with_retry(url, render_js=True, wait_ms=3000, premium_proxy=False, sink=None, timeout=None,
+                       **extras):
+    """api_request, retried with backoff on 429/5xx/network errors, behind the BREAKER.
+
+    429 means the ScrapingBee account is throttled, whatever the target, so
+    it counts against the API's circuit; 5xx and network errors count
+    against the target host's. Returns the last Response (which may still
+    be an error), or None if the request never got an HTTP answer or a
+    circuit is open. A sink is rewound before every attempt.
+    """
+    host = urllib.parse.urlsplit(url).hostname or ''
+    api = urllib.parse.urlsplit(API_URL).netloc
+    resp = None
+    for attempt in range(MAX_RETRIES + 1):
+        blocked = next((key for key in (api, host) if not BREAKER.allow(key)), None)
+        if blocked is not None:
+            if blocked == host:
+                BREAKER.release(api)
+            METRICS.inc('scrapingbee_circuit_rejected_total')
+            print(f"ERROR: circuit open for {blocked} (retry in {BREAKER.retry_in(blocked):.0f}s), skipping {url}",
+                  file=sys.stderr)
+            return None
+        if sink is not None:
+            sink.seek(0)
+            sink.truncate()
+        resp = api_request(url, render_js, wait_ms, premium_proxy, sink=sink, timeout=timeout, **extras)
+        if resp is not None and resp.status not in RETRY_STATUSES:
+            # Other 4xx answers are about this request, not the host's health
+            BREAKER.success(host)
+            BREAKER.success(api)
+            return resp
+        if resp is not None and resp.status == 429:
+            BREAKER.failure(api)
+            BREAKER.release(host)
+        else:
+            BREAKER.failure(host)
+            # Any other answer means the account is not throttled; a network error says nothing
+            if resp is not None:
+                BREAKER.success(api)
+            else:
+                BREAKER.release(api)
+        if attempt == MAX_RETRIES:
+            break
+        delay = backoff_delay(attempt, resp)
+        status = resp.status if resp is not None else 'error'
+        METRICS.inc('scrapingbee_retries_total', status=status)
+        print(f"HTTP {status} for {url}, retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s", file=sys.stderr)
+        time.sleep(delay)
+    return resp
+
+def _record(url, started, resp, size, render_js, premium_proxy, cache_hit=False):
+    """Per-request metrics; credits are only billed for successful API responses."""
+    if not METRICS.enabled:
+        return
+    status = 200 if cache_hit else (resp.status if resp is not None else 'error')
+    credits = credit_cost(render_js, premium_proxy) if status == 200 and not cache_hit else 0
+    METRICS.request(url, status, size, time.perf_counter() - started, credits, cache_hit,
+                    render_js, premium_proxy)
+
+def _report_error(resp, body):
+    print(f"ERROR: HTTP {resp.status} {resp.reason}", file=sys.stderr)
+    if body and len(body) < 500:
+        print(body.decode('utf-8', errors='replace'), file=sys.stderr)
+
+def scrape(url, render_js=True, wait_ms=3000, premium_proxy=False, use_cache=True, refresh=False,
+           timeout=None, extract_rules=None, block_resources=None, wait_for=None):
+    """Scrape a URL using ScrapingBee API. Returns HTML string.
+
+    Successful responses are kept in the on-disk cache; a cached copy is
+    returned without spending credits unless use_cache=False or refresh=True
+    (refresh still stores the new response). Identical calls made while
+    one is in flight wait for it instead of spending credits again.
+
+    With extract_rules the API runs the selectors itself and the returned
+    string is its JSON result, not the page (see api_request for the
+    extract_rules, block_resources and wait_for options).
+    """
+    extras = dict(extract_rules=extract_rules, block_resources=block_resources, wait_for=wait_for)
+    started = time.perf_counter()
+    if use_cache and not refresh:
+        html = cached_page(url, render_js, wait_ms, premium_proxy, **extras)
+        if html is not None:
+            _record(url, started, None, len(html), render_js, premium_proxy, cache_hit=True)
+            return html
     
+    def fetch():
+        resp = request_with_retry(url, render_js, wait_ms, premium_proxy, timeout=timeout, **extras)
+        _record(url, started, resp, resp.size if resp is not None else 0, render_js, premium_proxy)
+        if resp is None:
+            return None
+        if resp.status != 200:
+            _report_error(resp, resp.body)
+            return None
+        html = resp.text()
+        if use_cache:
+            CACHE.put(cache_key(url, render_js, wait_ms, premium_proxy, **extras), html)
+        archive_page(url, resp.body, render_js, wait_ms, premium_proxy, **extras)
+        return html
+
+    # Threads asking for the same page at the same time share one API call
+    html, _ = INFLIGHT.run(('page', cache_key(url, render_js, wait_ms, premium_proxy, **extras)), fetch)
     return html
 
+def scrape_to_file(url, path, render_js=True, wait_ms=3000, premium_proxy=False, use_cache=True,
+                   refresh=False, timeout=None, extract_rules=None, block_resources=None, wait_for=None):
+    """Like scrape(), but streams the page into path instead of returning it.
+
+    Returns the number of bytes written, or None on failure (path untouched).
+    """
+    extras = dict(extract_rules=extract_rules, block_resources=block_resources, wait_for=wait_for)
+    key = cache_key(url, render_js, wait_ms, premium_proxy, **extras)
+    started = time.perf_counter()
+    if use_cache and not refresh:
+        size = CACHE.get_to_file(key, path)
+        if size is not None:
+            _record(url, started, None, size, render_js, premium_proxy, cache_hit=True)
+            return size
+    
+    def fetch():
+        part = f"{path}.{threading.get_ident()}.part"
+        with open(part, 'wb') as f:
+            resp = request_with_retry(url, render_js, wait_ms, premium_proxy, sink=f, timeout=timeout, **extras)
+        _record(url, started, resp, resp.size if resp is not None else 0, render_js, premium_proxy)
+        if resp is None or resp.status != 200:
+            if resp is not None:
+                with open(part, 'rb') as f:
+                    _report_error(resp, f.read(500))
+            os.remove(part)
+            return None
+        os.replace(part, path)
+        if use_cache:
+            CACHE.put_file(key, path)
+        archive_file(url, path, render_js, wait_ms, premium_proxy, **extras)
+        return path, resp.size
+
+    result, shared = INFLIGHT.run(('file', key), fetch)
+    if result is None:
+        return None
+    source, size = result
+    if shared and source != path:
+        # Another caller streamed the same page to its own file: copy that one
+        shutil.copyfile(source, path)
+    return size
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class CreditBudget:
+    """Hard cap on ScrapingBee credits spent by a batch.
+
+    Credits are reserved before a request goes out, so concurrent workers can
+    never overshoot the limit. Failed requests are refunded (ScrapingBee only
+    bills successful responses).
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.spent = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, cost):
+        with self.lock:
+            if self.limit is not None and self.spent + cost > self.limit:
+                return False
+            self.spent += cost
+            return True
+
+    def refund(self, cost):
+        with self.lock:
+            self.spent -= cost
+
+
+def scrape_many(urls, concurrency=4, per_host=2, rate=None, budget=None,
+                render_js=True, wait_ms=3000, premium_proxy=False, fetch=None,
+                use_cache=True, refresh=False, out_dir=None, timeout=None,
+                extract_rules=None, block_resources=None, wait_for=None):
+    """Scrape many URLs in parallel. Yields (url, html) as each page finishes.
+
+    concurrency -- total worker threads
+    per_host    -- max simultaneous requests to one target domain
+    rate        -- max requests per second across the batch (token bucket)
+    budget      -- max credits to spend; a CreditBudget or an int
+    fetch       -- callable(url) -> result, defaults to scrape() with the
+                   given render_js/wait_ms/premium_proxy (and extract_rules/
+                   block_resources/wait_for)
+    out_dir     -- stream each page into out_dir/<sha1>.html and yield that
+                   path instead of the HTML (keeps memory flat on big batches)
+
+    Pages already in the cache are returned without touching the budget or
+    the rate limiter (unless use_cache=False or refresh=True).
+
+    html is None when the fetch failed or the budget ran out.
+    """
+    extras = dict(extract_rules=extract_rules, block_resources=block_resources, wait_for=wait_for)
+    check_cache = fetch is None and use_cache and not refresh
+    if fetch is None and out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+        def fetch(url):
+            path = page_path(out_dir, url)
+            size = scrape_to_file(url, path, render_js=render_js, wait_ms=wait_ms,
+                                  premium_proxy=premium_proxy, use_cache=use_cache,
+                                  refresh=refresh, timeout=timeout, **extras)
+            return path if size is not None else None
+
+        def from_cache(url, key):
+            path = page_path(out_dir, url)
+            return path if CACHE.get_to_file(key, path) is not None else None
+    elif fetch is None:
+        def fetch(url):
+            return scrape(url, render_js=render_js, wait_ms=wait_ms, premium_proxy=premium_proxy,
+                          use_cache=use_cache, refresh=refresh, timeout=timeout, **extras)
+
+        def from_cache(url, key):
+            return CACHE.get(key)
+    else:
+        check_cache = False
+    if not isinstance(budget, CreditBudget):
+        budget = CreditBudget(budget)
+    bucket = TokenBucket(rate) if rate else None
+    cost = credit_cost(render_js, premium_proxy)
+
+    host_slots = {}
+    host_lock = threading.Lock()
+
+    def host_slot(url):
+        host = urllib.parse.urlsplit(url).hostname or ''
+        with host_lock:
+            if host not in host_slots:
+                host_slots[host] = threading.BoundedSemaphore(per_host)
+            return host_slots[host]
+
+    def cached(url):
+        # Reads the cache only: a miss (or an entry that expired since the
+        # batch started) goes through the limited path below, never straight
+        # to the API
+        started = time.perf_counter()
+        try:
+            result = from_cache(url, cache_key(url, render_js, wait_ms, premium_proxy, **extras))
+        except Exception as e:
+            print(f"ERROR: {url}: {e}", file=sys.stderr)
+            return None
+        if result is not None:
+            size = os.path.getsize(result) if out_dir else len(result)
+            _record(url, started, None, size, render_js, premium_proxy, cache_hit=True)
+        return result
+
+    def work(url):
+        # Cache hits are free: skip the budget, the rate limiter and the host slot
+        if check_cache:
+            result = cached(url)
+            if result is not None:
+                return result
+        with host_slot(url):
+            if not budget.reserve(cost):
+                print(f"ERROR: credit budget exhausted ({budget.spent}/{budget.limit}), skipping {url}", file=sys.stderr)
+                return None
+            if bucket:
+                bucket.acquire()
+            try:
+                result = fetch(url)
+            except Exception as e:
+                print(f"ERROR: {url}: {e}", file=sys.stderr)
+                result = None
+            if result is None:
+                budget.refund(cost)
+            return result
+
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        futures = {pool.submit(work, url): url for url in urls}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def page_path(out_dir, url):
+    """File name batch mode uses for a URL."""
+    return os.path.join(out_dir, hashlib.sha1(url.encode()).hexdigest()[:16] + '.html')
+
+
+def _read_url_list(path):
+    """Read URLs from a file (or '-' for stdin), one per line, '#' comments allowed."""
+    f = sys.stdin if path == '-' else open(path)
+    with f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print(f"Usage: {sys.argv[0]} <url> [--no-js] [--wait MS] [--premium]")
+    parser = argparse.ArgumentParser(description='Scrape URLs through ScrapingBee.')
+    parser.add_argument('urls', nargs='*', help='URL(s) to scrape')
+    parser.add_argument('--no-js', action='store_true', help='disable JS rendering (1 credit instead of 5)')
+    parser.add_argument('--wait', type=int, metavar='MS', help='render wait in ms (default 3000, 0 with --wait-for)')
+    parser.add_argument('--premium', action='store_true', help='use premium proxy (10-25 credits)')
+    parser.add_argument('--extract-rules', metavar='JSON',
+                        help="ScrapingBee extract_rules (JSON, or @FILE); prints the extracted JSON")
+    parser.add_argument('--wait-for', metavar='SELECTOR', help='CSS selector to wait for (JS rendering only)')
+    parser.add_argument('--block-resources', dest='block_resources', action='store_true', default=None,
+                        help='block images and CSS (the API default)')
+    parser.add_argument('--load-resources', dest='block_resources', action='store_false',
+                        help='load images and CSS')
+    parser.add_argument('--batch', metavar='FILE', help="file with one URL per line ('-' for stdin)")
+    parser.add_argument('--concurrency', type=int, default=4, help='parallel requests in batch mode')
+    parser.add_argument('--per-host', type=int, default=2, help='parallel requests per target domain')
+    parser.add_argument('--rate', type=float, help='max requests per second')
+    parser.add_argument('--budget', type=int, help='max credits to spend in batch mode')
+    parser.add_argument('--out-dir', default='/tmp/scrapingbee', help='where batch mode saves pages')
+    parser.add_argument('--no-cache', action='store_true', help='bypass the response cache entirely')
+    parser.add_argument('--refresh', action='store_true', help='ignore cached copies but store fresh ones')
+    parser.add_argument('--cache-ttl', type=float, metavar='HOURS', help='max age of cached pages')
+    parser.add_argument('--timeout', type=float, help=f'request timeout in seconds (default {DEFAULT_TIMEOUT:g})')
+    parser.add_argument('--no-daemon', action='store_true', help='scrape in this process even if scrape_daemon.py runs')
+    parser.add_argument('--api-url', help=f'API endpoint (default {API_URL}; implies --no-daemon)')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    if args.cache_ttl is not None:
+        CACHE.ttl = args.cache_ttl * 3600
+    if args.api_url:
+        set_api_url(args.api_url)
+
+    urls = list(args.urls)
+    if args.batch:
+        urls += _read_url_list(args.batch)
+    if not urls:
+        parser.print_usage()
         sys.exit(1)
-    
-    url = sys.argv[1]
-    render_js = '--no-js' not in sys.argv
-    wait_ms = 3000
-    premium = '--premium' in sys.argv
-    
-    for i, arg in enumerate(sys.argv):
-        if arg == '--wait' and i + 1 < len(sys.argv):
-            wait_ms = int(sys.argv[i + 1])
-    
-    html = scrape(url, render_js=render_js, wait_ms=wait_ms, premium_proxy=premium)
-    if html:
-        print(html)
+
+    render_js = not args.no_js
+    # The daemon has its own cache TTL and metrics and only writes pages under its spool
+    # directory; asking for any of those keeps the work in-process
+    daemon = None
+    if not (args.no_daemon or args.cache_ttl is not None or args.metrics or args.api_url):
+        from scrape_daemon import client as daemon_client, in_spool
+        if in_spool(args.out_dir):
+            daemon = daemon_client()
+    extract_rules = args.extract_rules
+    if extract_rules:
+        if extract_rules.startswith('@'):
+            with open(extract_rules[1:]) as f:
+                extract_rules = f.read()
+        try:
+            extract_rules = json.loads(extract_rules)
+        except ValueError as e:
+            print(f"ERROR: --extract-rules is not valid JSON: {e}", file=sys.stderr)
+            sys.exit(1)
+    wait_ms = args.wait if args.wait is not None else 0 if args.wait_for else 3000
+    options = dict(render_js=render_js, wait_ms=wait_ms, premium_proxy=args.premium,
+                   use_cache=not args.no_cache, refresh=args.refresh, timeout=args.timeout,
+                   extract_rules=extract_rules, block_resources=args.block_resources, wait_for=args.wait_for)
+
+    if len(urls) == 1 and not args.batch:
+        html = (daemon.scrape if daemon else scrape)(urls[0], **options)
+        if html:
+            print(html)
+        sys.exit(0)
+
+    # Batch mode: pages stream into --out-dir, one JSON status line per URL on stdout
+    batch = dict(concurrency=args.concurrency, per_host=args.per_host, rate=args.rate,
+                 out_dir=args.out_dir, **options)
+    if daemon:
+        entries = daemon.batch('scrape', urls, budget=args.budget, **batch)
+    else:
+        budget = CreditBudget(args.budget)
+        entries = ({'url': url, 'ok': path is not None,
+                    **({'file': path, 'bytes': os.path.getsize(path)} if path is not None else {})}
+                   for url, path in scrape_many(urls, budget=budget, **batch))
+    failed = 0
+    spent = 0
+    for entry in entries:
+        if entry.get('done'):
+            spent = entry.get('credits')
+            if entry.get('error'):
+                print(f"ERROR: daemon: {entry['error']}", file=sys.stderr)
+            continue
+        if not entry['ok']:
+            failed += 1
+        print(json.dumps(entry, ensure_ascii=False), flush=True)
+    if not daemon:
+        spent = budget.spent
+    print(f"Done: {len(urls) - failed}/{len(urls)} ok, {spent} credits spent", file=sys.stderr)
+    sys.exit(1 if failed else 0)
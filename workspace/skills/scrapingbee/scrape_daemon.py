@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Local scrape service: one long-running process that keeps the API key,
+the keep-alive connection pool, the response cache and the Fragrantica
+ladder memory warm for every caller.
+
+scrape.py and fragrantica_scraper.py forward their work here when the
+daemon is running (and fall back to scraping in-process when it is not).
+Identical requests that arrive while one is in flight share a single
+upstream fetch (scrape.INFLIGHT), so N callers asking for the same page
+pay for it once. Batches are queued and run --jobs at a time.
+
+Protocol (HTTP on 127.0.0.1, JSON request bodies):
+  POST /scrape      {url, render_js, wait_ms, premium_proxy, use_cache, refresh, timeout,
+                     extract_rules, block_resources, wait_for}
+                    -> the HTML (200)
+  POST /fragrantica {url, use_cache, refresh, escalate, lean, adaptive, budget} -> {"data": {...}|null, "credits": N}
+  POST /batch       {kind: "scrape"|"fragrantica", urls: [...], options: {...}}
+                    -> one JSON line per finished URL, then {"done": true, "credits": N};
+                    scrape batches write their pages under SPOOL_DIR only
+  GET  /status      pid, uptime, request and queue counters
+  POST /shutdown
+
+Every request must carry the secret the daemon writes at startup to
+TOKEN_FILE (mode 0600, so only the user running it can read it) in the
+X-Daemon-Token header, and POST bodies must be application/json;
+requests with an Origin header (web pages) are refused. Anything else
+gets 403/415, which keeps other local users and browser tabs from
+spending credits or stopping the daemon.
+
+The address comes from --listen or SCRAPINGBEE_DAEMON (host:port,
+default 127.0.0.1:8765); SCRAPINGBEE_DAEMON=off makes the CLIs never
+try the daemon. SCRAPINGBEE_DAEMON_TOKEN overrides TOKEN_FILE.
+
+Usage:
+  scrape_daemon.py serve [--listen HOST:PORT] [--jobs N] [--cache-ttl HOURS] [--metrics FILE.json]
+  scrape_daemon.py status
+  scrape_daemon.py stop
+"""
+
+import os
+import sys
+import json
+import time
+import hmac
+import queue
+import secrets
+import argparse
+import tempfile
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from metrics import add_arguments as add_metrics_arguments, configure_from_args
+
+DEFAULT_ADDRESS = '127.0.0.1:8765'
+CONNECT_TIMEOUT = 0.5
+TOKEN_FILE = os.environ.get('SCRAPINGBEE_DAEMON_TOKEN',
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), '.daemon-token'))
+TOKEN_HEADER = 'X-Daemon-Token'
+# Scrape batches run by the daemon only ever write below this directory
+SPOOL_DIR = '/tmp/scrapingbee'
+
+
+def parse_address(value):
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def daemon_address():
+    """(host, port) of the daemon, or None when disabled with SCRAPINGBEE_DAEMON=off."""
+    value = os.environ.get('SCRAPINGBEE_DAEMON', DEFAULT_ADDRESS)
+    if value.lower() in ('off', 'no', '0', ''):
+        return None
+    return parse_address(value)
+
+
+def read_token(path=None):
+    """The daemon's secret; raises OSError when there is none (no daemon started yet)."""
+    with open(path or TOKEN_FILE, encoding='ascii') as f:
+        token = f.read().strip()
+    if not token:
+        raise OSError(f"empty daemon token file {path or TOKEN_FILE}")
+    return token
+
+
+def write_token(path=None):
+    """Write a fresh secret to path, readable by this user only, and return it."""
+    path = path or TOKEN_FILE
+    token = secrets.token_hex(32)
+    fd, tmp = tempfile.mkstemp(prefix='.daemon-token.', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'w', encoding='ascii') as f:  # mkstemp creates it 0600
+            f.write(token + '\n')
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return token
+
+
+def in_spool(path):
+    """path resolved, if it lies in SPOOL_DIR (or is it), else None."""
+    spool = os.path.realpath(SPOOL_DIR)
+    resolved = os.path.realpath(path)
+    return resolved if os.path.commonpath([spool, resolved]) == spool else None
+
+
+# --- client -----------------------------------------------------------------
+
+class DaemonClient:
+    """Talks to a running daemon; every call raises OSError if it is not reachable."""
+
+    def __init__(self, address=None, token=None):
+        self.host, self.port = address or daemon_address() or parse_address(DEFAULT_ADDRESS)
+        self.token = token
+
+    def _headers(self):
+        if self.token is None:
+            self.token = read_token()
+        return {TOKEN_HEADER: self.token}
+
+    def _post(self, path, payload, timeout=None):
+        headers = {'Content-Type': 'application/json', **self._headers()}
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=CONNECT_TIMEOUT)
+        conn.connect()
+        conn.sock.settimeout(timeout)
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        conn.request('POST', path, body=body, headers=headers)
+        return conn, conn.getresponse()
+
+    def status(self):
+        headers = self._headers()
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=CONNECT_TIMEOUT)
+        try:
+            conn.request('GET', '/status', headers=headers)
+            resp = conn.getresponse()
+            body = resp.read()
+            if resp.status != 200:
+                raise OSError(f"daemon refused status: HTTP {resp.status}")
+            return json.loads(body)
+        finally:
+            conn.close()
+
+    def available(self):
+        try:
+            self.status()
+            return True
+        except (OSError, http.client.HTTPException, ValueError):
+            return False
+
+    def scrape(self, url, render_js=True, wait_ms=3000, premium_proxy=False, use_cache=True,
+               refresh=False, timeout=None, extract_rules=None, block_resources=None, wait_for=None):
+        conn, resp = self._post('/scrape', {'url': url, 'render_js': render_js, 'wait_ms': wait_ms,
+                                            'premium_proxy': premium_proxy, 'use_cache': use_cache,
+                                            'refresh': refresh, 'timeout': timeout,
+                                            'extract_rules': extract_rules, 'block_resources': block_resources,
+                                            'wait_for': wait_for})
+        try:
+            body = resp.read()
+        finally:
+            conn.close()
+        return body.decode('utf-8') if resp.status == 200 else None
+
+    def fragrantica(self, url, use_cache=True, refresh=False, escalate=True, lean=False, adaptive=False,
+                    budget=None):
+        conn, resp = self._post('/fragrantica', {'url': url, 'use_cache': use_cache, 'refresh': refresh,
+                                                 'escalate': escalate, 'lean': lean, 'adaptive': adaptive,
+                                                 'budget': budget})
+        try:
+            body = resp.read()
+        finally:
+            conn.close()
+        if resp.status != 200:
+            raise OSError(f"daemon refused fragrantica: HTTP {resp.status} {body[:200]!r}")
+        return json.loads(body)
+
+    def batch(self, kind, urls, **options):
+        """Yield the daemon's result lines as URLs finish; the last one has "done": true."""
+        conn, resp = self._post('/batch', {'kind': kind, 'urls': list(urls), 'options': options})
+        try:
+            if resp.status != 200:
+                raise OSError(f"daemon refused batch: HTTP {resp.status} {resp.read()[:200]!r}")
+            for line in resp:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            conn.close()
+
+    def shutdown(self):
+        conn, resp = self._post('/shutdown', {})
+        try:
+            resp.read()
+        finally:
+            conn.close()
+
+
+def client():
+    """A DaemonClient if a daemon is enabled and answering, else None."""
+    address = daemon_address()
+    if address is None:
+        return None
+    daemon = DaemonClient(address)
+    return daemon if daemon.available() else None
+
+
+# --- server -----------------------------------------------------------------
+
+class ScrapeDaemon:
+    def __init__(self, jobs=2):
+        # Imported here so clients never pay for the scraper modules
+        import scrape
+        import fragrantica_scraper
+        self.scrape = scrape
+        self.fragrantica = fragrantica_scraper
+        self.jobs = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='job')
+        self.started = time.time()
+        self.counts = {'requests': 0, 'batches': 0, 'queued': 0, 'running': 0}
+        self.lock = threading.Lock()
+
+    def count(self, name, delta=1):
+        with self.lock:
+            self.counts[name] += delta
+
+    def status(self):
+        with self.lock:
+            counts = dict(self.counts)
+        return {'pid': os.getpid(), 'uptime': round(time.time() - self.started, 1),
+                'inflight': len(self.scrape.INFLIGHT.calls), 'cache_dir': self.scrape.CACHE.directory,
+                **counts}
+
+    def scrape_page(self, req):
+        options = {k: req[k] for k in ('render_js', 'wait_ms', 'premium_proxy', 'use_cache', 'refresh', 'timeout',
+                                       'extract_rules', 'block_resources', 'wait_for')
+                   if k in req}
+        return self.scrape.scrape(req['url'], **options)
+
+    def scrape_fragrantica(self, req):
+        budget = self.scrape.CreditBudget(req.get('budget'))
+        data = self.fragrantica.scrape_fragrantica(req['url'], use_cache=req.get('use_cache', True),
+                                                   refresh=req.get('refresh', False),
+                                                   escalate=req.get('escalate', True), lean=req.get('lean', False),
+                                                   adaptive=req.get('adaptive', False), budget=budget)
+        return {'data': data, 'credits': budget.spent}
+
+    def run_batch(self, kind, urls, options, out):
+        """Runs on a job thread; puts result lines on out, then None."""
+        self.count('queued', -1)
+        self.count('running')
+        try:
+            budget = self.scrape.CreditBudget(options.pop('budget', None))
+            if kind == 'fragrantica':
+                results = self.fragrantica.scrape_fragrantica_many(urls, budget=budget, **options)
+                for url, data in results:
+                    out.put({'url': url, 'data': data})
+            else:
+                options['out_dir'] = in_spool(options.get('out_dir') or SPOOL_DIR)
+                for url, path in self.scrape.scrape_many(urls, budget=budget, **options):
+                    entry = {'url': url, 'ok': path is not None}
+                    if path is not None:
+                        entry.update(file=path, bytes=os.path.getsize(path))
+                    out.put(entry)
+            out.put({'done': True, 'credits': budget.spent})
+        except Exception as e:
+            out.put({'done': True, 'error': f"{e.__class__.__name__}: {e}"})
+        finally:
+            self.count('running', -1)
+            out.put(None)
+
+    def submit_batch(self, kind, urls, options):
+        out = queue.Queue()
+        self.count('batches')
+        self.count('queued')
+        self.jobs.submit(self.run_batch, kind, urls, options, out)
+        return out
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = 'scrapingbee-daemon'
+
+    def log_message(self, fmt, *args):
+        print(f"{self.address_string()} {fmt % args}", file=sys.stderr)
+
+    def _json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        """Check the token (and, for POST, the body type); answers and returns False if refused."""
+        token = self.headers.get(TOKEN_HEADER) or ''
+        if self.headers.get('Origin') is not None or not hmac.compare_digest(token, self.server.token):
+            self._json(403, {'error': 'forbidden'})
+            return False
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        if self.command == 'POST' and content_type != 'application/json':
+            self._json(415, {'error': 'Content-Type must be application/json'})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == '/status':
+            self._json(200, self.server.scraper.status())
+        else:
+            self._json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        daemon = self.server.scraper
+        if not self._authorized():
+            return
+        try:
+            req = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        except ValueError:
+            self._json(400, {'error': 'invalid JSON'})
+            return
+        if self.path == '/shutdown':
+            self._json(200, {'ok': True})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+        if not isinstance(req, dict):
+            self._json(400, {'error': 'expected a JSON object'})
+            return
+        if self.path in ('/scrape', '/fragrantica') and not req.get('url'):
+            self._json(400, {'error': 'url is required'})
+            return
+        daemon.count('requests')
+
+        if self.path == '/scrape':
+            result = daemon.scrape_page(req)
+            if result is None:
+                self._json(502, {'error': 'fetch failed'})
+            else:
+                body = result.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        elif self.path == '/fragrantica':
+            self._json(200, daemon.scrape_fragrantica(req))
+        elif self.path == '/batch':
+            if req.get('kind') not in ('scrape', 'fragrantica') or not isinstance(req.get('urls'), list):
+                self._json(400, {'error': 'kind and urls are required'})
+                return
+            options = dict(req.get('options') or {})
+            if req['kind'] == 'scrape' and options.get('out_dir') and not in_spool(options['out_dir']):
+                self._json(400, {'error': f"out_dir must be inside {SPOOL_DIR}"})
+                return
+            out = daemon.submit_batch(req['kind'], req['urls'], options)
+            # Streamed without a length: one line per result, connection closes at the end
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.end_headers()
+            for entry in iter(out.get, None):
+                self.wfile.write((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8'))
+                self.wfile.flush()
+        else:
+            self._json(404, {'error': 'not found'})
+
+
+def serve(address, jobs=2):
+    daemon = ScrapeDaemon(jobs=jobs)
+    daemon.scrape.get_api_key()  # fail at startup, not on the first request
+    server = ThreadingHTTPServer(address, Handler)
+    server.daemon_threads = True
+    server.scraper = daemon
+    server.token = write_token()
+    print(f"scrapingbee daemon listening on {address[0]}:{address[1]} (pid {os.getpid()})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.jobs.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Long-running local ScrapingBee service.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('serve')
+    p.add_argument('--listen', metavar='HOST:PORT', help=f'default $SCRAPINGBEE_DAEMON or {DEFAULT_ADDRESS}')
+    p.add_argument('--jobs', type=int, default=2, help='batches run at the same time')
+    p.add_argument('--cache-ttl', type=float, metavar='HOURS', help='max age of cached pages')
+    add_metrics_arguments(p)
+    sub.add_parser('status')
+    sub.add_parser('stop')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        configure_from_args(args)
+        address = parse_address(args.listen) if args.listen else daemon_address() or parse_address(DEFAULT_ADDRESS)
+        if args.cache_ttl is not None:
+            import scrape
+            scrape.CACHE.ttl = args.cache_ttl * 3600
+        serve(address, jobs=args.jobs)
+    else:
+        try:
+            daemon = DaemonClient()
+            if args.command == 'status':
+                print(json.dumps(daemon.status(), indent=2))
+            else:
+                daemon.shutdown()
+                print("daemon stopped", file=sys.stderr)
+        except (OSError, http.client.HTTPException) as e:
+            print(f"ERROR: daemon not reachable: {e}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Content-addressed snapshots of the perfume catalog.
+
+Every merge commits perfumes.json into the store instead of copying the
+whole page (the old index_bag_<date>.html backups). Records are stored
+once each, deduplicated by content:
+
+  objects/ab/cdef…        one zlib-compressed record (compact JSON), named
+                          after the first HASH_LENGTH hex digits of its sha256
+  manifests/<id>.json.gz  the catalog at one point in time: [key, hash] per
+                          record, in catalog order; id = hash of the rows
+  log.jsonl               one line per snapshot: id, time, message and
+                          +added ~changed -removed against the previous one
+
+An edit that touches three perfumes adds three objects and a manifest.
+diff compares manifests by hash and only loads the records that changed;
+records are matched by normalized brand|name, so reordering is not a
+change. restore rebuilds perfumes.json byte-for-byte (dump_catalog) after
+snapshotting the current file. prune keeps the last KEEP_LAST snapshots
+plus the newest one of each of the last KEEP_DAILY days, then deletes
+objects and manifests nothing refers to.
+
+Snapshot references: an id (or a unique prefix), @ for the latest,
+@~N for N snapshots before it, and 'current' for the catalog file on disk.
+
+Usage:
+  snapshots.py commit  [--catalog FILE] [-m MESSAGE]
+  snapshots.py log     [--limit N]
+  snapshots.py diff    [OLD [NEW]]             (default: @ against current)
+  snapshots.py restore REF [--catalog FILE] [--dry-run]
+  snapshots.py prune   [--keep-last N] [--keep-daily D] [--dry-run]
+  snapshots.py import-bags [FILE ...]          commit index_bag_*.html backups
+"""
+
+import os
+import re
+import sys
+import glob
+import gzip
+import json
+import zlib
+import hashlib
+import argparse
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from merge_fragrantica_data import (normalize_name, dump_catalog, write_text_atomic, diff_catalogs,
+                                    print_change_summary, parse_perfumes_array, CATALOG_FILE)
+
+STORE_DIR = '/data/workspace/state/snapshots'
+BAG_GLOB = '/data/workspace/pages/perfume/index_bag_*.html'
+HASH_LENGTH = 24
+KEEP_LAST = 10
+KEEP_DAILY = 30
+
+_BAG_TIME_RE = re.compile(r'index_bag_(\d{4}-\d{2}-\d{2})_(\d{2})(\d{2})')
+_REF_RE = re.compile(r'^@(?:~(\d+))?$')
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def record_key(record: Dict) -> str:
+    return f"{normalize_name(record.get('brand') or '')}|{normalize_name(record.get('name') or '')}"
+
+
+def record_bytes(record: Dict) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def record_rows(records: List[Dict]) -> List[List[str]]:
+    """Manifest rows for records, without storing them."""
+    return [[record_key(r), hashlib.sha256(record_bytes(r)).hexdigest()[:HASH_LENGTH]] for r in records]
+
+
+def _keyed(rows: List[List[str]]) -> Dict[str, str]:
+    """{key: hash}; repeated keys get '#2', '#3'… in catalog order."""
+    keyed = {}
+    for key, digest in rows:
+        unique, n = key, 1
+        while unique in keyed:
+            n += 1
+            unique = f"{key}#{n}"
+        keyed[unique] = digest
+    return keyed
+
+
+class SnapshotStore:
+    def __init__(self, root: str = STORE_DIR):
+        self.root = root
+        self.log_path = os.path.join(root, 'log.jsonl')
+
+    # --- objects and manifests ----------------------------------------------
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], digest[2:])
+
+    def _manifest_path(self, snapshot_id: str) -> str:
+        return os.path.join(self.root, 'manifests', snapshot_id + '.json.gz')
+
+    @staticmethod
+    def _write_bytes(path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def put_record(self, record: Dict) -> str:
+        text = record_bytes(record)
+        digest = hashlib.sha256(text).hexdigest()[:HASH_LENGTH]
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            self._write_bytes(path, zlib.compress(text, 9))
+        return digest
+
+    def get_record(self, digest: str) -> Dict:
+        with open(self._object_path(digest), 'rb') as f:
+            return json.loads(zlib.decompress(f.read()).decode('utf-8'))
+
+    def rows(self, snapshot_id: str) -> List[List[str]]:
+        with gzip.open(self._manifest_path(snapshot_id), 'rt', encoding='utf-8') as f:
+            return json.load(f)['rows']
+
+    def records(self, snapshot_id: str) -> List[Dict]:
+        return [self.get_record(digest) for _, digest in self.rows(snapshot_id)]
+
+    # --- log ------------------------------------------------------------------
+
+    def log(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.log_path, encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def _write_log(self, entries: List[Dict[str, Any]]) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        entries.sort(key=lambda e: e['at'])
+        write_text_atomic(self.log_path, ''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in entries))
+
+    def resolve(self, ref: str) -> Dict[str, Any]:
+        """Log entry for an id prefix, '@' or '@~N'. Raises KeyError."""
+        entries = self.log()
+        m = _REF_RE.match(ref)
+        if m:
+            back = int(m.group(1) or 0)
+            if back >= len(entries):
+                raise KeyError(f"{ref}: only {len(entries)} snapshots")
+            return entries[-1 - back]
+        found = {e['id'] for e in entries if e['id'].startswith(ref)}
+        if len(found) != 1:
+            raise KeyError(f"{ref}: {'ambiguous' if found else 'no such snapshot'}")
+        return [e for e in entries if e['id'] in found][-1]
+
+    # --- commands -------------------------------------------------------------
+
+    def commit(self, records: List[Dict], message: str = '', at: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Snapshot records. Returns the log entry, or None if the previous snapshot is identical."""
+        at = at or _now()
+        rows = [[record_key(r), self.put_record(r)] for r in records]
+        payload = json.dumps(rows, separators=(',', ':')).encode('utf-8')
+        snapshot_id = hashlib.sha256(payload).hexdigest()[:12]
+        entries = self.log()
+        previous = [e for e in entries if e['at'] <= at]
+        if previous and previous[-1]['id'] == snapshot_id:
+            return None
+        path = self._manifest_path(snapshot_id)
+        if not os.path.exists(path):
+            manifest = json.dumps({'id': snapshot_id, 'rows': rows}, ensure_ascii=False).encode('utf-8')
+            self._write_bytes(path, gzip.compress(manifest, mtime=0))
+        entry = {'id': snapshot_id, 'at': at, 'message': message, 'records': len(rows)}
+        entry.update(self._counts(self.rows(previous[-1]['id']) if previous else [], rows))
+        later = entries[len(previous):]
+        if later:
+            # Committed out of order (import-bags): the next snapshot now follows this one
+            later[0].update(self._counts(rows, self.rows(later[0]['id'])))
+        self._write_log(entries + [entry])
+        return entry
+
+    def _counts(self, old_rows: List[List[str]], new_rows: List[List[str]]) -> Dict[str, int]:
+        change = self.diff(old_rows, new_rows)
+        return {key: len(change[key]) for key in ('added', 'changed', 'removed')}
+
+    @staticmethod
+    def diff(old_rows: List[List[str]], new_rows: List[List[str]]) -> Dict[str, Any]:
+        """Keys added and removed, and {key: (old_hash, new_hash)} for changed records."""
+        old, new = _keyed(old_rows), _keyed(new_rows)
+        return {'added': [k for k in new if k not in old],
+                'removed': [k for k in old if k not in new],
+                'changed': {k: (old[k], new[k]) for k in new if k in old and old[k] != new[k]}}
+
+    def prune(self, keep_last: int = KEEP_LAST, keep_daily: int = KEEP_DAILY,
+              dry_run: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        """Apply the retention policy. Returns the dropped log entries and the number of files removed."""
+        entries = self.log()
+        keep = set(range(max(0, len(entries) - keep_last), len(entries)))
+        since = (datetime.now(timezone.utc) - timedelta(days=keep_daily)).date().isoformat()
+        newest_per_day = {}
+        for i, entry in enumerate(entries):
+            if entry['at'][:10] >= since:
+                newest_per_day[entry['at'][:10]] = i
+        keep.update(newest_per_day.values())
+        dropped = [e for i, e in enumerate(entries) if i not in keep]
+        if dry_run or not dropped:
+            return dropped, 0
+
+        kept = [e for i, e in enumerate(entries) if i in keep]
+        self._write_log(kept)
+        live_ids = {e['id'] for e in kept}
+        live_objects = {digest for snapshot_id in live_ids for _, digest in self.rows(snapshot_id)}
+        removed = 0
+        for path in glob.glob(os.path.join(self.root, 'manifests', '*.json.gz')):
+            if os.path.basename(path)[:-len('.json.gz')] not in live_ids:
+                os.remove(path)
+                removed += 1
+        for path in glob.glob(os.path.join(self.root, 'objects', '*', '*')):
+            digest = os.path.basename(os.path.dirname(path)) + os.path.basename(path)
+            if digest not in live_objects:
+                os.remove(path)
+                removed += 1
+        return dropped, removed
+
+
+def _load_catalog(path: str) -> List[Dict]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _print_diff(store: SnapshotStore, old: Tuple[List, Optional[List[Dict]]],
+                new: Tuple[List, Optional[List[Dict]]]) -> None:
+    """Print what changed from old to new; each side is (rows, records or None if stored)."""
+    def lookup(side):
+        rows, records = side
+        by_key = dict(zip(_keyed(rows), records)) if records is not None else {}
+        keyed = _keyed(rows)
+        return lambda key: by_key[key] if records is not None else store.get_record(keyed[key])
+
+    before, after = lookup(old), lookup(new)
+    change = store.diff(old[0], new[0])
+    for key in change['added']:
+        record = after(key)
+        print(f"➕ {record.get('brand')} — {record.get('name')}")
+    for key in change['removed']:
+        record = before(key)
+        print(f"➖ {record.get('brand')} — {record.get('name')}")
+    records, changes = [], {}
+    for key in change['changed']:
+        record = after(key)
+        changes[len(records)] = diff_catalogs([before(key)], [record])[0]
+        records.append(record)
+    print_change_summary(records, changes)
+    print(f"\n+{len(change['added'])} ~{len(change['changed'])} -{len(change['removed'])}")
+
+
+def _bag_time(path: str) -> str:
+    m = _BAG_TIME_RE.search(os.path.basename(path))
+    if m:
+        return f"{m.group(1)}T{m.group(2)}:{m.group(3)}:00+00:00"
+    return datetime.fromtimestamp(os.path.getmtime(path), timezone.utc).isoformat(timespec='seconds')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Content-addressed catalog snapshots.')
+    parser.add_argument('--store', default=STORE_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('commit', help='snapshot the catalog file')
+    p.add_argument('--catalog', default=CATALOG_FILE)
+    p.add_argument('-m', '--message', default='manual')
+    p = sub.add_parser('log', help='list snapshots')
+    p.add_argument('--limit', type=int)
+    p = sub.add_parser('diff', help='compare two snapshots (or a snapshot and the catalog file)')
+    p.add_argument('old', nargs='?', default='@')
+    p.add_argument('new', nargs='?', default='current')
+    p.add_argument('--catalog', default=CATALOG_FILE)
+    p = sub.add_parser('restore', help='write a snapshot back to the catalog file')
+    p.add_argument('ref')
+    p.add_argument('--catalog', default=CATALOG_FILE)
+    p.add_argument('--dry-run', action='store_true')
+    p = sub.add_parser('prune', help='drop snapshots outside the retention policy')
+    p.add_argument('--keep-last', type=int, default=KEEP_LAST)
+    p.add_argument('--keep-daily', type=int, default=KEEP_DAILY)
+    p.add_argument('--dry-run', action='store_true')
+    p = sub.add_parser('import-bags', help='commit index_bag_*.html page backups as snapshots')
+    p.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.store)
+    try:
+        if args.command == 'commit':
+            entry = store.commit(_load_catalog(args.catalog), args.message)
+            print(f"📸 {entry['id']} (+{entry['added']} ~{entry['changed']} -{entry['removed']})"
+                  if entry else "📸 Unchanged since the last snapshot")
+        elif args.command == 'log':
+            entries = store.log()[::-1][:args.limit]
+            for e in entries:
+                print(f"{e['id']}  {e['at']}  {e['records']:>5} perfumes  "
+                      f"+{e['added']} ~{e['changed']} -{e['removed']}  {e['message']}")
+        elif args.command == 'diff':
+            def side(ref):
+                if ref == 'current':
+                    records = _load_catalog(args.catalog)
+                    return record_rows(records), records
+                return store.rows(store.resolve(ref)['id']), None
+            _print_diff(store, side(args.old), side(args.new))
+        elif args.command == 'restore':
+            entry = store.resolve(args.ref)
+            records = store.records(entry['id'])
+            if args.dry_run:
+                current = _load_catalog(args.catalog)
+                _print_diff(store, (record_rows(current), current), (store.rows(entry['id']), None))
+                print(f"🧪 Dry run: {args.catalog} not written")
+            else:
+                if os.path.exists(args.catalog):
+                    store.commit(_load_catalog(args.catalog), f"before restore of {entry['id']}")
+                write_text_atomic(args.catalog, dump_catalog(records))
+                store.commit(records, f"restore of {entry['id']}")
+                print(f"♻️  {args.catalog} restored to {entry['id']} ({entry['at']}, {len(records)} perfumes)")
+                from build_page import refresh_page, report_refresh
+                report_refresh(refresh_page(records, args.catalog))
+        elif args.command == 'prune':
+            dropped, removed = store.prune(args.keep_last, args.keep_daily, args.dry_run)
+            for e in dropped:
+                print(f"🗑  {e['id']}  {e['at']}  {e['message']}")
+            print(f"{len(dropped)} snapshots {'would be ' if args.dry_run else ''}dropped"
+                  f"{f', {removed} files removed' if removed else ''}")
+        elif args.command == 'import-bags':
+            for path in sorted(args.files or glob.glob(BAG_GLOB), key=_bag_time):
+                with open(path, encoding='utf-8') as f:
+                    records = parse_perfumes_array(f.read())[0]
+                entry = store.commit(records, f"import {os.path.basename(path)}", at=_bag_time(path))
+                print(f"📸 {os.path.basename(path)} → {entry['id'] if entry else 'unchanged'}")
+    except KeyError as e:
+        print(f"❌ {e.args[0]}")
+        sys.exit(1)
@@ -0,0 +1,126 @@
+"""CatalogIndex/merge_updates, and CatalogStore behind the same interface."""
+
+import os
+import sys
+import copy
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKSPACE = os.path.dirname(HERE)
+sys.path.insert(0, WORKSPACE)
+sys.path.insert(0, os.path.join(WORKSPACE, 'skills', 'scrapingbee'))
+
+from merge_fragrantica_data import CatalogIndex, merge_updates, scraped_fields, resolve_brand_name
+from catalog_store import CatalogStore
+
+CATALOG = [
+    {'brand': 'Parfums de Marly', 'name': 'Delina', 'rating': 4.0, 'votes': 100, 'tags': ['rose']},
+    {'brand': 'Kilian', 'name': 'Roses on Ice', 'tags': []},
+    {'brand': 'Chanel', 'name': 'No 5', 'fragrantica_id': 40069, 'tags': []},
+]
+
+UPDATES = [
+    {'brand': 'Parfums de Marly', 'name': 'Delina', 'rating': 4.1, 'votes': 110,
+     'url': 'https://www.fragrantica.com/perfume/Parfums-de-Marly/Delina-43871.html',
+     'scraped_at': '2026-10-01T00:00:00', 'fragrantica_id': 43871,
+     'pyramid': {'top': ['Litchi'], 'mid': ['Rose'], 'base': ['Vanilla']}},
+    {'batch_name': 'Kilian — Roses On Ice', 'accords': [{'name': 'rose', 'w': 100, 'color': '#fe014d'}]},
+    # Same perfume again, later in the batch: its rating wins
+    {'brand': 'Parfums de Marly', 'name': 'Delina', 'rating': 4.2, 'fragrantica_id': 43871},
+    {'fragrantica_id': 40069, 'year': 1921},
+    {'brand': 'Nobody', 'name': 'Nothing'},
+    {'brand': 'Parfums de Marly', 'name': 'Dellina', 'gender': 'Ж'},
+]
+
+
+class ScrapedFieldsTest(unittest.TestCase):
+    def test_formats_and_skips_empty(self):
+        fields = scraped_fields({'pyramid': {'top': ['A', 'B'], 'mid': [], 'base': ['C']},
+                                 'accords': [{'name': 'wood'}], 'rating': 0, 'votes': None, 'year': 2001})
+        self.assertEqual(fields, {'pyramid': {'top': 'A, B', 'mid': '', 'base': 'C'},
+                                  'accords': [{'name': 'wood', 'w': 0, 'color': '#cccccc'}],
+                                  'year': 2001})
+
+    def test_resolve_brand_name(self):
+        self.assertEqual(resolve_brand_name({'batch_name': 'Kilian — Roses on Ice'}), ('Kilian', 'Roses on Ice'))
+        self.assertEqual(resolve_brand_name({'perfume_name': 'Delina'}), ('Delina', ''))
+        self.assertEqual(resolve_brand_name({}), (None, None))
+
+
+class MergeUpdatesTest(unittest.TestCase):
+    def merge(self):
+        records = copy.deepcopy(CATALOG)
+        return records, merge_updates(CatalogIndex(records), copy.deepcopy(UPDATES))
+
+    def test_records(self):
+        records, _ = self.merge()
+        delina = records[0]
+        self.assertEqual((delina['rating'], delina['votes'], delina['fragrantica_id']), (4.2, 110, 43871))
+        self.assertEqual(delina['pyramid'], {'top': 'Litchi', 'mid': 'Rose', 'base': 'Vanilla'})
+        self.assertEqual(delina['gender'], 'Ж')
+        self.assertEqual(records[1]['accords'], [{'name': 'rose', 'w': 100, 'color': '#fe014d'}])
+        self.assertEqual(records[2]['year'], 1921)
+
+    def test_result(self):
+        _, result = self.merge()
+        self.assertEqual(result['processed'], len(UPDATES))
+        self.assertEqual(result['matched'], {0: 3, 1: 1, 2: 1})
+        self.assertEqual(result['missing'], ['Nobody — Nothing'])
+        self.assertEqual(result['changed'][0],
+                         {'rating', 'votes', 'fragrantica_id', 'pyramid', 'gender'})
+        self.assertEqual([f['index'] for f in result['fetches']], [0])
+        self.assertEqual(result['fetches'][0]['changed'], ['fragrantica_id', 'pyramid', 'rating', 'votes'])
+        self.assertEqual([(label, i) for label, i, _ in result['fuzzy']], [('Parfums de Marly — Dellina', 0)])
+
+    def test_remerge_changes_nothing(self):
+        records, _ = self.merge()
+        again = merge_updates(CatalogIndex(records), copy.deepcopy(UPDATES))
+        # Delina is set to 4.1 then back to 4.2 within the batch
+        self.assertEqual(set(again['changed']), {0})
+        self.assertEqual(again['changed'][0], {'rating'})
+
+    def test_learned_id_is_used(self):
+        records = copy.deepcopy(CATALOG)
+        index = CatalogIndex(records)
+        merge_updates(index, copy.deepcopy(UPDATES[:1]))
+        self.assertEqual(index.find('Someone', 'Else', 43871), 0)
+
+
+class CatalogStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = CatalogStore(':memory:')
+        self.store.import_records(copy.deepcopy(CATALOG))
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_same_merge_as_in_memory(self):
+        records = copy.deepcopy(CATALOG)
+        expected = merge_updates(CatalogIndex(records), copy.deepcopy(UPDATES))
+        with self.store.batch():
+            result = merge_updates(self.store, copy.deepcopy(UPDATES))
+        self.assertEqual(self.store.export(), records)
+        self.assertEqual(result['changed'], expected['changed'])
+        self.assertEqual(result['missing'], expected['missing'])
+
+    def test_batch_rolls_back(self):
+        with self.assertRaises(RuntimeError):
+            with self.store.batch():
+                self.store.set_fields(0, {'rating': 1.0})
+                raise RuntimeError
+        self.assertEqual(self.store.get(0)['rating'], 4.0)
+
+    def test_sync(self):
+        records = copy.deepcopy(CATALOG)
+        records[1]['price'] = '100 €'
+        records.append({'brand': 'Dior', 'name': 'Sauvage', 'tags': []})
+        self.assertEqual(self.store.sync(records), 2)
+        self.assertEqual(self.store.export(), records)
+        self.assertEqual(self.store.find('Dior', 'Sauvage'), 3)
+        self.assertEqual(self.store.sync(records[:2]), 2)
+        self.assertEqual(self.store.export(), records[:2])
+        self.assertEqual(self.store.sync(records[:2]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""parse_fragrantica/page_regions and the perfumes-array JS literal parser."""
+
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKSPACE = os.path.dirname(HERE)
+sys.path.insert(0, WORKSPACE)
+sys.path.insert(0, os.path.join(WORKSPACE, 'skills', 'scrapingbee'))
+
+from fragrantica_scraper import parse_fragrantica, page_regions, missing_fields
+from merge_fragrantica_data import parse_perfumes_array, JSParseError
+
+PAGE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<title>Delina Parfums de Marly for women</title>
+<meta name="description" content="Delina by Parfums de Marly is a Floral fragrance for women. Delina was launched in 2017. Top notes: Litchi, Rhubarb and Bergamot; middle notes: Turkish Rose and Peony (Paeonia); base notes: Vanilla and Cashmeran.">
+<link rel="canonical" href="https://www.fragrantica.com/perfume/Parfums-de-Marly/Delina-43871.html">
+</head>
+<body>
+<h1 itemprop="name">Delina Parfums de Marly for women</h1>
+<p class="concentration">Eau de Parfum</p>
+<div class="cell accord-box">
+<div class="accord-bar" style="color: rgb(0, 0, 0); background: rgb(254, 1, 77); width: 100%;"><span>rose</span></div>
+<div class="accord-bar" style="color: rgb(0, 0, 0); background: rgb(255, 241, 123); width: 62.5%;"><span>fruity</span></div>
+</div>
+<p class="info-note">Rating <span itemprop="ratingValue">4.21</span> out of 5 with <span itemprop="ratingCount" content="12345">12,345</span> votes</p>
+<div class="perfumer-box">Perfumer: <a href="/noses/Quentin-Bisch.html"><span>Quentin Bisch</span></a></div>
+</body>
+</html>
+'''
+
+
+class ParseFragranticaTest(unittest.TestCase):
+    def test_fields(self):
+        data = parse_fragrantica(PAGE)
+        self.assertEqual(data['pyramid'], {'top': ['Litchi', 'Rhubarb', 'Bergamot'],
+                                           'mid': ['Turkish Rose', 'Peony (Paeonia)'],
+                                           'base': ['Vanilla', 'Cashmeran']})
+        self.assertEqual(data['accords'], [{'name': 'rose', 'w': 100, 'color': '#fe014d'},
+                                           {'name': 'fruity', 'w': 62, 'color': '#fff17b'}])
+        self.assertEqual((data['rating'], data['votes']), (4.21, 12345))
+        self.assertEqual(data['gender'], 'Ж')
+        self.assertEqual(data['year'], 2017)
+        self.assertEqual(data['perfumer'], 'Quentin Bisch')
+        self.assertEqual(data['concentration'], 'Eau de Parfum')
+        self.assertEqual(data['fragrantica_id'], 43871)
+        self.assertEqual(missing_fields(data), [])
+
+    def test_page_without_head_end_parses_the_same(self):
+        self.assertEqual(parse_fragrantica(PAGE.replace('</head>', '')), parse_fragrantica(PAGE))
+
+    def test_json_ld_fallback_for_rating(self):
+        page = PAGE.replace('itemprop="ratingValue"', '').replace('itemprop="ratingCount"', '')
+        page = page.replace('</body>', '<script type="application/ld+json">{"aggregateRating":'
+                                       '{"ratingValue":"3.9","ratingCount":"77"}}</script>\n</body>')
+        data = parse_fragrantica(page)
+        self.assertEqual((data['rating'], data['votes']), (3.9, 77))
+
+    def test_challenge_page_is_incomplete(self):
+        data = parse_fragrantica('<html><head><title>Just a moment...</title></head><body></body></html>')
+        self.assertIn('pyramid', missing_fields(data))
+        self.assertNotIn('rating', data)
+
+
+class PageRegionsTest(unittest.TestCase):
+    def test_regions(self):
+        regions = page_regions(PAGE)
+        head_end = PAGE.index('</head>')
+        self.assertEqual(regions['head'], (0, head_end))
+        self.assertEqual(regions['main'][0], PAGE.index('<h1'))
+        self.assertEqual(regions['main'][1], len(PAGE))
+        self.assertEqual(regions['ld'], (0, 0))
+
+    def test_head_falls_back_to_body(self):
+        page = PAGE.replace('</head>', '')
+        self.assertEqual(page_regions(page)['head'], (0, page.index('<body')))
+
+    def test_head_is_whole_page_without_body(self):
+        page = '<title>Delina for women</title><meta name="description" content="x">'
+        self.assertEqual(page_regions(page)['head'], (0, len(page)))
+
+
+SNAPSHOT = '''<script>
+const perfumes = [
+  { brand:"Kilian", name:"Roses on Ice", tags:["fresh",'rose'], rating:4.1, fav:true, price:null },
+
+  // comment between records
+  { brand:"Maison \\"MFK\\"", "name":"Baccarat Rouge 540", notes:"saffron,\\u0061mber", votes:-12, extra:undefined, nested:{ a:[1, 2.5e1] } },
+];
+</script>
+'''
+
+
+class PerfumesArrayTest(unittest.TestCase):
+    def test_records_and_spans(self):
+        records, spans, start, end = parse_perfumes_array(SNAPSHOT)
+        self.assertEqual(records, [
+            {'brand': 'Kilian', 'name': 'Roses on Ice', 'tags': ['fresh', 'rose'], 'rating': 4.1,
+             'fav': True, 'price': None},
+            {'brand': 'Maison "MFK"', 'name': 'Baccarat Rouge 540', 'notes': 'saffron,amber',
+             'votes': -12, 'extra': None, 'nested': {'a': [1, 25.0]}},
+        ])
+        self.assertTrue(SNAPSHOT[spans[0][0]:spans[0][1]].startswith('{ brand:"Kilian"'))
+        self.assertTrue(SNAPSHOT[spans[1][0]:spans[1][1]].endswith('} }'))
+        self.assertEqual(SNAPSHOT[start - 1], '[')
+        self.assertEqual(SNAPSHOT[end], ']')
+
+    def test_round_trip_of_untouched_spans(self):
+        records, spans, start, end = parse_perfumes_array(SNAPSHOT)
+        rebuilt = SNAPSHOT[:start] + ','.join(SNAPSHOT[s:e] for s, e in spans) + SNAPSHOT[end:]
+        self.assertEqual(parse_perfumes_array(rebuilt)[0], records)
+
+    def test_errors(self):
+        with self.assertRaises(JSParseError):
+            parse_perfumes_array('const perfumes = [{ brand "x" }];')
+        with self.assertRaises(JSParseError):
+            parse_perfumes_array('const perfumes = [{ brand:"x" } { brand:"y" }];')
+
+
+if __name__ == '__main__':
+    unittest.main()
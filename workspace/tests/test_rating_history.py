@@ -0,0 +1,114 @@
+"""RatingHistory segments: dedup, torn rows, windows and trends."""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKSPACE = os.path.dirname(HERE)
+sys.path.insert(0, WORKSPACE)
+sys.path.insert(0, os.path.join(WORKSPACE, 'skills', 'scrapingbee'))
+
+import rating_history
+from rating_history import RatingHistory, ROW, to_timestamp, fetch_observations, apply_trends
+
+DAY = 86400
+NOW = int(datetime(2026, 10, 15, tzinfo=timezone.utc).timestamp())
+
+
+# Ratings are stored as f32: the values below are exact in it
+class RatingHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.history = RatingHistory(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def segment(self):
+        (year, month), = self.history.segments()
+        return self.history._segment_path(year, month)
+
+    def test_append_skips_duplicates_and_empty_rows(self):
+        rows = [(1, NOW - 2 * DAY, 4.0, 100), (2, NOW - DAY, None, 50), (3, NOW, None, None), (0, NOW, 4.0, 1)]
+        self.assertEqual(self.history.append(rows), 2)
+        self.assertEqual(self.history.append(rows + [(1, NOW, 4.25, 120)]), 1)
+        self.assertEqual(list(self.history.rows()),
+                         [(1, NOW - 2 * DAY, 4.0, 100), (2, NOW - DAY, None, 50), (1, NOW, 4.25, 120)])
+
+    def test_rows_go_to_monthly_segments(self):
+        september = int(datetime(2026, 9, 30, 12, tzinfo=timezone.utc).timestamp())
+        self.history.append([(1, september, 4.0, 10), (1, NOW, 4.0, 20)])
+        self.assertEqual(self.history.segments(), [(2026, 9), (2026, 10)])
+        self.assertEqual(list(self.history.rows(since=NOW - DAY)), [(1, NOW, 4.0, 20)])
+        self.assertEqual(list(self.history.rows(until=september)), [(1, september, 4.0, 10)])
+
+    def test_torn_row_is_ignored_then_cut(self):
+        self.history.append([(1, NOW - DAY, 4.0, 100)])
+        with open(self.segment(), 'ab') as f:
+            f.write(ROW.pack(2, NOW, 3.0, 5)[:7])
+        self.assertEqual(list(self.history.rows()), [(1, NOW - DAY, 4.0, 100)])
+        self.assertEqual(self.history.append([(2, NOW, 3.0, 5)]), 1)
+        self.assertEqual(os.path.getsize(self.segment()), 2 * ROW.size)
+        self.assertEqual(list(self.history.rows()), [(1, NOW - DAY, 4.0, 100), (2, NOW, 3.0, 5)])
+
+    def test_reads_in_chunks(self):
+        saved = rating_history.READ_ROWS
+        try:
+            rating_history.READ_ROWS = 3
+            rows = [(fid, NOW - fid, 4.0, fid) for fid in range(1, 11)]
+            self.history.append(rows)
+            self.assertEqual(list(self.history.rows()), rows)
+        finally:
+            rating_history.READ_ROWS = saved
+
+    def test_window_and_trends(self):
+        self.history.append([(1, NOW - 20 * DAY, 4.0, 100), (1, NOW - 10 * DAY, 4.25, 150),
+                             (1, NOW, 4.5, 200), (2, NOW - 60 * DAY, 3.0, 10), (2, NOW, 3.0, 20),
+                             (3, NOW - DAY // 2, 5.0, 1), (3, NOW, 5.0, 2)])
+        ends = self.history.window(NOW - 30 * DAY, NOW)
+        self.assertEqual(ends[1], ((1, NOW - 20 * DAY, 4.0, 100), (1, NOW, 4.5, 200)))
+        trends = self.history.trends(30, now=NOW)
+        # 2 has one row in the window and 3 spans less than MIN_SPAN_DAYS
+        self.assertEqual(set(trends), {1})
+        self.assertEqual(trends[1]['votes'], 100)
+        self.assertEqual(trends[1]['votes_per_day'], 5.0)
+        self.assertEqual(trends[1]['growth'], 1.0)
+        self.assertEqual(trends[1]['rating'], 0.5)
+        extra = self.history.trends(30, now=NOW, extra=[(2, NOW - 5 * DAY, 3.0, 15)])
+        self.assertEqual(extra[2]['votes'], 5)
+
+    def test_top_movers(self):
+        self.history.append([(1, NOW - 10 * DAY, 4.0, 100), (1, NOW, 4.0, 110),
+                             (2, NOW - 10 * DAY, 4.0, 100), (2, NOW, 4.0, 300)])
+        self.assertEqual([fid for fid, _ in self.history.top_movers(30, now=NOW)], [2, 1])
+
+
+class ObservationsTest(unittest.TestCase):
+    def test_fetch_observations(self):
+        records = [{'fragrantica_id': 7}, {}, {}]
+        fetches = [{'index': 0, 'scraped_at': '2026-10-15T00:00:00', 'rating': 4.0, 'votes': 1},
+                   {'index': 1, 'url': 'https://www.fragrantica.com/perfume/A/B-42.html', 'rating': 3.0},
+                   {'index': 2, 'url': 'https://example.com/'}]
+        rows = fetch_observations(records, fetches)
+        self.assertEqual(rows[0], (7, NOW, 4.0, 1))
+        self.assertEqual(rows[1][0], 42)
+        self.assertEqual(len(rows), 2)
+
+    def test_to_timestamp(self):
+        self.assertEqual(to_timestamp('2026-10-15T00:00:00'), NOW)
+        self.assertEqual(to_timestamp('2026-10-15T02:00:00+02:00'), NOW)
+
+    def test_apply_trends(self):
+        records = [{'fragrantica_id': 1}, {'fragrantica_id': 2, 'trend': {'votes': 1}}, {}]
+        self.assertEqual(apply_trends(records, {1: {'votes': 5}}), [0, 1])
+        self.assertEqual(records[0]['trend'], {'votes': 5})
+        self.assertNotIn('trend', records[1])
+        self.assertEqual(apply_trends(records, {1: {'votes': 5}}), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
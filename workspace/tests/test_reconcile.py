@@ -0,0 +1,96 @@
+"""Reconciler match order and the fuzzy MIN_SCORE/MARGIN thresholds."""
+
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKSPACE = os.path.dirname(HERE)
+sys.path.insert(0, WORKSPACE)
+sys.path.insert(0, os.path.join(WORKSPACE, 'skills', 'scrapingbee'))
+
+import reconcile
+from reconcile import Reconciler, fold, name_key, brand_key
+
+CATALOG = [
+    ('Parfums de Marly', 'Delina', 43871),
+    ('Maison Francis Kurkdjian', 'Baccarat Rouge 540', None),
+    ('Chanel', 'No 5', None),
+    ('Chanel', 'No 19', None),
+    ('Zielinski & Rozen', 'Вишнёвый табак', None),
+    ('Kilian', 'Roses on Ice', None),
+    ('Kilian', 'Roses on Fire', None),
+]
+
+
+def reconciler():
+    r = Reconciler()
+    for i, (brand, name, fid) in enumerate(CATALOG):
+        r.add(i, brand, name, fid)
+    return r
+
+
+class KeysTest(unittest.TestCase):
+    def test_fold(self):
+        self.assertEqual(fold('Вишнёвый'), 'vishnevyy')
+        self.assertEqual(fold('Gumìn'), 'gumin')
+        self.assertEqual(fold('N°1'), fold('No 1'))
+        self.assertEqual(fold('Zielinski & Rozen'), 'zielinski and rozen')
+
+    def test_keys(self):
+        self.assertEqual(name_key('Delina Eau de Parfum'), 'delina')
+        self.assertEqual(name_key('Extrait de Parfum'), 'extrait de parfum')
+        self.assertEqual(brand_key('MFK'), brand_key('Maison Francis Kurkdjian'))
+
+
+class MatchTest(unittest.TestCase):
+    def setUp(self):
+        self.r = reconciler()
+
+    def test_fragrantica_id_wins(self):
+        self.assertEqual(self.r.match('Someone', 'Else', 43871), reconcile.Match(0, 1.0, 'fragrantica_id'))
+
+    def test_exact_and_folded(self):
+        self.assertEqual(self.r.match('chanel', ' No 5').method, 'exact')
+        found = self.r.match('MFK', 'Baccarat Rouge 540 EDP')
+        self.assertEqual((found.index, found.method), (1, 'folded'))
+        found = self.r.match('Zielinski and Rozen', 'Vishnevyy Tabak')
+        self.assertEqual((found.index, found.method), (4, 'folded'))
+
+    def test_fuzzy_misspelling(self):
+        found = self.r.match('Parfums de Marly', 'Dellina')
+        self.assertEqual((found.index, found.method), (0, 'fuzzy'))
+        self.assertGreaterEqual(found.score, reconcile.MIN_SCORE)
+
+    def test_different_numbers_never_match(self):
+        self.assertIsNone(self.r.match('Chanel', 'No 22'))
+        self.assertEqual(self.r.match('Chanel', 'N°19').index, 3)
+
+    def test_below_min_score(self):
+        self.assertIsNone(self.r.match('Parfums de Marly', 'Valaya'))
+        self.assertIsNone(self.r.match('Unknown House', 'Delina'))
+
+    def test_ambiguous_within_margin(self):
+        # Equally close to "Roses on Ice" and "Roses on Fire"
+        ranked = self.r.rank('Kilian', 'Roses on Fice')
+        self.assertLess(ranked[0][0] - ranked[1][0], reconcile.MARGIN)
+        self.assertIsNone(self.r.match('Kilian', 'Roses on Fice'))
+
+    def test_thresholds_are_read_at_match_time(self):
+        saved = reconcile.MIN_SCORE
+        try:
+            reconcile.MIN_SCORE = 0.99
+            self.assertIsNone(self.r.match('Parfums de Marly', 'Dellina'))
+        finally:
+            reconcile.MIN_SCORE = saved
+
+    def test_known_id_blocks_name_match(self):
+        self.assertIsNone(self.r.match('Parfums de Marly', 'Delina', 99999))
+
+    def test_missing_names(self):
+        self.assertIsNone(self.r.match(None, 'Delina'))
+        self.assertIsNone(self.r.match('Chanel', ''))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""Refresh planner: volatility bookkeeping and budgeted plans."""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKSPACE = os.path.dirname(HERE)
+sys.path.insert(0, WORKSPACE)
+sys.path.insert(0, os.path.join(WORKSPACE, 'skills', 'scrapingbee'))
+
+import fragrantica_scraper
+from fragrantica_scraper import LadderMemory
+from refresh_scheduler import observe, plan, priority, record_key, UNKNOWN_AGE_DAYS, HISTORY_LENGTH
+
+NOW = datetime(2026, 10, 15, tzinfo=timezone.utc)
+
+
+def url(n):
+    return f"https://www.fragrantica.com/perfume/Brand/Perfume-{n}.html"
+
+
+def ago(days):
+    return (NOW - timedelta(days=days)).isoformat()
+
+
+class ObserveTest(unittest.TestCase):
+    def test_volatility_and_history(self):
+        state = {}
+        record = {'brand': 'Kilian', 'name': 'Roses on Ice'}
+        observe(state, record, url(1), ago(2), 4.0, 100, [])
+        observe(state, record, url(1), ago(1), 4.0, 110, ['votes'])
+        entry = state['entries'][record_key(record)]
+        # 10% votes growth in one day, averaged with the previous 0
+        self.assertEqual(entry['volatility'], 0.05)
+        self.assertEqual(entry['last_fetched'], ago(1))
+        self.assertEqual([h['votes'] for h in entry['history']], [100, 110])
+
+    def test_history_is_capped(self):
+        state = {}
+        record = {'brand': 'A', 'name': 'B'}
+        for day in range(HISTORY_LENGTH + 5, 0, -1):
+            observe(state, record, url(1), ago(day), 4.0, 100, [])
+        self.assertEqual(len(state['entries']['a|b']['history']), HISTORY_LENGTH)
+
+    def test_history_moves_to_the_id_key(self):
+        state = {}
+        observe(state, {'brand': 'A', 'name': 'B'}, url(7), ago(2), 4.0, 100, [])
+        observe(state, {'brand': 'A', 'name': 'B', 'fragrantica_id': 7}, url(7), ago(1), 4.0, 100, [])
+        self.assertEqual(list(state['entries']), ['id:7'])
+        self.assertEqual(len(state['entries']['id:7']['history']), 2)
+
+
+class PlanTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.saved = fragrantica_scraper._memory
+        self.memory = fragrantica_scraper._memory = LadderMemory(os.path.join(self.root, 'ladder.json'))
+        self.catalog = [{'brand': 'Brand', 'name': f"Perfume {n}", 'fragrantica_id': n,
+                         'pyramid': {'top': 'x'}, 'accords': [{}], 'rating': 4.0} for n in range(1, 6)]
+        self.state = {'entries': {f"id:{n}": {'url': url(n), 'last_fetched': ago(n), 'volatility': 0.0}
+                                  for n in range(1, 5)}}
+
+    def tearDown(self):
+        self.memory.flush()
+        fragrantica_scraper._memory = self.saved
+        shutil.rmtree(self.root)
+
+    def test_priority(self):
+        entry = {'last_fetched': ago(10), 'volatility': 0.01}
+        self.assertEqual(priority(entry, self.catalog[0], NOW), 20.0)
+        self.assertEqual(priority({}, {}, NOW), UNKNOWN_AGE_DAYS * 2)
+
+    def test_most_stale_first_and_unknown_urls_skipped(self):
+        selected = plan(self.catalog, self.state, now=NOW)
+        # Perfume 5 has no state, so no URL to refresh from
+        self.assertEqual([s['url'] for s in selected], [url(4), url(3), url(2), url(1)])
+        self.assertEqual({s['step'] for s in selected}, {'plain'})
+
+    def test_volatile_and_incomplete_entries_go_first(self):
+        self.state['entries']['id:1']['volatility'] = 0.1
+        self.catalog[1]['pyramid'] = None
+        selected = plan(self.catalog, self.state, top=2, now=NOW)
+        self.assertEqual([s['url'] for s in selected], [url(1), url(2)])
+
+    def test_credit_budget_uses_the_remembered_step(self):
+        for n, step in ((1, 'plain'), (2, 'plain'), (3, 'js'), (4, 'premium')):
+            self.memory.record(url(n), step)
+        credits = {s['url']: s['credits'] for s in plan(self.catalog, self.state, now=NOW)}
+        self.assertEqual(credits, {url(4): 25, url(3): 5, url(2): 1, url(1): 1})
+        # The premium one does not fit, the cheaper ones after it still do
+        selected = plan(self.catalog, self.state, credits=6, now=NOW)
+        self.assertEqual([s['url'] for s in selected], [url(3), url(2)])
+
+    def test_time_budget(self):
+        selected = plan(self.catalog, self.state, seconds=3, concurrency=1, now=NOW)
+        self.assertEqual(len(selected), 1)
+        selected = plan(self.catalog, self.state, seconds=3, concurrency=2, now=NOW)
+        self.assertEqual(len(selected), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
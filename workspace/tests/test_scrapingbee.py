@@ -0,0 +1,171 @@
+"""LadderMemory saves merged across processes, and scrape_many's credit budget."""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import multiprocessing
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKSPACE = os.path.dirname(HERE)
+sys.path.insert(0, WORKSPACE)
+sys.path.insert(0, os.path.join(WORKSPACE, 'skills', 'scrapingbee'))
+
+import scrape
+import fragrantica_scraper
+from fragrantica_scraper import LadderMemory, MAX_WAIT_MS, WAIT_MIN_SAMPLES
+from response_cache import ResponseCache, cache_key
+from scrape import scrape_many, CreditBudget
+
+
+def url(n):
+    return f"https://www.fragrantica.com/perfume/Brand/Perfume-{n}.html"
+
+
+def _learn(path, start, count):
+    memory = LadderMemory(path)
+    for n in range(start, start + count):
+        memory.record(url(n), 'js')
+        memory.record_wait(url(n), 1000)
+    memory.flush()
+
+
+class LadderMemoryTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'ladder.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_start_step(self):
+        memory = LadderMemory(self.path)
+        self.assertEqual(memory.start_step(url(1)), 0)
+        memory.record(url(1), 'premium')
+        memory.record(url(2), 'js')
+        memory.record(url(3), 'js')
+        self.assertEqual(memory.start_step(url(1)), 2)
+        # Unseen URLs start at the domain's most common step
+        self.assertEqual(memory.start_step(url(9)), 1)
+        memory.flush()
+
+    def test_saves_merge_instead_of_overwriting(self):
+        first, second = LadderMemory(self.path), LadderMemory(self.path)
+        first.record(url(1), 'js')
+        second.record(url(2), 'premium')
+        first.flush()
+        second.flush()
+        reloaded = LadderMemory(self.path)
+        self.assertEqual(reloaded.urls, {url(1): 'js', url(2): 'premium'})
+        self.assertEqual(reloaded.domains, {'www.fragrantica.com': {'js': 1, 'premium': 1}})
+        # The second save also brought the first process's records back
+        self.assertEqual(second.urls, reloaded.urls)
+
+    def test_parallel_processes(self):
+        workers = [multiprocessing.Process(target=_learn, args=(self.path, i * 100, 30)) for i in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        reloaded = LadderMemory(self.path)
+        self.assertEqual(len(reloaded.urls), 120)
+        self.assertEqual(reloaded.domains['www.fragrantica.com'], {'js': 120})
+        self.assertEqual(len(reloaded.waits['www.fragrantica.com']), 120)
+        self.assertFalse([name for name in os.listdir(self.root) if name.endswith('.tmp')])
+
+    def test_saves_every_ladder_save_every(self):
+        saved = fragrantica_scraper.LADDER_SAVE_EVERY
+        try:
+            fragrantica_scraper.LADDER_SAVE_EVERY = 3
+            memory = LadderMemory(self.path)
+            memory.record(url(1), 'js')
+            memory.record(url(2), 'js')
+            self.assertFalse(os.path.exists(self.path))
+            memory.record(url(3), 'js')
+            self.assertEqual(len(LadderMemory(self.path).urls), 3)
+        finally:
+            fragrantica_scraper.LADDER_SAVE_EVERY = saved
+
+    def test_wait_plan(self):
+        memory = LadderMemory(self.path)
+        self.assertEqual(memory.wait_plan(url(1)), [0, 3000, MAX_WAIT_MS])
+        for ms in [1200] * WAIT_MIN_SAMPLES:
+            memory.record_wait(url(1), ms)
+        # The first plan of a domain probes half its p50
+        self.assertEqual(memory.wait_plan(url(1)), [500, 1500, MAX_WAIT_MS])
+        self.assertEqual(memory.wait_plan(url(1)), [1500, MAX_WAIT_MS])
+        memory.flush()
+
+
+class ScrapeManyTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.saved_cache = scrape.CACHE
+        scrape.CACHE = ResponseCache(os.path.join(self.root, 'cache'))
+
+    def tearDown(self):
+        scrape.CACHE = self.saved_cache
+        shutil.rmtree(self.root)
+
+    def test_failures_are_refunded(self):
+        budget = CreditBudget(15)
+
+        def fetch(u):
+            if u.endswith('-2.html'):
+                raise OSError('connection reset')
+            return None if u.endswith('-3.html') else 'ok'
+
+        results = dict(scrape_many([url(1), url(2), url(3)], budget=budget, fetch=fetch))
+        self.assertEqual(results, {url(1): 'ok', url(2): None, url(3): None})
+        self.assertEqual(budget.spent, 5)
+
+    def test_budget_runs_out(self):
+        calls = []
+        budget = CreditBudget(10)
+        results = dict(scrape_many([url(n) for n in range(5)], concurrency=1, budget=budget,
+                                   fetch=lambda u: calls.append(u) or 'ok'))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(sum(1 for html in results.values() if html), 2)
+        self.assertEqual(budget.spent, 10)
+
+    def test_plain_requests_cost_one_credit(self):
+        budget = CreditBudget(3)
+        results = dict(scrape_many([url(n) for n in range(5)], budget=budget, render_js=False,
+                                   fetch=lambda u: 'ok'))
+        self.assertEqual(sum(1 for html in results.values() if html), 3)
+
+    def test_cache_hits_are_free(self):
+        scrape.CACHE.put(cache_key(url(1)), '<html>cached</html>')
+        # A miss with no budget left is skipped instead of reaching the API
+        results = dict(scrape_many([url(1), url(2)], budget=0))
+        self.assertEqual(results, {url(1): '<html>cached</html>', url(2): None})
+
+    def test_cache_hits_to_files(self):
+        scrape.CACHE.put(cache_key(url(1)), '<html>cached</html>')
+        out_dir = os.path.join(self.root, 'out')
+        (u, path), = scrape_many([url(1)], budget=0, out_dir=out_dir)
+        with open(path) as f:
+            self.assertEqual(f.read(), '<html>cached</html>')
+
+    def test_per_host_limit(self):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+        gate = threading.Event()
+
+        def fetch(u):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            gate.wait(0.05)
+            with lock:
+                active[0] -= 1
+            return 'ok'
+
+        list(scrape_many([url(n) for n in range(8)], concurrency=8, per_host=2, fetch=fetch))
+        self.assertEqual(peak[0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()